@@ -0,0 +1,14 @@
+"""Synthetic catalog of USGS historical topo maps for benchmarks
+
+The catalog factory and legacy implementations are shared with the tests.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'test'))
+
+from conftest import make_catalog  # noqa: E402,F401
+from legacy import legacy_optimize_assets  # noqa: E402,F401
+
+# Contiguous United States
+CONUS_BOUNDS = [-125, 24.5, -66.5, 49.5]
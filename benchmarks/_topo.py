@@ -0,0 +1,47 @@
+"""Synthetic USGS historical topo map for benchmarks"""
+import os
+import tempfile
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_bounds
+
+# 7.5 minute quad near Yosemite Valley
+MAP_BOUNDS = [-119.625, 37.75, -119.5, 37.875]
+COLLAR = [.02, .012, .015, .01]
+FNAME = 'CA_Bench Quad_123456_1950_24000_geo.tif'
+
+
+def make_topo(width: int = 5000, height: int = 6000) -> str:
+    """Write a tiled GeoTIFF with overviews that mimics a USGS topo map"""
+    path = os.path.join(tempfile.mkdtemp(), FNAME)
+
+    wgs_bounds = [
+        MAP_BOUNDS[0] - COLLAR[0], MAP_BOUNDS[1] - COLLAR[1],
+        MAP_BOUNDS[2] + COLLAR[2], MAP_BOUNDS[3] + COLLAR[3]]
+    crs = CRS.from_epsg(32611)
+    bounds = transform_bounds(CRS.from_epsg(4326), crs, *wgs_bounds)
+
+    rows, cols = np.mgrid[0:height, 0:width]
+    data = np.stack([
+        (cols % 256), (rows % 256), ((rows + cols) % 256)]).astype('uint8')
+
+    profile = {
+        'driver': 'GTiff',
+        'width': width,
+        'height': height,
+        'count': 3,
+        'dtype': 'uint8',
+        'crs': crs,
+        'transform': from_bounds(*bounds, width, height),
+        'tiled': True,
+        'blockxsize': 512,
+        'blockysize': 512,
+        'compress': 'deflate'}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data)
+        dst.build_overviews([2, 4, 8, 16])
+
+    return path
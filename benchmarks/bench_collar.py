@@ -0,0 +1,33 @@
+"""Compare GDAL cutline with numpy collar mask for tiles on the map edge"""
+import time
+
+import mercantile
+from rio_tiler.utils import tile_exists
+
+from _topo import MAP_BOUNDS, make_topo
+from usgs_topo_tiler.usgs_topo import tile, tile_within
+
+
+def main(zoom: int = 16):
+    path = make_topo()
+    tiles = [
+        t for t in mercantile.tiles(*MAP_BOUNDS, [zoom])
+        if tile_exists(MAP_BOUNDS, t.z, t.x, t.y)
+        and not tile_within(MAP_BOUNDS, t.z, t.x, t.y)]
+    print(f'{len(tiles)} edge tiles at zoom {zoom}')
+
+    for collar_method in ['cutline', 'mask']:
+        # Warm up dataset pool and geometry cache
+        tile(path, *tiles[0], collar_method=collar_method)
+
+        start = time.perf_counter()
+        for t in tiles:
+            tile(path, *t, collar_method=collar_method)
+        elapsed = time.perf_counter() - start
+        print(
+            f'{collar_method:<10}{elapsed:8.2f}s '
+            f'{len(tiles) / elapsed:8.1f} tiles/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Time MosaicJSON creation from a synthetic catalog with several workers"""
+import json
+import os
+import time
+import warnings
+
+from _catalog import make_catalog
+from usgs_topo_tiler.scripts.mosaic_bulk import create_mosaic
+
+# About the size of California
+BOUNDS = [-124, 32.5, -114, 42]
+
+
+def main(quadkey_zoom: int = 11, workers=(1, os.cpu_count())):
+    catalog = make_catalog(BOUNDS)
+    catalog['s3_tif'] = [f'{i}.tif' for i in range(len(catalog))]
+    features = catalog.__geo_interface__['features']
+    print(f'{len(features)} assets, quadkey zoom {quadkey_zoom}')
+
+    outputs = {}
+    for n in sorted(set(workers)):
+        start = time.perf_counter()
+        mosaic = create_mosaic(
+            features,
+            minzoom=quadkey_zoom,
+            maxzoom=quadkey_zoom + 5,
+            workers=n,
+            sort_by=['year', 'scale'],
+            sort_ascending=[False, True])
+        elapsed = time.perf_counter() - start
+        outputs[n] = json.dumps(mosaic.dict(), separators=(',', ':'))
+        print(
+            f'{n:>3} workers {elapsed:8.2f}s '
+            f'{len(mosaic.tiles) / elapsed:8.1f} quadkeys/s')
+
+    assert len(set(outputs.values())) == 1, 'Output differs between workers'
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings('ignore')
+    main()
@@ -0,0 +1,80 @@
+"""Time cold start and tile lookups of the prebuilt mosaics
+
+Each way of loading a mosaic is run in a fresh process, to measure the
+resident memory it adds. Tiles are looked up twice, since a memory-mapped
+index only reads pages and decodes assets on their first lookup.
+"""
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import mercantile
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def run(mode, path, json_path, n_lookups=20000):
+    """Load mosaic and look up tiles, in the current process"""
+    from usgs_topo_tiler.mosaic import get_assets
+    from usgs_topo_tiler.mosaic_index import (
+        load_mosaic_index, resident_memory)
+
+    rss_before = resident_memory()
+    start = time.perf_counter()
+    if mode == 'dict':
+        with gzip.open(path) as f:
+            mosaic = json.loads(f.read())
+    else:
+        mosaic = load_mosaic_index(path)
+    load_time = time.perf_counter() - start
+    rss = (resident_memory() - rss_before) / 2**20
+
+    # Tiles one zoom below quadkeys of the mosaic
+    with gzip.open(json_path) as f:
+        quadkeys = list(json.loads(f.read())['tiles'])
+    random.seed(0)
+    tiles = [
+        mercantile.children(
+            mercantile.quadkey_to_tile(random.choice(quadkeys)))[0]
+        for _ in range(n_lookups)]
+
+    # The second pass is over pages and assets that were already read
+    rates = []
+    for _ in range(2):
+        start = time.perf_counter()
+        for t in tiles:
+            get_assets(mosaic, t.x, t.y, t.z)
+        rates.append(n_lookups / (time.perf_counter() - start))
+
+    print(
+        f'{mode:>7} load {load_time:6.3f}s {rss:7.1f} MB '
+        f'{rates[0]:9.0f} lookups/s, {rates[1]:9.0f} repeated')
+
+
+def main(name='mosaic_high_newest_v1.json.gz'):
+    from usgs_topo_tiler.mosaic_index import write_mosaic_index
+
+    path = os.path.join(DATA_DIR, name)
+    print(name)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with gzip.open(path) as f:
+            write_mosaic_index(tmpdir, json.load(f))
+
+        for mode, mode_path in [('dict', path), ('index', path),
+                                ('binary', tmpdir)]:
+            subprocess.run([sys.executable, __file__, mode, mode_path, path],
+                           check=True)
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings('ignore')
+    if len(sys.argv) == 4:
+        run(*sys.argv[1:])
+    else:
+        main()
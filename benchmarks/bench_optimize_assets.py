@@ -0,0 +1,51 @@
+"""Compare optimize_assets with the 0.2.0 implementation on a CONUS catalog"""
+import time
+import warnings
+
+import mercantile
+import numpy as np
+from shapely.geometry import box
+
+from _catalog import CONUS_BOUNDS, legacy_optimize_assets, make_catalog
+from usgs_topo_tiler.scripts.mosaic_bulk import optimize_assets
+
+SORT_BY = ['year', 'scale']
+SORT_ASCENDING = [False, True]
+
+
+def candidates(catalog, tile):
+    """Assets passed to optimize_assets by mosaic_bulk.asset_filter"""
+    idx = catalog.sindex.query(box(*mercantile.bounds(tile)), 'intersects')
+    gdf = catalog.iloc[np.sort(idx)]
+    gdf = gdf.sort_values(SORT_BY, ascending=SORT_ASCENDING)
+    return gdf.groupby('cell_id').head(1)
+
+
+def main(zoom: int = 11, n_tiles: int = 2000, seed: int = 0):
+    catalog = make_catalog(CONUS_BOUNDS)
+    tiles = list(mercantile.tiles(*CONUS_BOUNDS, [zoom]))
+    rng = np.random.default_rng(seed)
+    sample = [tiles[i] for i in rng.choice(len(tiles), n_tiles, replace=False)]
+    inputs = [(t, candidates(catalog, t)) for t in sample]
+    print(
+        f'{len(catalog)} assets, {len(tiles)} tiles at zoom {zoom}, '
+        f'timing {n_tiles} tiles')
+
+    results = {}
+    for name, func in [('legacy', legacy_optimize_assets),
+                       ('optimized', optimize_assets)]:
+        start = time.perf_counter()
+        results[name] = [
+            list(func(t, gdf.copy(), SORT_BY, SORT_ASCENDING).index)
+            for t, gdf in inputs]
+        elapsed = time.perf_counter() - start
+        print(
+            f'{name:<10}{elapsed:8.2f}s {n_tiles / elapsed:8.1f} tiles/s, '
+            f'~{elapsed / n_tiles * len(tiles) / 60:.1f} min for all tiles')
+
+    assert results['legacy'] == results['optimized'], 'Asset order differs'
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings('ignore')
+    main()
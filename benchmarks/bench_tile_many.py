@@ -0,0 +1,36 @@
+"""Compare looping over tile() with tile_many() for one asset"""
+import time
+
+import mercantile
+
+from _topo import MAP_BOUNDS, make_topo
+from usgs_topo_tiler.usgs_topo import tile, tile_many
+
+
+def main(zoom: int = 15):
+    path = make_topo()
+    tiles = list(mercantile.tiles(*MAP_BOUNDS, [zoom]))
+    print(f'{len(tiles)} tiles at zoom {zoom}')
+
+    start = time.perf_counter()
+    for t in tiles:
+        tile(path, *t, pool=None, geometry_cache=None)
+    uncached = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for t in tiles:
+        tile(path, *t)
+    pooled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in tile_many(path, tiles):
+        pass
+    batched = time.perf_counter() - start
+
+    for name, elapsed in [('tile(), no pool or cache', uncached),
+                          ('tile(), pooled', pooled), ('tile_many()', batched)]:
+        print(f'{name:<26}{elapsed:8.2f}s {len(tiles) / elapsed:8.1f} tiles/s')
+
+
+if __name__ == '__main__':
+    main()
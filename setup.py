@@ -6,12 +6,12 @@ with open("README.md") as f:
     readme = f.read()
 
 # Runtime requirements.
-inst_reqs = ["numpy", "rasterio", "rio-tiler>=2.0a6"]
+inst_reqs = ["mercantile", "numpy", "rasterio", "rio-tiler>=2.0a6"]
 
 extra_reqs = {
     "cli": [
         "boto3", "click", "cogeo_mosaic", "geopandas", "mercantile", "pandas",
-        "python-dateutil", "requests", "shapely"]}
+        "pyarrow", "pygeos", "python-dateutil", "requests", "shapely"]}
 
 setup(
     name="usgs-topo-tiler",
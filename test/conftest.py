@@ -0,0 +1,138 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_bounds
+from shapely.geometry import box
+
+# 7.5 minute quad near Yosemite Valley
+MAP_BOUNDS = [-119.625, 37.75, -119.5, 37.875]
+# Collar around the map in degrees
+COLLAR = [.02, .012, .015, .01]
+FNAME = 'CA_Test Quad_123456_1950_24000_geo.tif'
+
+
+@pytest.fixture
+def map_bounds():
+    return list(MAP_BOUNDS)
+
+
+@pytest.fixture(scope='session')
+def topo_path(tmp_path_factory):
+    """Local GeoTIFF that mimics a USGS historical topo map with a collar"""
+    path = tmp_path_factory.mktemp('topo') / FNAME
+
+    wgs_bounds = [
+        MAP_BOUNDS[0] - COLLAR[0], MAP_BOUNDS[1] - COLLAR[1],
+        MAP_BOUNDS[2] + COLLAR[2], MAP_BOUNDS[3] + COLLAR[3]]
+    crs = CRS.from_epsg(32611)
+    bounds = transform_bounds(CRS.from_epsg(4326), crs, *wgs_bounds)
+
+    width, height = 640, 720
+    transform = from_bounds(*bounds, width, height)
+    rows, cols = np.mgrid[0:height, 0:width]
+    data = np.stack([
+        (cols % 256), (rows % 256), ((rows + cols) % 256)]).astype('uint8')
+
+    profile = {
+        'driver': 'GTiff',
+        'width': width,
+        'height': height,
+        'count': 3,
+        'dtype': 'uint8',
+        'crs': crs,
+        'transform': transform,
+        'tiled': True,
+        'blockxsize': 256,
+        'blockysize': 256}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data)
+
+    return str(path)
+
+
+def make_catalog(bounds, seed=0):
+    """Synthetic catalog of USGS historical topo maps
+
+    Grid of 7.5 and 15 minute quads over bounds, each with 1-3 editions.
+    About 20% of cells have no map at each scale, and 5% of editions have no
+    year, like in the bulk metadata. Also used by the benchmarks.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    n_cells = 0
+    for scale, size in [(24000, .125), (62500, .25)]:
+        minx, miny = np.meshgrid(
+            np.arange(bounds[0], bounds[2], size),
+            np.arange(bounds[1], bounds[3], size))
+        minx, miny = minx.ravel(), miny.ravel()
+        cell_id = np.arange(len(minx)) + n_cells
+        n_cells += len(minx)
+
+        exists = rng.random(len(minx)) >= .2
+        n_editions = rng.integers(1, 4, size=len(minx)) * exists
+        idx = np.repeat(np.arange(len(minx)), n_editions)
+        years = np.arange(1890, 1990, 5)
+        year = rng.choice(years, size=len(idx)).astype(float)
+
+        frames.append(
+            gpd.GeoDataFrame({
+                'scale': scale,
+                'year': year,
+                'cell_id': cell_id[idx],
+                'geometry': [
+                    box(x, y, x + size, y + size)
+                    for x, y in zip(minx[idx], miny[idx])]}))
+
+    gdf = gpd.GeoDataFrame(
+        pd.concat(frames, ignore_index=True), geometry='geometry')
+    gdf = gdf.drop_duplicates(['cell_id', 'year']).reset_index(drop=True)
+    gdf.loc[rng.random(len(gdf)) < .05, 'year'] = np.nan
+    return gdf
+
+
+def make_bulk_metadata(bounds, seed=0):
+    """DataFrame in the format of the USGS bulk metadata CSV
+
+    Maps of `make_catalog`, where a missing year is a missing Imprint Year.
+    """
+    catalog = make_catalog(bounds, seed=seed)
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i, (scale, year, cell_id, geom) in enumerate(catalog.itertuples(
+            index=False)):
+        minx, miny, maxx, maxy = geom.bounds
+        date_on_map = int(year) if year == year else 1900 + 5 * (i % 20)
+        map_id = 100000 + i
+        fname = f'CA_Quad {map_id}_{map_id}_{date_on_map}_{scale}_geo'
+        rows.append({
+            'Series': 'HTMC',
+            'Map Name': f'Quad {map_id}',
+            'Cell ID': cell_id + 1,
+            'Scale': scale,
+            'Imprint Year': year,
+            'Date On Map': date_on_map,
+            'Woodland Tint': rng.choice(['Y', 'N']),
+            'Orthophoto': None,
+            'Scanner Resolution': 600 if scale == 24000 else 400,
+            'W Long': minx,
+            'S Lat': miny,
+            'E Long': maxx,
+            'N Lat': maxy,
+            'Download Product S3': (
+                'https://prd-tnm.s3.amazonaws.com/StagedProducts/Maps/'
+                f'HistoricalTopo/PDF/CA/{scale}/'
+                f'{fname.replace(" ", "%20")}.pdf')})
+
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture(scope='session')
+def bulk_meta_path(tmp_path_factory):
+    """CSV of bulk metadata for a small region"""
+    path = tmp_path_factory.mktemp('bulk') / 'topomaps_all.csv'
+    make_bulk_metadata([-120, 37, -119, 37.75]).to_csv(path, index=False)
+    return str(path)
@@ -0,0 +1,88 @@
+"""Implementations as of 0.2.0, to check that newer versions match them
+
+Also used by the benchmarks.
+"""
+import json
+
+import geopandas as gpd
+import mercantile
+import requests
+from dateutil.parser import parse as date_parse
+from shapely.geometry import asShape, box, mapping
+
+
+def legacy_optimize_assets(tile, gdf, sort_by, sort_ascending):
+    """optimize_assets as of 0.2.0, with a pandas sort per step"""
+    final_assets = []
+    tile_geom = asShape(mercantile.feature(tile)['geometry'])
+
+    sort_by = sort_by.copy()
+    sort_ascending = sort_ascending.copy()
+
+    if 'int_pct' not in sort_by:
+        sort_by.append('int_pct')
+        sort_ascending.append(False)
+
+    while True:
+        gdf['int_pct'] = gdf.geometry.intersection(
+            tile_geom).area / tile_geom.area
+        gdf = gdf[gdf['int_pct'] > 0]
+        if len(gdf) == 0:
+            break
+
+        gdf = gdf.sort_values(sort_by, ascending=sort_ascending)
+        top_asset = gdf.iloc[0]
+        gdf = gdf.iloc[1:]
+        final_assets.append(top_asset)
+
+        tile_geom = tile_geom.difference(top_asset.geometry)
+        if tile_geom.area - 1e-4 < 0:
+            break
+
+        if len(gdf) == 0:
+            break
+
+    return gpd.GeoDataFrame(final_assets)
+
+
+def legacy_asset_filter(tile, intersect_dataset, intersect_geoms, **kwargs):
+    """asset_filter as of 0.2.0, scanning all features per quad"""
+    preference = kwargs.get('preference', 'latest')
+    check_exists = kwargs.get('check_exists', False)
+
+    quad_coords_set = {f['geometry']['coordinates'] for f in intersect_dataset}
+    result_dataset = []
+    for quad_coords in quad_coords_set:
+        quad_features = [
+            f for f in intersect_dataset
+            if f['geometry']['coordinates'] == quad_coords]
+
+        quad_features = sorted(
+            quad_features,
+            key=lambda x: x['properties']['publicationDate'],
+            reverse=preference == 'latest')
+
+        if check_exists:
+            for item in quad_features:
+                r = requests.head(item['properties']['downloadURL'])
+                if r.status_code == 200:
+                    break
+        else:
+            item = quad_features[0]
+
+        result_dataset.append(item)
+
+    return result_dataset
+
+
+def legacy_load_features(file):
+    """load_features as of 0.2.0, keeping every record and field"""
+    features = []
+    for line in file:
+        record = json.loads(line)
+        record['publicationDate'] = date_parse(record['publicationDate'])
+        bbox = record['boundingBox']
+        geom = box(bbox['minX'], bbox['minY'], bbox['maxX'], bbox['maxY'])
+        features.append({'properties': record, 'geometry': mapping(geom)})
+
+    return features
@@ -0,0 +1,112 @@
+import asyncio
+import gc
+import threading
+import time
+
+import mercantile
+import numpy as np
+
+from usgs_topo_tiler.aio import AsyncTiler
+
+TILE = mercantile.Tile(2748, 6330, 14)
+
+
+class SlowTiler:
+    """Blocking tiler that records how many calls run at the same time"""
+    def __init__(self, delay=.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.calls = []
+
+    def __call__(self, asset, x, y, z, tilesize=256, **kwargs):
+        with self.lock:
+            self.calls.append(asset)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+
+        data = np.full((3, tilesize, tilesize), len(asset), dtype='uint8')
+        mask = np.full((tilesize, tilesize), 255, dtype='uint8')
+        return data, mask
+
+
+def test_concurrency_limit():
+    slow = SlowTiler()
+
+    async def main():
+        async with AsyncTiler(max_concurrency=2) as tiler:
+            return await asyncio.gather(
+                *[tiler.run(slow, str(i), *TILE) for i in range(6)])
+
+    results = asyncio.run(main())
+    assert len(results) == 6
+    assert slow.max_running == 2
+
+
+def test_cancel_before_start():
+    slow = SlowTiler(delay=.2)
+
+    async def main():
+        async with AsyncTiler(max_concurrency=1) as tiler:
+            first = asyncio.ensure_future(tiler.run(slow, 'a', *TILE))
+            second = asyncio.ensure_future(tiler.run(slow, 'b', *TILE))
+            await asyncio.sleep(.05)
+            second.cancel()
+            await first
+
+    asyncio.run(main())
+    assert slow.calls == ['a']
+
+
+def test_mosaic_tile_early_exit():
+    slow = SlowTiler()
+    quadkey = mercantile.quadkey(TILE)[:12]
+    mosaic = {
+        'minzoom': 10,
+        'quadkey_zoom': 12,
+        'tiles': {quadkey: ['a', 'bb', 'ccc']}}
+
+    async def main():
+        async with AsyncTiler(max_concurrency=1) as tiler:
+            return await tiler.mosaic_tile(mosaic, *TILE, tiler=slow)
+
+    data, mask = asyncio.run(main())
+    assert (data == 1).all()
+    assert (mask == 255).all()
+    # The next read may have been started before the first result was handled
+    assert 'ccc' not in slow.calls
+
+
+def test_mosaic_tile_retrieves_unused_errors():
+    slow = SlowTiler(delay=.2)
+
+    def tiler(asset, *args, **kwargs):
+        if asset == 'bb':
+            raise RuntimeError('Read failed')
+        return slow(asset, *args, **kwargs)
+
+    quadkey = mercantile.quadkey(TILE)[:12]
+    mosaic = {
+        'minzoom': 10,
+        'quadkey_zoom': 12,
+        'tiles': {quadkey: ['a', 'bb']}}
+    errors = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context))
+        async with AsyncTiler(max_concurrency=2) as tiler_:
+            result = await tiler_.mosaic_tile(mosaic, *TILE, tiler=tiler)
+
+        # Failed read finished before the tile was filled, but wasn't used
+        gc.collect()
+        return result
+
+    data, mask = asyncio.run(main())
+    assert (data == 1).all()
+    assert errors == []
@@ -0,0 +1,73 @@
+import numpy as np
+
+from usgs_topo_tiler.extent import (
+    SCALE_DEGREE_OFFSET_XW, estimate_extent, estimate_extent_batch,
+    parse_url)
+
+BASE_URL = ('https://prd-tnm.s3.amazonaws.com/StagedProducts/Maps/'
+            'HistoricalTopo/GeoTIFF')
+
+# (state, map name, scale)
+MAPS = [(
+    'CA', 'Test Quad', scale) for scale in SCALE_DEGREE_OFFSET_XW] + [
+        ('AK', 'Talkeetna D-1', 63360),
+        ('AK', 'Port Alexander A-1', 63360),
+        ('MN', 'Duluth', 63360),
+        ('CA', 'Big Bar and Vicinity', 250000),
+        ('AK', 'Nome', 250000),
+        ('CA', 'Santa Cruz', 250000),
+        ('WA', 'Vancouver', 250000),
+        ('OR', 'Salem', 250000),
+        ('SC', 'Georgetown', 250000),
+        ('RI', 'Providence', 250000)]
+
+
+def random_cases(n_per_map=50, seed=0):
+    """Random image bounds for each map, with urls"""
+    rng = np.random.default_rng(seed)
+    urls = []
+    bounds = []
+    for i, (state, map_name, scale) in enumerate(MAPS):
+        for j in range(n_per_map):
+            name = f'{state}_{map_name}_{i}{j}_1950_{scale}_geo.tif'
+            urls.append(f'{BASE_URL}/{state}/{name}')
+
+            minx = rng.uniform(-179, -60)
+            miny = rng.uniform(15, 71)
+            width, height = rng.uniform(.05, 1.5, size=2)
+            bounds.append([minx, miny, minx + width, miny + height])
+
+    return urls, np.array(bounds)
+
+
+def test_estimate_extent_batch_matches_scalar():
+    urls, bounds = random_cases()
+    metas = [parse_url(url) for url in urls]
+
+    result = estimate_extent_batch(
+        bounds, [m['scale'] for m in metas], [m['state'] for m in metas],
+        [m['map_name'] for m in metas])
+    expected = [estimate_extent(b, url) for b, url in zip(bounds, urls)]
+
+    assert result.shape == (len(urls), 4)
+    np.testing.assert_array_equal(result, np.array(expected))
+
+
+def test_estimate_extent_batch_normalizes_names():
+    bounds = [[-122.3, 36.4, -121.4, 37.6]] * 2
+    result = estimate_extent_batch(
+        bounds, [250000, 250000], ['CA', 'ca'], ['Santa Cruz', 'santacruz'])
+    expected = estimate_extent(
+        bounds[0], f'{BASE_URL}/CA/CA_Santa%20Cruz_1_1950_250000_geo.tif')
+
+    np.testing.assert_array_equal(result, [expected, expected])
+
+
+def test_estimate_extent_batch_unknown_scale():
+    bounds = [[-120.02, 37.99, -119.86, 38.14],
+              [-120.02, 37.99, -119.86, 38.14]]
+    result = estimate_extent_batch(
+        bounds, [24000, 12345], ['ca', 'ca'], ['a', 'b'])
+
+    assert not np.isnan(result[0]).any()
+    assert np.isnan(result[1]).all()
@@ -0,0 +1,50 @@
+import pytest
+import rasterio
+
+from usgs_topo_tiler.geometry import (
+    AssetGeometry, AssetGeometryCache, get_asset_geometry)
+
+
+def test_get_asset_geometry(topo_path, map_bounds):
+    with rasterio.open(topo_path) as src_dst:
+        geometry = get_asset_geometry(src_dst, topo_path)
+
+    assert geometry.map_bounds == pytest.approx(map_bounds)
+    assert geometry.image_wgs_bounds[0] < map_bounds[0]
+    assert geometry.image_wgs_bounds[3] > map_bounds[3]
+    assert geometry.cutline.startswith('POLYGON')
+
+
+def test_cache_lookup(topo_path):
+    cache = AssetGeometryCache()
+    with rasterio.open(topo_path) as src_dst:
+        first = cache.get_or_compute(src_dst, topo_path)
+        second = cache.get_or_compute(src_dst, topo_path)
+
+    assert first is second
+    assert cache.stats.snapshot() == {'hits': 1, 'misses': 1, 'evictions': 0}
+
+    # Explicit map bounds are part of the key
+    assert cache.get(topo_path, first.map_bounds) is None
+
+
+def test_cache_eviction():
+    cache = AssetGeometryCache(maxsize=2)
+    geometry = AssetGeometry([0, 0, 1, 1], [0, 0, 1, 1], 'POLYGON EMPTY')
+    for address in ['a', 'b', 'c']:
+        cache.set(address, None, geometry)
+
+    assert len(cache) == 2
+    assert cache.get('a') is None
+    assert cache.get('c') == geometry
+    assert cache.stats['evictions'] == 1
+
+
+def test_cache_persistent(tmp_path):
+    path = str(tmp_path / 'geometry.db')
+    geometry = AssetGeometry([0, 0, 1, 1], [.1, .1, .9, .9], 'POLYGON EMPTY')
+    AssetGeometryCache(path=path).set('a', None, geometry)
+
+    cache = AssetGeometryCache(path=path)
+    assert cache.get('a') == geometry
+    assert len(cache) == 1
@@ -0,0 +1,94 @@
+import mercantile
+import numpy as np
+import rasterio
+from click.testing import CliRunner
+
+from usgs_topo_tiler.geometry import get_asset_geometry
+from usgs_topo_tiler.header_index import (
+    HeaderIndex, address_to_key, read_header, write_header_index)
+from usgs_topo_tiler.pool import DatasetPool
+from usgs_topo_tiler.scripts.index import index
+from usgs_topo_tiler.usgs_topo import tile
+
+
+def failing_opener(address):
+    raise AssertionError(f'{address} should not be opened')
+
+
+def test_address_to_key():
+    key = (
+        'StagedProducts/Maps/HistoricalTopo/GeoTIFF/CA/'
+        'CA_Test Quad_1_1950_24000_geo.tif')
+    assert address_to_key(f's3://prd-tnm/{key}') == key
+    assert address_to_key(
+        'https://prd-tnm.s3.amazonaws.com/' + key.replace(' ', '%20')) == key
+    assert address_to_key('/tmp/file.tif') == '/tmp/file.tif'
+
+
+def test_header_index_roundtrip(tmp_path, topo_path):
+    with rasterio.open(topo_path) as src_dst:
+        header = read_header(src_dst, topo_path)
+        geometry = get_asset_geometry(src_dst, topo_path)
+
+    other = header._replace(key='a/b.tif', map_bounds=[np.nan] * 4)
+    write_header_index(str(tmp_path), [header, other])
+
+    header_index = HeaderIndex(str(tmp_path))
+    assert len(header_index) == 2
+    assert header_index.keys().tolist() == sorted(['a/b.tif', topo_path])
+    assert topo_path in header_index
+    assert 'a/c.tif' not in header_index
+    assert header_index.get('a/c.tif') is None
+
+    loaded = header_index.get(topo_path)
+    assert loaded.crs == header.crs
+    assert loaded.transform == header.transform
+    assert loaded.bounds == header.bounds
+    assert (loaded.width, loaded.height) == (640, 720)
+    assert loaded.overviews == header.overviews
+    assert loaded.geometry() == geometry
+
+
+def test_index_cli(tmp_path, topo_path):
+    list_path = tmp_path / 'list.txt'
+    list_path.write_text(f'{topo_path}\n/does/not/exist.tif\n')
+    out = tmp_path / 'index'
+
+    result = CliRunner().invoke(
+        index, [
+            '--s3-list-path', str(list_path), '-o', str(out), '--url-prefix',
+            ''])
+
+    assert result.exit_code == 0, result.output
+    assert HeaderIndex(str(out)).keys().tolist() == [topo_path]
+
+
+def test_tile_uses_header_index(tmp_path, topo_path, map_bounds):
+    with rasterio.open(topo_path) as src_dst:
+        write_header_index(str(tmp_path), [read_header(src_dst, topo_path)])
+    header_index = HeaderIndex(str(tmp_path))
+    pool = DatasetPool(opener=failing_opener)
+
+    # Tile in the collar is skipped without opening the file
+    collar_tile = mercantile.tile(map_bounds[0] - .01, map_bounds[1] + .05, 16)
+    _, mask = tile(
+        topo_path,
+        *collar_tile,
+        pool=pool,
+        geometry_cache=None,
+        header_index=header_index)
+    assert not mask.any()
+
+    center = mercantile.tile(
+        (map_bounds[0] + map_bounds[2]) / 2,
+        (map_bounds[1] + map_bounds[3]) / 2, 14)
+    data, _ = tile(
+        topo_path,
+        center.x,
+        center.y,
+        center.z,
+        geometry_cache=None,
+        header_index=header_index)
+    expected, _ = tile(
+        topo_path, center.x, center.y, center.z, geometry_cache=None)
+    assert (data == expected).all()
@@ -0,0 +1,93 @@
+import sys
+
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from usgs_topo_tiler.scripts.ingest import ingest
+from usgs_topo_tiler.scripts.mosaic_bulk import (
+    construct_s3_tif_url, mosaic_bulk, read_cache)
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture(scope='module')
+def s3_list_path(tmp_path_factory, bulk_meta_path):
+    """Listing of S3 files, missing every seventh file in the metadata"""
+    df = pd.read_csv(bulk_meta_path)
+    keys = construct_s3_tif_url(df['Download Product S3'])
+    path = tmp_path_factory.mktemp('s3') / 'geotiff_files.txt'
+    path.write_text('\n'.join(keys[keys.index % 7 != 0]) + '\n')
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def cache_path(tmp_path_factory, bulk_meta_path, s3_list_path):
+    path = str(tmp_path_factory.mktemp('cache') / 'topomaps.parquet')
+    result = CliRunner().invoke(
+        ingest, [
+            '--meta-path', bulk_meta_path, '--s3-list-path', s3_list_path,
+            '-o', path, '--row-group-size', '20'])
+    assert result.exit_code == 0, result.output
+    return path
+
+
+def test_read_cache(cache_path):
+    df = read_cache(cache_path)
+    assert len(df) > 0
+    assert list(df.columns) == [
+        'scale', 'year', 's3_tif', 'cell_id', 'scanner_resolution', 'w_long',
+        's_lat', 'e_long', 'n_lat']
+
+    bounds = [-119.6, 37.2, -119.4, 37.4]
+    df = read_cache(cache_path, min_scale=62500, max_year=1950, bounds=bounds)
+    assert len(df) > 0
+    assert (df['scale'] >= 62500).all()
+    assert (df['year'] <= 1950).all()
+    assert (df['w_long'] <= bounds[2]).all()
+    assert (df['n_lat'] >= bounds[1]).all()
+
+
+@pytest.mark.parametrize(
+    'args', [
+        [],
+        ['--max-scale', '24000', '--min-year', '1920'],
+        ['--bounds', '-119.6,37.2,-119.4,37.4', '--woodland-tint']])
+def test_mosaic_bulk_from_cache(bulk_meta_path, s3_list_path, cache_path, args):
+    args = ['--quadkey-zoom', '10', *args]
+    expected = CliRunner().invoke(
+        mosaic_bulk, [
+            '--meta-path', bulk_meta_path, '--s3-list-path', s3_list_path,
+            *args])
+    result = CliRunner().invoke(
+        mosaic_bulk, ['--cache-path', cache_path, *args])
+
+    assert expected.exit_code == 0, expected.output
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes == expected.stdout_bytes
+
+
+@pytest.mark.parametrize(
+    'args', [
+        [],
+        ['--sort-preference', 'closest-to-year', '--closest-to-year', '1940'],
+        ['--bounds', '-119.6,37.2,-119.4,37.4', '--workers', '2']])
+def test_mosaic_bulk_from_cache_memory_budget(
+        monkeypatch, tmp_path, cache_path, args):
+    args = ['--cache-path', cache_path, '--quadkey-zoom', '11', *args]
+    expected = CliRunner().invoke(
+        mosaic_bulk, [*args, '--inputs-out',
+                      str(tmp_path / 'expected.json')])
+    assert expected.exit_code == 0, expected.output
+
+    # Cache is read in many batches
+    module = sys.modules[mosaic_bulk.callback.__module__]
+    monkeypatch.setattr(module, 'CACHE_BATCH_SIZE', 50)
+    result = CliRunner().invoke(
+        mosaic_bulk, [
+            *args, '--memory-budget', '.2', '--inputs-out',
+            str(tmp_path / 'result.json')])
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes == expected.stdout_bytes
+    assert (tmp_path / 'result.json').read_text() == (
+        tmp_path / 'expected.json').read_text()
@@ -0,0 +1,127 @@
+import gzip
+
+import boto3
+import pytest
+from click.testing import CliRunner
+
+from usgs_topo_tiler.scripts.list_s3 import (
+    list_s3, read_s3_list, read_snapshot)
+
+moto = pytest.importorskip('moto')
+
+PREFIX = 'StagedProducts/Maps/HistoricalTopo/GeoTIFF/'
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """Bucket with files in state directories and at the top of the prefix"""
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+
+    with moto.mock_aws():
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket='prd-tnm')
+        keys = ['Other/a.tif', f'{PREFIX}AK.tif', f'{PREFIX}AK0.tif']
+        for state in ['AK', 'AL', 'CA', 'WY']:
+            for i in range(5):
+                keys.append(f'{PREFIX}{state}/{i}/{state}_{i}.tif')
+                keys.append(f'{PREFIX}{state}/{i}/{state}_{i}.xml')
+
+        for key in keys:
+            s3.put_object(Bucket='prd-tnm', Key=key, Body=key.encode())
+
+        yield s3
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_list_s3(bucket, workers):
+    result = CliRunner().invoke(list_s3, ['--workers', str(workers)])
+    assert result.exit_code == 0, result.output
+
+    # Same order as S3 returns keys of a single listing
+    expected = [
+        obj['Key'] for obj in bucket.list_objects_v2(
+            Bucket='prd-tnm', Prefix=PREFIX)['Contents']
+        if obj['Key'].endswith('.tif')]
+    assert len(expected) == 22
+    assert result.stdout.splitlines() == expected
+
+
+def test_list_s3_details(bucket, tmp_path):
+    path = tmp_path / 'geotiff_files.txt.gz'
+    args = ['--workers', '4', '--details', '-o', str(path)]
+    result = CliRunner().invoke(list_s3, args)
+    assert result.exit_code == 0, result.output
+
+    keys = read_s3_list(path)
+    assert keys == CliRunner().invoke(list_s3).stdout.splitlines()
+
+    with gzip.open(path, 'rt') as f:
+        key, size, etag = f.readline().rstrip('\n').split('\t')
+
+    head = bucket.head_object(Bucket='prd-tnm', Key=key)
+    assert int(size) == head['ContentLength'] == len(key)
+    assert etag == head['ETag'].strip('"')
+
+
+def test_list_s3_diff(bucket, tmp_path):
+    snapshot = str(tmp_path / 'snapshot.txt.gz')
+    result = CliRunner().invoke(list_s3, ['--snapshot', snapshot])
+    assert result.exit_code == 0, result.output
+    assert read_s3_list(snapshot) == result.stdout.splitlines()
+
+    bucket.put_object(Bucket='prd-tnm', Key=f'{PREFIX}CO/0/CO_0.tif')
+    bucket.delete_object(Bucket='prd-tnm', Key=f'{PREFIX}AK.tif')
+    bucket.put_object(
+        Bucket='prd-tnm', Key=f'{PREFIX}AL/1/AL_1.tif', Body=b'changed')
+    bucket.put_object(Bucket='prd-tnm', Key=f'{PREFIX}WY/1/WY_1.xml')
+
+    # Snapshot is replaced once the listing is complete
+    args = ['--workers', '4', '--previous', snapshot, '--snapshot', snapshot]
+    result = CliRunner().invoke(list_s3, args)
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == [
+        f'removed\t{PREFIX}AK.tif',
+        f'modified\t{PREFIX}AL/1/AL_1.tif',
+        f'added\t{PREFIX}CO/0/CO_0.tif']
+    assert read_s3_list(snapshot) == CliRunner().invoke(
+        list_s3).stdout.splitlines()
+
+    result = CliRunner().invoke(list_s3, ['--previous', snapshot])
+    assert result.exit_code == 0, result.output
+    assert result.stdout == ''
+
+
+def test_list_s3_diff_details(bucket, tmp_path):
+    snapshot = str(tmp_path / 'snapshot.txt')
+    result = CliRunner().invoke(list_s3, ['--snapshot', snapshot])
+    assert result.exit_code == 0, result.output
+
+    key = f'{PREFIX}AL/1/AL_1.tif'
+    bucket.put_object(Bucket='prd-tnm', Key=key, Body=b'changed')
+    args = ['--previous', snapshot, '--details']
+    result = CliRunner().invoke(list_s3, args)
+    assert result.exit_code == 0, result.output
+
+    etag = bucket.head_object(Bucket='prd-tnm', Key=key)['ETag'].strip('"')
+    assert result.stdout == f'modified\t{key}\t7\t{etag}\n'
+
+
+@pytest.mark.parametrize('details', [False, True])
+def test_list_s3_diff_listing(bucket, tmp_path, details):
+    listing = tmp_path / 'geotiff_files.txt'
+    args = ['-o', str(listing)] + (['--details'] if details else [])
+    result = CliRunner().invoke(list_s3, args)
+    assert result.exit_code == 0, result.output
+
+    with pytest.raises(ValueError, match='Only snapshots written with'):
+        next(read_snapshot(listing))
+
+    # Incomplete snapshot is removed
+    snapshot = tmp_path / 'snapshot.txt'
+    args = ['--previous', str(listing), '--snapshot', str(snapshot)]
+    result = CliRunner().invoke(list_s3, args)
+    assert isinstance(result.exception, ValueError)
+    assert not snapshot.exists()
+    assert not (tmp_path / 'snapshot.txt.tmp').exists()
@@ -0,0 +1,115 @@
+import http.server
+import json
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from click.testing import CliRunner
+
+from usgs_topo_tiler.scripts.metadata import metadata
+
+TOTAL = 4500
+
+
+@pytest.fixture
+def api_server():
+    """Stand-in for the TNM Access API
+
+    Responds with an error to requests for offsets in `failures`, as many
+    times as the value for that offset.
+    """
+    items = [{'title': f'Map {i}', 'downloadURL': f'{i}.tif'}
+             for i in range(TOTAL)]
+    failures = {}
+    requested = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            offset = int(query.get('offset', [0])[0])
+            limit = int(query['max'][0])
+            requested.append(offset)
+
+            if failures.get(offset, 0) > 0:
+                failures[offset] -= 1
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            body = json.dumps({
+                'total': TOTAL,
+                'items': items[offset:offset + limit]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}/api/products'
+    yield url, items, failures, requested
+    server.shutdown()
+
+
+def _items(output):
+    return [json.loads(line) for line in output.splitlines()]
+
+
+def test_metadata_retries(api_server):
+    url, items, failures, requested = api_server
+    failures.update({1000: 2, 3000: 1})
+
+    args = ['--url', url, '--threads', '3', '--backoff', '0']
+    result = CliRunner().invoke(metadata, args)
+    assert result.exit_code == 0, result.output
+
+    # Pages are written in order
+    assert _items(result.stdout) == items
+    assert sorted(requested[1:]) == [
+        0, 1000, 1000, 1000, 2000, 3000, 3000, 4000]
+
+
+def test_metadata_resume(api_server, tmp_path):
+    url, items, failures, requested = api_server
+    checkpoint = tmp_path / 'checkpoint.json'
+    output = tmp_path / 'metadata.json'
+    failures[2000] = 10
+
+    args = [
+        '--url', url, '--threads', '2', '--backoff', '0', '-o',
+        str(output), '--checkpoint',
+        str(checkpoint)]
+    result = CliRunner().invoke(metadata, [*args, '--retries', '1'])
+    assert result.exit_code != 0
+    assert json.loads(checkpoint.read_text())['pages'] == 2
+    assert _items(output.read_text()) == items[:2000]
+
+    # Process killed while writing the next page
+    with open(output, 'a') as f:
+        f.write(json.dumps(items[2000]) + '\n{"title": "Map')
+
+    # Resume once the server recovers, without requesting written pages
+    failures.clear()
+    requested.clear()
+    result = CliRunner().invoke(metadata, args)
+    assert result.exit_code == 0, result.output
+    assert _items(output.read_text()) == items
+    assert sorted(requested) == [2000, 3000, 4000]
+
+    # Download is complete
+    result = CliRunner().invoke(metadata, args)
+    assert result.exit_code == 0, result.output
+    assert _items(output.read_text()) == items
+
+    # Checkpoint of other parameters
+    result = CliRunner().invoke(metadata, [*args, '--bbox', '0,0,1,1'])
+    assert 'different download' in str(result.exception)
+
+    # Output can't be resumed on stdout
+    result = CliRunner().invoke(metadata, ['--checkpoint', str(checkpoint)])
+    assert 'requires --output' in str(result.exception)
@@ -0,0 +1,78 @@
+import json
+
+import mercantile
+import numpy as np
+import pytest
+from rio_tiler.errors import TileOutsideBounds
+
+from usgs_topo_tiler.mosaic import get_assets, mosaic_tile
+
+TILE = mercantile.Tile(2748, 6330, 14)
+
+
+def make_mosaic(tiles, quadkey_zoom=12):
+    return {'minzoom': 10, 'quadkey_zoom': quadkey_zoom, 'tiles': tiles}
+
+
+def fake_tiler(fill):
+    """Tiler that fills one half of the tile per asset, and records calls"""
+    calls = []
+
+    def tiler(asset, x, y, z, tilesize=256, **kwargs):
+        calls.append(asset)
+        if fill[asset] is None:
+            raise TileOutsideBounds()
+
+        data = np.full((3, tilesize, tilesize), fill[asset][0], dtype='uint8')
+        mask = np.zeros((tilesize, tilesize), dtype='uint8')
+        mask[fill[asset][1]] = 255
+        return data, mask
+
+    return tiler, calls
+
+
+def test_get_assets():
+    quadkey = mercantile.quadkey(TILE)
+    mosaic = make_mosaic({
+        quadkey[:12]: ['a', 'b'],
+        mercantile.quadkey(mercantile.Tile(0, 0, 12)): ['c']})
+
+    assert get_assets(mosaic, *TILE) == ['a', 'b']
+    assert get_assets(mosaic, *mercantile.parent(TILE, zoom=12)) == ['a', 'b']
+    assert get_assets(mosaic, 0, 0, 11) == ['c']
+    assert get_assets(mosaic, 0, 0, 0) == ['c', 'a', 'b']
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_mosaic_tile_priority(threads):
+    mosaic = make_mosaic({mercantile.quadkey(TILE)[:12]: ['a', 'b', 'c']})
+    top, bottom = np.s_[:128], np.s_[128:]
+    tiler, calls = fake_tiler({'a': (1, top), 'b': (2, np.s_[:]), 'c': None})
+
+    data, mask = mosaic_tile(mosaic, *TILE, threads=threads, tiler=tiler)
+    assert (mask == 255).all()
+    assert (data[:, top] == 1).all()
+    assert (data[:, bottom] == 2).all()
+    if threads == 1:
+        # Tile was filled before the last asset was needed
+        assert calls == ['a', 'b']
+
+
+def test_mosaic_tile_outside():
+    mosaic = make_mosaic({mercantile.quadkey(TILE)[:12]: ['a']})
+    tiler, _ = fake_tiler({'a': None})
+
+    with pytest.raises(TileOutsideBounds):
+        mosaic_tile(mosaic, *TILE, tiler=tiler)
+
+    with pytest.raises(TileOutsideBounds):
+        mosaic_tile(mosaic, 0, 0, 14, tiler=tiler)
+
+
+def test_mosaic_tile_asset(topo_path, map_bounds):
+    asset = json.dumps({'url': topo_path, 'map_bounds': map_bounds})
+    mosaic = make_mosaic({mercantile.quadkey(TILE)[:12]: [asset]})
+
+    data, mask = mosaic_tile(mosaic, *TILE)
+    assert data.shape == (3, 256, 256)
+    assert (mask == 255).all()
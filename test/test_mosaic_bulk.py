@@ -0,0 +1,284 @@
+import json
+from urllib.parse import unquote
+
+import mercantile
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from cogeo_mosaic.mosaic import MosaicJSON
+from pygeos import STRtree, polygons
+from rio_tiler.mercator import zoom_for_pixelsize
+from shapely.geometry import box
+
+from conftest import make_catalog
+from legacy import legacy_optimize_assets
+from usgs_topo_tiler.scripts.mosaic_bulk import (
+    FEATURE_MEMORY_BYTES, _run_asset_filter, asset_filter, assign_quadkeys,
+    construct_geometries, construct_geometry, construct_s3_tif_url,
+    create_mosaic, get_maxzoom, get_partition_zoom, load_metadata, mosaic_bulk,
+    optimize_assets, path_accessor)
+
+
+@pytest.mark.parametrize(
+    'sort_by,sort_ascending', [
+        (['year', 'scale'], [False, True]),
+        (['year', 'scale'], [True, True]),
+        (['scale', 'int_pct', 'year'], [True, False, False])])
+def test_optimize_assets_matches_legacy(sort_by, sort_ascending):
+    catalog = make_catalog([-120, 37, -118.5, 38])
+    n_assets = 0
+    for tile in mercantile.tiles(-120, 37, -118.5, 38, [9]):
+        tile_geom = box(*mercantile.bounds(tile))
+        gdf = catalog[catalog.intersects(tile_geom)]
+        gdf = gdf.sort_values(sort_by[:1], ascending=sort_ascending[:1])
+        gdf = gdf.groupby('cell_id').head(1)
+
+        expected = legacy_optimize_assets(
+            tile, gdf.copy(), sort_by, sort_ascending)
+        result = optimize_assets(tile, gdf.copy(), sort_by, sort_ascending)
+
+        assert list(result.index) == list(expected.index)
+        n_assets += len(result)
+
+    assert n_assets > 0
+
+
+def test_optimize_assets_empty():
+    tile = mercantile.Tile(0, 0, 9)
+    gdf = make_catalog([-120, 37, -119, 38]).iloc[:0]
+    assert len(optimize_assets(tile, gdf, ['year'], [False])) == 0
+
+
+def test_create_mosaic_matches_from_features():
+    catalog = make_catalog([-120, 37, -119, 38])
+    catalog['s3_tif'] = [f'{i}.tif' for i in range(len(catalog))]
+    features = catalog.__geo_interface__['features']
+    kwargs = dict(
+        minzoom=9,
+        maxzoom=14,
+        asset_filter=asset_filter,
+        accessor=path_accessor,
+        sort_by=['year', 'scale'],
+        sort_ascending=[False, True])
+
+    expected = json.dumps(MosaicJSON.from_features(features, **kwargs).dict())
+    assert json.dumps(create_mosaic(features, **kwargs).dict()) == expected
+    assert json.dumps(
+        create_mosaic(features, workers=2, **kwargs).dict()) == expected
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_asset_filter_no_tiles(workers):
+    assert _run_asset_filter(
+        [], [], [], path_accessor, asset_filter, workers, {}) == {}
+
+
+def test_mosaic_bulk_workers(bulk_meta_path):
+    args = ['--meta-path', bulk_meta_path, '--quadkey-zoom', '10']
+    serial = CliRunner().invoke(mosaic_bulk, args)
+    parallel = CliRunner().invoke(mosaic_bulk, [*args, '--workers', '3'])
+
+    assert serial.exit_code == 0, serial.output
+    assert parallel.exit_code == 0, parallel.output
+    assert parallel.stdout_bytes == serial.stdout_bytes
+    assert len(json.loads(serial.stdout)['tiles']) > 0
+
+
+def test_assign_quadkeys_matches_intersects():
+    zoom = 9
+    catalog = make_catalog([-120, 37, -119, 38])
+    bounds = np.array([g.bounds for g in catalog.geometry])
+
+    # Boxes with edges exactly on tile edges or touching a tile corner
+    t = mercantile.tile(-119.5, 37.5, zoom)
+    west, south, east, north = mercantile.bounds(t)
+    bounds = np.concatenate([
+        bounds, [[west, south, east, north], [west - .1, south, west, north],
+                 [east, north, east + .1, north + .1],
+                 [west + .01, south + .01, west + .02, south + .02]]])
+
+    tiles, candidates = assign_quadkeys(bounds, zoom)
+    assigned = dict(zip(tiles, candidates))
+    assert tiles == sorted(tiles, key=lambda t: (t.y, t.x))
+
+    tree = STRtree(polygons([box(*b).exterior.coords for b in bounds]))
+    for tile in mercantile.tiles(-121, 36, -118, 39, [zoom]):
+        tile_geom = polygons(
+            mercantile.feature(tile)['geometry']['coordinates'][0])
+        expected = sorted(tree.query(tile_geom, predicate='intersects'))
+        assert assigned.get(tile, []) == expected
+
+
+@pytest.mark.parametrize('memory_budget', [.005, .1, .2, .5, 1])
+def test_get_partition_zoom(memory_budget):
+    catalog = make_catalog([-120, 37, -118.5, 38])
+    bounds = catalog.geometry.bounds.to_numpy()
+    quadkey_zoom = 12
+
+    # Lowest zoom at which no tile has too many candidates
+    max_features = int(memory_budget * 2**20 / FEATURE_MEMORY_BYTES)
+    expected = quadkey_zoom
+    for zoom in range(quadkey_zoom + 1):
+        _, candidates = assign_quadkeys(bounds, zoom)
+        if max(map(len, candidates)) <= max_features:
+            expected = zoom
+            break
+
+    assert get_partition_zoom(bounds, quadkey_zoom, memory_budget) == expected
+
+
+def test_mosaic_bulk_update(tmp_path, bulk_meta_path):
+    inputs_path = str(tmp_path / 'inputs.json')
+    args = ['--quadkey-zoom', '10', '--sort-preference', 'oldest']
+    result = CliRunner().invoke(
+        mosaic_bulk,
+        ['--meta-path', bulk_meta_path, '--inputs-out', inputs_path, *args])
+    assert result.exit_code == 0, result.output
+    previous_path = tmp_path / 'previous.json'
+    previous_path.write_bytes(result.stdout_bytes)
+
+    # Modify, remove and add maps
+    df = pd.read_csv(bulk_meta_path)
+    df.loc[3, 'Imprint Year'] = 1800
+    df = df.drop(index=10)
+    added = df.iloc[[20]].assign(**{'W Long': -118.875, 'E Long': -118.75})
+    df = pd.concat([df, added])
+    meta_path = str(tmp_path / 'meta.csv')
+    df.to_csv(meta_path, index=False)
+
+    full = CliRunner().invoke(
+        mosaic_bulk, ['--meta-path', meta_path, *args])
+    updated = CliRunner().invoke(
+        mosaic_bulk, [
+            '--meta-path', meta_path, '--update-from',
+            str(previous_path), '--previous-inputs', inputs_path, *args])
+
+    assert updated.exit_code == 0, updated.output
+    assert updated.stdout_bytes == full.stdout_bytes
+    assert updated.stdout_bytes != result.stdout_bytes
+    n_recomputed, n_total = map(int, updated.stderr.split()[1::2][:2])
+    assert 0 < n_recomputed < n_total
+
+    # Different sort preference can't be used for an update
+    other = CliRunner().invoke(
+        mosaic_bulk, [
+            '--meta-path', meta_path, '--update-from',
+            str(previous_path), '--previous-inputs', inputs_path,
+            '--quadkey-zoom', '10'])
+    assert isinstance(other.exception, ValueError)
+
+
+def test_mosaic_bulk_update_unchanged(tmp_path, bulk_meta_path):
+    inputs_path = str(tmp_path / 'inputs.json')
+    args = ['--meta-path', bulk_meta_path, '--quadkey-zoom', '10']
+    result = CliRunner().invoke(
+        mosaic_bulk, [*args, '--inputs-out', inputs_path])
+    assert result.exit_code == 0, result.output
+    previous_path = tmp_path / 'previous.json'
+    previous_path.write_bytes(result.stdout_bytes)
+
+    # Nothing is recomputed, also with a process pool
+    updated = CliRunner().invoke(
+        mosaic_bulk, [
+            *args, '--update-from',
+            str(previous_path), '--previous-inputs', inputs_path,
+            '--workers', '2'])
+    assert updated.exit_code == 0, updated.output
+    assert updated.stdout_bytes == result.stdout_bytes
+    assert updated.stderr.startswith('Recomputing 0 of')
+
+
+def test_prepare_matches_rowwise(bulk_meta_path):
+    df = load_metadata(bulk_meta_path)
+    # Escapes other than spaces
+    df.loc[df.index[:3], 'download_product_s3'] = [
+        x.replace('_', '%5F', 1).replace('.pdf', '%2520.pdf')
+        for x in df['download_product_s3'][:3]]
+
+    # As of 0.2.0, with one Python call per row
+    parts = df['download_product_s3'].apply(unquote).str.split('/')
+    expected = parts.apply(lambda x: '/'.join(x[3:6])) + '/GeoTIFF/'
+    expected += parts.apply(lambda x: x[7]) + '/'
+    expected += parts.apply(lambda x: x[9].replace('.pdf', '.tif'))
+    pd.testing.assert_series_equal(
+        construct_s3_tif_url(df['download_product_s3']), expected)
+
+    geoms = construct_geometries(df)
+    assert geoms.index.equals(df.index)
+    for geom, (_, row) in zip(geoms, df.iterrows()):
+        expected = construct_geometry(row)
+        assert geom.equals_exact(expected, 0)
+        assert geom.wkb == expected.wkb
+
+    scales = np.array(
+        [10000, 20000, 24000, 25000, 31680, 62500, 63360, 125000])
+    dpis = np.array([0, 150, 200, 300, 400, 508, 600, 800])
+    scales, dpis = [x.ravel() for x in np.meshgrid(scales, dpis)]
+    expected = [
+        zoom_for_pixelsize(.0254 / dpi * scale, tilesize=512)
+        for scale, dpi in zip(scales, dpis.astype(float))]
+    assert get_maxzoom(scales, dpis).tolist() == expected
+    assert get_maxzoom(24000, 400) == zoom_for_pixelsize(
+        .0254 / 400 * 24000, tilesize=512)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_mosaic_bulk_memory_budget(tmp_path, bulk_meta_path, workers):
+    args = ['--meta-path', bulk_meta_path, '--quadkey-zoom', '11']
+    inputs_path = tmp_path / 'inputs.json'
+    expected = CliRunner().invoke(
+        mosaic_bulk, [*args, '--inputs-out', str(inputs_path)])
+    assert expected.exit_code == 0, expected.output
+    expected_inputs = inputs_path.read_text()
+
+    # Budget of a few features forces many partitions
+    spill_dir = tmp_path / 'spill'
+    spill_dir.mkdir()
+    result = CliRunner().invoke(
+        mosaic_bulk, [
+            *args, '--memory-budget', '.2', '--spill-dir',
+            str(spill_dir), '--workers',
+            str(workers), '--inputs-out',
+            str(inputs_path)])
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes == expected.stdout_bytes
+    assert inputs_path.read_text() == expected_inputs
+    n_partitions = int(result.stderr.split()[1])
+    assert n_partitions > 1
+    assert list(spill_dir.iterdir()) == []
+
+
+@pytest.mark.parametrize('shard', ['0/3', '1/3'])
+def test_mosaic_bulk_memory_budget_shard(bulk_meta_path, shard):
+    args = [
+        '--meta-path', bulk_meta_path, '--quadkey-zoom', '11', '--shard',
+        shard, '--workers', '2']
+    expected = CliRunner().invoke(mosaic_bulk, args)
+    assert expected.exit_code == 0, expected.output
+
+    # Some partitions have no quadkeys in the shard
+    result = CliRunner().invoke(mosaic_bulk, [*args, '--memory-budget', '.2'])
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes == expected.stdout_bytes
+
+
+def test_mosaic_bulk_update_without_quadkey_zoom(tmp_path, bulk_meta_path):
+    inputs_path = str(tmp_path / 'inputs.json')
+    args = ['--meta-path', bulk_meta_path, '--minzoom', '10']
+    result = CliRunner().invoke(
+        mosaic_bulk, [*args, '--inputs-out', inputs_path])
+    assert result.exit_code == 0, result.output
+
+    # Older mosaics don't have a quadkey zoom, which then is the minzoom
+    previous = json.loads(result.stdout)
+    assert previous.pop('quadkey_zoom') == 10
+    previous_path = tmp_path / 'previous.json'
+    previous_path.write_text(json.dumps(previous))
+
+    updated = CliRunner().invoke(
+        mosaic_bulk, [
+            *args, '--update-from',
+            str(previous_path), '--previous-inputs', inputs_path])
+    assert updated.exit_code == 0, updated.output
+    assert updated.stdout_bytes == result.stdout_bytes
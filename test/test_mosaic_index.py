@@ -0,0 +1,138 @@
+import gzip
+import json
+import os
+import random
+import sys
+
+import mercantile
+import numpy as np
+import pytest
+
+from usgs_topo_tiler.mosaic import get_assets, mosaic_tile
+from usgs_topo_tiler import mosaic_index
+from usgs_topo_tiler.mosaic_index import (
+    MosaicIndex, load_mosaic_index, quadkey_to_int, resident_memory,
+    tile_to_int, write_mosaic_index)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+MOSAIC_PATH = os.path.join(DATA_DIR, 'mosaic_low_newest_v1.json.gz')
+
+
+@pytest.fixture(scope='module')
+def mosaic():
+    with gzip.open(MOSAIC_PATH) as f:
+        return json.load(f)
+
+
+def test_mosaic_index_round_trip(tmp_path, mosaic):
+    write_mosaic_index(str(tmp_path), mosaic)
+    index = MosaicIndex(str(tmp_path))
+    assert len(index) == len(mosaic['tiles'])
+
+    # Same quadkey order, assets and metadata
+    assert json.dumps(index.to_mosaicjson()) == json.dumps(mosaic)
+
+
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_mosaic_index_assets_for_tile(tmp_path, mosaic, in_memory):
+    write_mosaic_index(str(tmp_path), mosaic)
+    if in_memory:
+        index = load_mosaic_index(MOSAIC_PATH)
+    else:
+        index = load_mosaic_index(str(tmp_path))
+    assert index.load_time > 0
+    assert isinstance(index.load_rss, int)
+    quadkey_zoom = mosaic['quadkey_zoom']
+
+    random.seed(0)
+    quadkeys = list(mosaic['tiles'])
+    for _ in range(200):
+        tile = mercantile.quadkey_to_tile(random.choice(quadkeys))
+        zoom = quadkey_zoom + random.choice([-3, -1, 0, 2, 5])
+        if zoom < quadkey_zoom:
+            tile = mercantile.parent(tile, zoom=zoom)
+        elif zoom > quadkey_zoom:
+            tile = random.choice(list(mercantile.children(tile, zoom=zoom)))
+
+        expected = get_assets(mosaic, tile.x, tile.y, tile.z)
+        assert index.assets_for_tile(tile.z, tile.x, tile.y) == expected
+
+    assert index.assets_for_tile(0, 0, 0) == get_assets(mosaic, 0, 0, 0)
+    assert index.assets_for_tile(quadkey_zoom, 0, 0) == []
+
+
+def test_mosaic_index_asset_table(tmp_path):
+    assets = [
+        '{"url":"s3://bucket/a.tif","map_bounds":[-120.0,37.0,-119.875,37.125]}',
+        '{"url":"s3://bucket/b.tif","map_bounds":[-120.25,37.0,-120.0,37.25]}',
+        's3://bucket/c.tif']
+    mosaic = {
+        'mosaicjson': '0.0.2',
+        'minzoom': 9,
+        'maxzoom': 14,
+        'quadkey_zoom': 9,
+        'tiles': {
+            '023010203': assets,
+            '023010201': assets[1:],
+            '023010200': assets[:1]}}
+    write_mosaic_index(str(tmp_path), mosaic)
+    index = MosaicIndex(str(tmp_path))
+
+    # Each asset is stored once, with float32 bounds when lossless
+    assert len(index._assets) == 3
+    assert index._assets.dtype['map_bounds'].base.itemsize == 4
+    assert index.to_mosaicjson() == mosaic
+    assert list(index.to_mosaicjson()['tiles']) == list(mosaic['tiles'])
+
+    tile = mercantile.parent(mercantile.quadkey_to_tile('023010203'))
+    assert index.assets_for_tile(tile.z, tile.x, tile.y) == [
+        assets[0], assets[1], assets[2]]
+    assert index.assets_for_tile(tile.z, tile.x, tile.y) == get_assets(
+        mosaic, tile.x, tile.y, tile.z)
+
+
+def test_mosaic_index_from_mosaicjson(mosaic):
+    index = MosaicIndex.from_mosaicjson(mosaic)
+    assert json.dumps(index.to_mosaicjson()) == json.dumps(mosaic)
+
+
+def test_tile_to_int():
+    random.seed(0)
+    for zoom in [0, 1, 5, 12, 20, 30]:
+        for _ in range(20):
+            x, y = random.randrange(2**zoom), random.randrange(2**zoom)
+            quadkey = mercantile.quadkey(mercantile.Tile(x, y, zoom))
+            assert tile_to_int(x, y) == quadkey_to_int(quadkey)
+
+
+def test_mosaic_tile_index(mosaic):
+    index = MosaicIndex.from_mosaicjson(mosaic)
+    quadkey = next(iter(mosaic['tiles']))
+    tile = mercantile.children(mercantile.quadkey_to_tile(quadkey))[0]
+
+    calls = []
+
+    def tiler(asset, x, y, z, tilesize=256, **kwargs):
+        calls.append(asset)
+        data = np.zeros((3, tilesize, tilesize), dtype='uint8')
+        return data, np.full((tilesize, tilesize), 255, dtype='uint8')
+
+    mosaic_tile(index, tile.x, tile.y, tile.z, threads=1, tiler=tiler)
+    assert calls == mosaic['tiles'][quadkey][:1]
+
+
+def test_resident_memory_fallback(monkeypatch):
+    def no_proc(path):
+        raise FileNotFoundError(path)
+
+    # Without /proc, peak resident memory from getrusage
+    monkeypatch.setattr(mosaic_index, 'open', no_proc, raising=False)
+    assert resident_memory() > 0
+
+    # Neither is available on Windows
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    assert resident_memory() is None
+    index = load_mosaic_index(MOSAIC_PATH)
+    assert index.load_rss is None
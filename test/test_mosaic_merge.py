@@ -0,0 +1,111 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from usgs_topo_tiler.scripts.mosaic_bulk import mosaic_bulk
+from usgs_topo_tiler.scripts.mosaic_merge import mosaic_merge
+
+ARGS = ['--quadkey-zoom', '11']
+
+
+@pytest.fixture(scope='module')
+def shard_paths(tmp_path_factory, bulk_meta_path):
+    """Shards created in separate processes, like on separate nodes"""
+    tmp_path = tmp_path_factory.mktemp('shards')
+    n = 3
+    paths = [str(tmp_path / f'shard_{i}.json') for i in range(n)]
+    procs = []
+    for i, path in enumerate(paths):
+        # Last shard is built in partitions
+        extra = ['--memory-budget', '.2'] if i == n - 1 else []
+        cmd = [
+            sys.executable, '-m', 'usgs_topo_tiler.scripts.mosaic_bulk',
+            '--meta-path', bulk_meta_path, *ARGS, '--shard', f'{i}/{n}',
+            *extra]
+        with open(path, 'w') as f:
+            procs.append(
+                subprocess.Popen(cmd, stdout=f, stderr=subprocess.DEVNULL))
+
+    assert all(proc.wait() == 0 for proc in procs)
+    return paths
+
+
+def test_mosaic_merge(shard_paths, bulk_meta_path):
+    expected = CliRunner().invoke(
+        mosaic_bulk, ['--meta-path', bulk_meta_path, *ARGS])
+    assert expected.exit_code == 0, expected.output
+
+    shards = []
+    for path in shard_paths:
+        with open(path) as f:
+            shards.append(json.load(f))
+
+    # Each shard has a distinct subset of quadkeys
+    expected_tiles = json.loads(expected.stdout)['tiles']
+    for shard in shards:
+        assert 0 < len(shard['tiles']) < len(expected_tiles)
+
+    # Order of shards doesn't matter
+    result = CliRunner().invoke(mosaic_merge, shard_paths[::-1])
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes == expected.stdout_bytes
+
+
+def test_mosaic_merge_checks(tmp_path, shard_paths):
+    # Gap
+    result = CliRunner().invoke(mosaic_merge, shard_paths[:2])
+    assert 'Missing shards: [2]' in str(result.exception)
+
+    # Same shard twice
+    result = CliRunner().invoke(mosaic_merge, [*shard_paths, shard_paths[0]])
+    assert 'more than once' in str(result.exception)
+
+    # Quadkey overlap
+    with open(shard_paths[0]) as f:
+        shard = json.load(f)
+    with open(shard_paths[1]) as f:
+        other = json.load(f)
+    quadkey, assets = next(iter(shard['tiles'].items()))
+    other['tiles'][quadkey] = assets
+    other_path = tmp_path / 'other.json'
+    other_path.write_text(json.dumps(other))
+    result = CliRunner().invoke(
+        mosaic_merge, [shard_paths[0], str(other_path), shard_paths[2]])
+    assert f'Quadkeys in more than one shard: [\'{quadkey}\']' in str(
+        result.exception)
+
+
+def test_mosaic_bulk_shard_format(bulk_meta_path):
+    for shard in ['1', '3/3', 'a/b']:
+        result = CliRunner().invoke(
+            mosaic_bulk, ['--meta-path', bulk_meta_path, '--shard', shard])
+        assert isinstance(result.exception, ValueError)
+
+
+def test_mosaic_merge_empty_shard(tmp_path, bulk_meta_path):
+    expected = CliRunner().invoke(
+        mosaic_bulk, ['--meta-path', bulk_meta_path, *ARGS])
+    assert expected.exit_code == 0, expected.output
+
+    # Shard 4 of 8 has no quadkeys in this region
+    n = 8
+    paths = []
+    for i in range(n):
+        extra = ['--memory-budget', '.2'] if i % 2 == 0 else []
+        result = CliRunner().invoke(
+            mosaic_bulk, [
+                '--meta-path', bulk_meta_path, *ARGS, '--shard', f'{i}/{n}',
+                '--workers', '2', *extra])
+        assert result.exit_code == 0, result.output
+        assert (json.loads(result.stdout)['tiles'] == {}) == (i == 4)
+
+        path = tmp_path / f'shard_{i}.json'
+        path.write_bytes(result.stdout_bytes)
+        paths.append(str(path))
+
+    result = CliRunner().invoke(mosaic_merge, paths)
+    assert result.exit_code == 0, result.output
+    assert result.stdout_bytes == expected.stdout_bytes
@@ -0,0 +1,156 @@
+import datetime
+import http.server
+import json
+import random
+import threading
+
+import pytest
+from click.testing import CliRunner
+from cogeo_mosaic.mosaic import MosaicJSON
+
+from legacy import legacy_asset_filter, legacy_load_features
+from usgs_topo_tiler.scripts.mosaic import (
+    ExistsChecker, asset_filter, mosaic, parse_date, path_accessor)
+
+
+def make_features(base_url, seed=0):
+    """Quads with 1-3 editions each, in random order"""
+    rng = random.Random(seed)
+    features = []
+    for i in range(30):
+        minx, miny = -120 + i % 6 * .125, 37 + i // 6 * .125
+        coords = ((
+            (minx + .125, miny), (minx + .125, miny + .125),
+            (minx, miny + .125), (minx, miny), (minx + .125, miny)), )
+        for j in range(rng.randint(1, 3)):
+            date = datetime.datetime(1900 + rng.randrange(50), 1, 1)
+            features.append({
+                'properties': {
+                    'publicationDate': date,
+                    'downloadURL': f'{base_url}/{i}_{j}.tif'},
+                'geometry': {
+                    'type': 'Polygon',
+                    'coordinates': coords}})
+
+    rng.shuffle(features)
+    return features
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    """HTTP server of tmp_path that records requested paths"""
+    requested = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(tmp_path), **kwargs)
+
+        def do_HEAD(self):
+            requested.append(self.path)
+            super().do_HEAD()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', tmp_path, requested
+    server.shutdown()
+
+
+def _key(feature):
+    return feature['geometry']['coordinates']
+
+
+@pytest.mark.parametrize('preference', ['latest', 'earliest'])
+def test_asset_filter_matches_legacy(preference):
+    features = make_features('http://example.com')
+    result = asset_filter(None, features, None, preference=preference)
+    expected = legacy_asset_filter(None, features, None, preference=preference)
+    assert sorted(result, key=_key) == sorted(expected, key=_key)
+
+    # Quads are in order of first appearance
+    quads = list(dict.fromkeys(map(_key, features)))
+    assert list(map(_key, result)) == quads
+
+
+def test_asset_filter_check_exists(file_server):
+    base_url, directory, requested = file_server
+    features = make_features(base_url)
+
+    # Some files don't exist, including all files of some quads
+    rng = random.Random(1)
+    for f in features:
+        name = f['properties']['downloadURL'].rsplit('/', 1)[1]
+        if rng.random() < .5:
+            (directory / name).touch()
+
+    expected = legacy_asset_filter(None, features, None, check_exists=True)
+    n_legacy = len(requested)
+    requested.clear()
+
+    with ExistsChecker(threads=4) as checker:
+        kwargs = {'check_exists': True, 'exists_checker': checker}
+        result = asset_filter(None, features, None, **kwargs)
+        assert sorted(result, key=_key) == sorted(expected, key=_key)
+        assert len(requested) == n_legacy
+        assert len(set(requested)) == len(requested)
+
+        # Results are cached for later tiles with the same assets, and the
+        # same threads are used
+        threads = set(checker._executor._threads)
+        assert asset_filter(None, features, None, **kwargs) == result
+        assert len(requested) == n_legacy
+        assert set(checker._executor._threads) == threads
+        assert len(threads) <= 4
+
+    # Without a checker, files are checked again
+    result = asset_filter(None, features, None, check_exists=True)
+    assert sorted(result, key=_key) == sorted(expected, key=_key)
+    assert len(requested) == 2 * n_legacy
+
+
+def test_parse_date():
+    assert parse_date('1950-07-01') == datetime.datetime(1950, 7, 1)
+    assert parse_date('07/01/1950') == datetime.datetime(1950, 7, 1)
+    assert parse_date('1950-07-01T12:00:00') == datetime.datetime(
+        1950, 7, 1, 12)
+
+
+@pytest.mark.parametrize('preference', ['latest', 'earliest'])
+def test_mosaic_matches_legacy(tmp_path, preference):
+    path = tmp_path / 'metadata.json'
+    with open(path, 'w') as f:
+        for i, feature in enumerate(make_features('https://prd-tnm.s3.com')):
+            (maxx, miny), (_, maxy), (minx, _) = feature['geometry'][
+                'coordinates'][0][:3]
+            date = feature['properties']['publicationDate']
+            record = {
+                'title': f'Map {i}',
+                'downloadURL': feature['properties']['downloadURL'],
+                'publicationDate': date.strftime(
+                    '%Y-%m-%d' if i % 5 else '%m/%d/%Y'),
+                'boundingBox': {
+                    'minX': minx,
+                    'minY': miny,
+                    'maxX': maxx,
+                    'maxY': maxy},
+                'extent': '7.5 x 7.5 minute'}
+            f.write(json.dumps(record) + '\n')
+
+    result = CliRunner().invoke(
+        mosaic, ['--preference', preference, str(path)])
+    assert result.exit_code == 0, result.output
+
+    with open(path) as f:
+        features = legacy_load_features(f)
+    expected = MosaicJSON.from_features(
+        features,
+        minzoom=11,
+        maxzoom=16,
+        asset_filter=asset_filter,
+        accessor=path_accessor,
+        preference=preference)
+    assert result.stdout.strip() == json.dumps(
+        expected.dict(), separators=(',', ':'))
@@ -0,0 +1,126 @@
+import time
+from unittest.mock import MagicMock
+
+import mercantile
+import pytest
+from rasterio.errors import RasterioError, RasterioIOError
+from rio_tiler.errors import TileOutsideBounds
+
+from usgs_topo_tiler.pool import DatasetPool
+from usgs_topo_tiler.usgs_topo import tile
+
+
+def fake_opener(address):
+    return MagicMock(name=address)
+
+
+def test_pool_reuses_handles():
+    pool = DatasetPool(maxsize=4, opener=fake_opener)
+
+    with pool.open('a') as first:
+        pass
+    with pool.open('a') as second:
+        assert second is first
+    with pool.open('b') as other:
+        assert other is not first
+
+    assert pool.stats.snapshot() == {'hits': 1, 'misses': 2, 'evictions': 0}
+    assert len(pool) == 2
+
+
+def test_pool_handles_not_shared():
+    pool = DatasetPool(maxsize=4, opener=fake_opener)
+
+    with pool.open('a') as first:
+        with pool.open('a') as second:
+            assert second is not first
+
+    assert len(pool) == 2
+
+
+def test_pool_size_eviction():
+    pool = DatasetPool(maxsize=2, opener=fake_opener)
+
+    handles = {}
+    for address in ['a', 'b', 'c']:
+        with pool.open(address) as src_dst:
+            handles[address] = src_dst
+
+    # Least recently used handle is closed
+    handles['a'].close.assert_called_once()
+    handles['c'].close.assert_not_called()
+    assert pool.stats['evictions'] == 1
+    assert len(pool) == 2
+
+
+def test_pool_ttl_eviction():
+    pool = DatasetPool(maxsize=2, ttl=0.01, opener=fake_opener)
+
+    with pool.open('a') as first:
+        pass
+    time.sleep(0.02)
+    with pool.open('a') as second:
+        assert second is not first
+
+    first.close.assert_called_once()
+    assert pool.stats.snapshot() == {'hits': 0, 'misses': 2, 'evictions': 1}
+
+
+@pytest.mark.parametrize('error', [OSError, RasterioIOError, RasterioError])
+def test_pool_closes_on_error(error):
+    pool = DatasetPool(opener=fake_opener)
+
+    with pytest.raises(error):
+        with pool.open('a') as src_dst:
+            raise error()
+
+    src_dst.close.assert_called_once()
+    assert len(pool) == 0
+
+
+@pytest.mark.parametrize('error', [TileOutsideBounds, ValueError])
+def test_pool_keeps_on_expected_error(error):
+    pool = DatasetPool(opener=fake_opener)
+
+    with pytest.raises(error):
+        with pool.open('a') as src_dst:
+            raise error()
+
+    src_dst.close.assert_not_called()
+    with pool.open('a') as second:
+        assert second is src_dst
+
+
+def test_tile_uses_pool(topo_path, map_bounds):
+    pool = DatasetPool()
+    center = ((map_bounds[0] + map_bounds[2]) / 2,
+              (map_bounds[1] + map_bounds[3]) / 2)
+    t = mercantile.tile(*center, 14)
+
+    data, mask = tile(topo_path, t.x, t.y, t.z, pool=pool)
+    data_again, _ = tile(topo_path, t.x, t.y, t.z, pool=pool)
+    uncached, _ = tile(topo_path, t.x, t.y, t.z, pool=None)
+
+    assert data.shape == (3, 256, 256)
+    assert mask.shape == (256, 256)
+    assert (data == data_again).all()
+    assert (data == uncached).all()
+    assert pool.stats['hits'] == 1
+    assert pool.stats['misses'] == 1
+
+
+def test_tile_outside_bounds_keeps_handle(topo_path, map_bounds):
+    # Without cached geometries, bounds are checked with the open dataset
+    kwargs = {'pool': DatasetPool(), 'geometry_cache': None}
+    center = ((map_bounds[0] + map_bounds[2]) / 2,
+              (map_bounds[1] + map_bounds[3]) / 2)
+    t = mercantile.tile(*center, 14)
+    tile(topo_path, t.x, t.y, t.z, **kwargs)
+
+    outside = mercantile.tile(center[0] + 1, center[1] + 1, 14)
+    with pytest.raises(TileOutsideBounds):
+        tile(topo_path, outside.x, outside.y, outside.z, **kwargs)
+
+    tile(topo_path, t.x, t.y, t.z, **kwargs)
+    assert kwargs['pool'].stats.snapshot() == {
+        'hits': 2, 'misses': 1, 'evictions': 0}
@@ -0,0 +1,140 @@
+import mercantile
+import numpy as np
+import pytest
+import rasterio
+from rio_tiler import reader
+from rio_tiler.errors import TileOutsideBounds
+
+from usgs_topo_tiler.cutline import get_collar_mask
+from usgs_topo_tiler.geometry import AssetGeometryCache, get_asset_geometry
+from usgs_topo_tiler.pool import DatasetPool
+from usgs_topo_tiler.usgs_topo import tile, tile_many, tile_stats, tile_within
+
+
+def test_tile_many(topo_path, map_bounds):
+    tiles = list(mercantile.tiles(*map_bounds, [12, 14]))
+    # Tile far outside the image is skipped
+    outside = mercantile.tile(-100, 40, 14)
+
+    results = list(tile_many(topo_path, [*tiles, outside]))
+    assert [t for t, _, _ in results] == tiles
+
+    for t, data, mask in results:
+        expected_data, expected_mask = tile(topo_path, *t)
+        assert data.shape == expected_data.shape
+        assert mask.shape == expected_mask.shape
+
+        # Warping one large VRT can pick a neighboring source pixel right at
+        # pixel boundaries. Test image values are a gradient of pixel position.
+        assert np.mean(mask != expected_mask) < .001
+        valid = (mask > 0) & (expected_mask > 0)
+        diff = np.abs(
+            data[:, valid].astype(int) - expected_data[:, valid]) % 254
+        assert np.mean(diff > 1) < .001
+
+
+def test_tile_collar_without_reads(topo_path, map_bounds):
+    def opener(address):
+        raise AssertionError('Dataset should not be opened')
+
+    # Tile in the western collar of the map
+    t = mercantile.tile(map_bounds[0] - .01, map_bounds[1] + .05, 16)
+    before = tile_stats['collar_skips']
+
+    # Geometry is cached by the first call
+    cache = AssetGeometryCache()
+    data, mask = tile(
+        topo_path, *t, map_bounds=map_bounds, pool=None, geometry_cache=cache)
+    assert data.shape == (3, 256, 256)
+    assert data.dtype == np.uint8
+    assert not mask.any()
+
+    data, mask = tile(
+        topo_path,
+        *t,
+        map_bounds=map_bounds,
+        pool=DatasetPool(opener=opener),
+        geometry_cache=cache)
+    assert data.shape == (3, 256, 256)
+    assert not mask.any()
+    assert tile_stats['collar_skips'] == before + 2
+
+    # Same tile when map bounds have to be estimated from the image
+    data, mask = tile(
+        topo_path, *t, indexes=1, pool=None, geometry_cache=None)
+    assert data.shape == (1, 256, 256)
+    assert not mask.any()
+
+
+def test_tile_outside_image(topo_path, map_bounds):
+    t = mercantile.tile(map_bounds[0] - .1, map_bounds[1] + .05, 16)
+    cache = AssetGeometryCache()
+
+    # Same error whether or not the image bounds are known before opening
+    for _ in range(2):
+        with pytest.raises(TileOutsideBounds):
+            tile(
+                topo_path,
+                *t,
+                map_bounds=map_bounds,
+                pool=None,
+                geometry_cache=cache)
+
+
+def test_tile_interior_without_cutline(topo_path, map_bounds):
+    center = ((map_bounds[0] + map_bounds[2]) / 2,
+              (map_bounds[1] + map_bounds[3]) / 2)
+    interior = mercantile.tile(*center, 15)
+    edge = mercantile.tile(map_bounds[0], center[1], 15)
+    assert tile_within(map_bounds, interior.z, interior.x, interior.y)
+    assert not tile_within(map_bounds, edge.z, edge.x, edge.y)
+
+    before = tile_stats.snapshot()
+    with rasterio.open(topo_path) as src_dst:
+        cutline = get_asset_geometry(src_dst, topo_path).cutline
+        for t in [interior, edge]:
+            data, mask = tile(topo_path, *t)
+            expected_data, expected_mask = reader.tile(
+                src_dst, *t, 256, warp_vrt_option={'cutline': cutline})
+            assert (data == expected_data).all()
+            assert (mask == expected_mask).all()
+
+    after = tile_stats.snapshot()
+    assert after['interior'] == before['interior'] + 1
+    assert after['cutline'] == before['cutline'] + 1
+
+
+def test_collar_mask(map_bounds):
+    t = mercantile.tile(map_bounds[0], map_bounds[3], 14)
+    mask = get_collar_mask(map_bounds, t.x, t.y, t.z, tilesize=512)
+
+    # Map corner is at the top left of the tile, so the map is bottom right
+    assert mask.shape == (512, 512)
+    assert not mask[0, 0]
+    assert mask[-1, -1]
+    row, col = np.argmax(mask[:, -1]), np.argmax(mask[-1])
+    assert mask[row:, col:].all()
+    assert not mask[:row].any()
+    assert not mask[:, :col].any()
+
+
+def test_tile_collar_method_mask(topo_path, map_bounds):
+    center_y = (map_bounds[1] + map_bounds[3]) / 2
+    t = mercantile.tile(map_bounds[0], center_y, 15)
+
+    data, mask = tile(topo_path, *t, collar_method='mask')
+    cutline_data, cutline_mask = tile(topo_path, *t, collar_method='cutline')
+
+    assert mask.any() and not mask.all()
+    assert not data[:, mask == 0].any()
+    # The cutline is the envelope of the map bounds in the image CRS, so it
+    # keeps some of the collar that the mask removes
+    assert (cutline_mask[mask > 0] > 0).all()
+    valid = (mask > 0) & (cutline_mask > 0)
+    assert (data[:, valid] == cutline_data[:, valid]).all()
+
+    results = list(tile_many(topo_path, [t], collar_method='mask'))
+    assert np.mean(results[0][2] != mask) < .001
+
+    with pytest.raises(ValueError):
+        tile(topo_path, *t, collar_method='polygon')
@@ -4,4 +4,4 @@ __author__ = """Kyle Barron"""
 __email__ = 'kylebarron2@gmail.com'
 __version__ = '0.2.0'
 
-from .usgs_topo import tile
+from .usgs_topo import tile, tile_many
@@ -0,0 +1,120 @@
+"""usgs_topo_tiler.aio: asyncio interface for tile servers."""
+import asyncio
+import functools
+from concurrent import futures
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from rio_tiler.constants import MAX_THREADS
+from rio_tiler.errors import TileOutsideBounds
+
+from usgs_topo_tiler.mosaic import _TileComposite, get_assets, mosaic_stats
+from usgs_topo_tiler.usgs_topo import tile
+
+
+class AsyncTiler:
+    """Run blocking tile reads from asyncio with bounded concurrency
+
+    Reads run in a dedicated thread pool with `max_concurrency` workers, so
+    that GDAL is never asked to do more work at once than the pool allows.
+    Callers beyond that limit wait on a semaphore in the event loop instead of
+    queueing on the executor, and cancelling a waiting caller means its read
+    never starts.
+
+    Cancelling a read that has already started releases its slot right away,
+    but the blocking GDAL call runs to completion in its worker thread.
+
+    Args:
+        - max_concurrency: maximum number of reads in flight
+        - executor: executor to run reads in. By default a new thread pool is
+          created with `max_concurrency` workers, and shut down by `close`.
+
+    Example:
+
+        async with AsyncTiler(max_concurrency=16) as tiler:
+            data, mask = await tiler.tile(url, x, y, z)
+    """
+    def __init__(
+            self,
+            max_concurrency: int = MAX_THREADS,
+            executor: Optional[futures.Executor] = None):
+        self.max_concurrency = max_concurrency
+        self._own_executor = executor is None
+        self._executor = executor or futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='usgs-topo-tiler')
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down executor if it was created by this instance"""
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def run(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Run blocking function in executor once a slot is available"""
+        if self._semaphore is None:
+            # Created lazily so it's bound to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs))
+
+    async def tile(
+            self, address: str, tile_x: int, tile_y: int, tile_z: int,
+            **kwargs: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Async version of `usgs_topo_tiler.usgs_topo.tile`"""
+        return await self.run(tile, address, tile_x, tile_y, tile_z, **kwargs)
+
+    async def mosaic_tile(
+            self,
+            mosaic: Dict,
+            tile_x: int,
+            tile_y: int,
+            tile_z: int,
+            tilesize: int = 256,
+            tiler: Callable[..., Tuple[np.ndarray, np.ndarray]] = tile,
+            **kwargs: Any,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Async version of `usgs_topo_tiler.mosaic.mosaic_tile`
+
+        All asset reads are scheduled at once and share this instance's
+        concurrency limit. Reads that are no longer needed once the tile is
+        filled are cancelled.
+        """
+        assets = get_assets(mosaic, tile_x, tile_y, tile_z)
+        if not assets:
+            raise TileOutsideBounds(
+                f'No assets found for tile {tile_z}/{tile_x}/{tile_y}')
+
+        mosaic_stats.incr('tiles')
+
+        def _read(asset):
+            mosaic_stats.incr('reads')
+            return tiler(
+                asset, tile_x, tile_y, tile_z, tilesize=tilesize, **kwargs)
+
+        tasks = [
+            asyncio.ensure_future(self.run(_read, asset)) for asset in assets]
+        composite = _TileComposite(len(assets), tile_x, tile_y, tile_z)
+        try:
+            for task in tasks:
+                await asyncio.wait([task])
+                if composite.add(task.result):
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # Retrieve exceptions of reads that finished but weren't
+                    # used, so asyncio doesn't log them as never retrieved
+                    task.exception()
+
+        return composite.result()
@@ -10,17 +10,21 @@ for how to separate a click CLI into subfiles
 """
 import click
 
-from usgs_topo_tiler.scripts import list_s3, metadata, mosaic, mosaic_bulk
+from usgs_topo_tiler.scripts import (
+    index, ingest, list_s3, metadata, mosaic, mosaic_bulk, mosaic_merge)
 
 
 @click.group()
 def main():
     pass
 
+main.add_command(index)
+main.add_command(ingest)
 main.add_command(list_s3)
 main.add_command(metadata)
 main.add_command(mosaic)
 main.add_command(mosaic_bulk)
+main.add_command(mosaic_merge)
 
 if __name__ == '__main__':
     main()
@@ -1,10 +1,14 @@
 """usgs_topo_tiler.cutline: Generate cutline for image."""
 from typing import List
 
+import mercantile
 import numpy as np
 from rasterio.crs import CRS
 from rasterio.warp import transform_bounds
 
+# Radius of the Web Mercator sphere in meters
+EARTH_RADIUS = 6378137
+
 
 def get_cutline(r, quad_wgs_bounds: List[float]):
     """Get cutline to remove collar from image
@@ -36,3 +40,40 @@ def get_cutline(r, quad_wgs_bounds: List[float]):
 
     wkt = f'POLYGON (({left} {top}, {left} {bottom}, {right} {bottom}, {right} {top}))'
     return wkt
+
+
+def get_collar_mask(
+        quad_wgs_bounds: List[float], tile_x: int, tile_y: int, tile_z: int,
+        tilesize: int = 256) -> np.ndarray:
+    """Get mask of map area for a mercator tile
+
+    Alternative to a cutline: instead of GDAL checking every pixel against a
+    polygon while warping, the map bounds are rasterized directly onto the tile
+    grid. Map bounds are axis-aligned in WGS84 and so are rows and columns of a
+    mercator tile, so this reduces to an outer product of two 1D tests.
+
+    Args:
+        - quad_wgs_bounds: [minx, miny, maxx, maxy] in WGS84 of the image
+          without the collar
+        - tile_x: Mercator tile X index
+        - tile_y: Mercator tile Y index
+        - tile_z: Mercator tile ZOOM level
+        - tilesize: Output image size
+
+    Returns:
+        Boolean array of shape (tilesize, tilesize), True inside the map
+    """
+    minx, miny, maxx, maxy = quad_wgs_bounds
+    west, south, east, north = mercantile.xy_bounds(tile_x, tile_y, tile_z)
+
+    # Web Mercator coordinates of pixel centers
+    offsets = (np.arange(tilesize) + .5) / tilesize
+    xs = west + offsets * (east - west)
+    ys = north - offsets * (north - south)
+
+    lons = np.degrees(xs / EARTH_RADIUS)
+    lats = np.degrees(2 * np.arctan(np.exp(ys / EARTH_RADIUS)) - np.pi / 2)
+
+    cols = (lons >= minx) & (lons <= maxx)
+    rows = (lats >= miny) & (lats <= maxy)
+    return np.outer(rows, cols)
@@ -1,9 +1,11 @@
 """usgs_topo_tiler.grid: Find bounds of image not including collar."""
 
 import re
-from typing import Dict, List
+from typing import Dict, List, Sequence
 from urllib.parse import unquote
 
+import numpy as np
+
 # Mapping from image scale to the minimum possible offset
 # This is created by looking at the cross tabulation of grid size by scale. For
 # each scale, I look at all possible grid offsets and take the smallest one. So
@@ -27,6 +29,19 @@ SCALE_DEGREE_OFFSET_XW = {
     125000: .5,
     192000: .5}
 
+# Maps at 1:250,000 scale whose width isn't a multiple of the usual offset.
+# Mapping from (state, map_name) to x offset
+SPECIAL_250000_OFFSET_X = {
+    ('ca', 'santacruz'): .2,
+    # west long is -124.0833
+    ('wa', 'vancouver'): .1,
+    # west long is -124.1833
+    ('or', 'salem'): .18,
+    # east long is -77.8833333
+    ('sc', 'georgetown'): .12,
+    # east long is -69.8833333
+    ('ri', 'providence'): .12}
+
 
 def parse_url(url: str) -> int:
     """Parse metadata from url
@@ -132,21 +147,98 @@ def _get_offset_250000(bounds: List[float], meta: Dict) -> List[float]:
             offset_x, offset_y = 1, 1
 
 
-    map_name = meta['map_name']
-    state = meta['state']
-    if state == 'ca' and map_name == 'santacruz':
-        offset_x = .2
-    elif state == 'wa' and map_name == 'vancouver':
-        # west long is -124.0833
-        offset_x = .1
-    elif state == 'or' and map_name == 'salem':
-        # west long is -124.1833
-        offset_x = .18
-    elif state == 'sc' and map_name == 'georgetown':
-        # east long is -77.8833333
-        offset_x = .12
-    elif state == 'ri' and map_name == 'providence':
-        # east long is -69.8833333
-        offset_x = .12
+    key = (meta['state'], meta['map_name'])
+    offset_x = SPECIAL_250000_OFFSET_X.get(key, offset_x)
+
+    return [offset_x, offset_y]
+
+
+def estimate_extent_batch(
+        bounds: np.ndarray, scales: Sequence[int], states: Sequence[str],
+        map_names: Sequence[str]) -> np.ndarray:
+    """Get extent of many images without collar
+
+    Vectorized version of `estimate_extent`, for precomputing map extents of
+    the whole catalog. Rows whose scale has no known offset are NaN.
+
+    Args:
+        - bounds: array of shape (n, 4) of image bounds in WGS84
+        - scales: map scales, e.g. 24000
+        - states: two-letter state abbreviations
+        - map_names: map names. Case and spaces are ignored, as in `parse_url`.
+
+    Returns:
+        array of shape (n, 4) of map bounds [minx, miny, maxx, maxy]
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+    offset_x, offset_y = get_offsets_batch(bounds, scales, states, map_names)
+    return _get_extent_batch(bounds, offset_x, offset_y)
+
+
+def _get_extent_batch(
+        bounds: np.ndarray, offset_x: np.ndarray,
+        offset_y: np.ndarray) -> np.ndarray:
+    """Vectorized version of `_get_extent`"""
+    minx, miny, maxx, maxy = bounds.T
+
+    # np.mod has the same sign convention as Python's %
+    minx = minx + np.mod(np.abs(minx), offset_x)
+    miny = miny - np.mod(miny, offset_y) + offset_y
+    maxx = maxx + np.mod(np.abs(maxx), offset_x) - offset_x
+    maxy = maxy - np.mod(maxy, offset_y)
+    return np.stack([minx, miny, maxx, maxy], axis=1)
+
+
+def get_offsets_batch(
+        bounds: np.ndarray, scales: Sequence[int], states: Sequence[str],
+        map_names: Sequence[str]) -> List[np.ndarray]:
+    """Vectorized version of `get_offsets`
+
+    Returns:
+        [offset_x, offset_y], arrays of shape (n,). NaN for unknown scales.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+    scales = np.asarray(scales, dtype=np.int64)
+    n = len(scales)
+    offset_x = np.full(n, np.nan)
+    offset_y = np.full(n, np.nan)
+
+    # Lookup table of easy offsets
+    table_scales = np.array(sorted(SCALE_DEGREE_OFFSET_XW), dtype=np.int64)
+    table_offsets = np.array([SCALE_DEGREE_OFFSET_XW[s] for s in table_scales])
+    idx = np.minimum(
+        np.searchsorted(table_scales, scales), len(table_scales) - 1)
+    easy = table_scales[idx] == scales
+    offset_x[easy] = table_offsets[idx[easy]]
+    offset_y[easy] = table_offsets[idx[easy]]
+
+    # Custom cases for scale == 63360
+    is_63360 = scales == 63360
+    maxy = bounds[:, 3]
+    offset_x_63360 = np.select(
+        [maxy < 49.25, maxy < 59.25, maxy < 62.25, maxy < 68.25],
+        [.25, 1 / 3, .375, .5],
+        default=.2)
+    offset_x[is_63360] = offset_x_63360[is_63360]
+    offset_y[is_63360] = .25
+
+    # Custom cases for scale == 250000
+    is_250000 = scales == 250000
+    miny = bounds[:, 1]
+    alaska = miny > 49
+    offset_x_250000 = np.where(alaska & (maxy >= 59.5), 1, .5)
+    offset_y_250000 = np.where(
+        alaska, np.where(maxy < 59.5, .25, 1), .5)
+
+    if is_250000.any():
+        states = np.char.lower(np.asarray(states, dtype=str))
+        map_names = np.char.replace(
+            np.char.lower(np.asarray(map_names, dtype=str)), ' ', '')
+        for (state, map_name), special_x in SPECIAL_250000_OFFSET_X.items():
+            special = (states == state) & (map_names == map_name)
+            offset_x_250000[special] = special_x
+
+    offset_x[is_250000] = offset_x_250000[is_250000]
+    offset_y[is_250000] = offset_y_250000[is_250000]
 
     return [offset_x, offset_y]
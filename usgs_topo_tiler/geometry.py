@@ -0,0 +1,176 @@
+"""usgs_topo_tiler.geometry: Per-asset collar geometry and its cache."""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+
+from usgs_topo_tiler.cutline import get_cutline
+from usgs_topo_tiler.extent import estimate_extent
+from usgs_topo_tiler.stats import Stats
+
+
+class AssetGeometry(NamedTuple):
+    """Geometry of an asset needed to remove its collar
+
+    Attributes:
+        - image_wgs_bounds: bounds of the full image, including collar, in
+          WGS84
+        - map_bounds: bounds of the map, excluding collar, in WGS84
+        - cutline: WKT cutline of the map in image coordinates
+    """
+    image_wgs_bounds: List[float]
+    map_bounds: List[float]
+    cutline: str
+
+
+def get_asset_geometry(
+        src_dst, address: str,
+        map_bounds: List[float] = None) -> AssetGeometry:
+    """Compute collar geometry for an asset
+
+    Args:
+        - src_dst: opened rasterio dataset
+        - address: url of the asset, used to estimate map bounds
+        - map_bounds: known bounds of map excluding collar in WGS84. If not
+          provided, bounds are estimated from the image bounds and url.
+    """
+    # Convert image bounds to wgs84
+    image_wgs_bounds = transform_bounds(
+        src_dst.crs, CRS.from_epsg(4326), *src_dst.bounds)
+
+    if not map_bounds:
+        map_bounds = estimate_extent(image_wgs_bounds, address)
+
+    cutline = get_cutline(src_dst, map_bounds)
+    return AssetGeometry(list(image_wgs_bounds), list(map_bounds), cutline)
+
+
+class AssetGeometryCache:
+    """Bounded LRU cache of AssetGeometry keyed by address
+
+    The geometry of an asset is a pure function of the asset, so it only needs
+    to be computed once per process. Optionally, entries are also persisted to
+    an SQLite database so that they survive restarts and can be shared between
+    processes.
+
+    Args:
+        - maxsize: maximum number of entries to keep in memory
+        - path: path to SQLite database for persistent storage. Default: None,
+          i.e. in memory only.
+    """
+    def __init__(self, maxsize: int = 4096, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.stats = Stats('hits', 'misses', 'evictions')
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._conn = None
+        self._pid = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cache)
+
+    def get(self, address: str,
+            map_bounds: List[float] = None) -> Optional[AssetGeometry]:
+        """Look up geometry for address
+
+        map_bounds is part of the key, since explicitly provided map bounds
+        change the cutline.
+        """
+        key = self._key(address, map_bounds)
+        with self._lock:
+            geometry = self._cache.get(key)
+            if geometry is not None:
+                self._cache.move_to_end(key)
+
+        if geometry is None and self.path:
+            geometry = self._load(key)
+            if geometry is not None:
+                self._insert(key, geometry)
+
+        self.stats.incr('hits' if geometry is not None else 'misses')
+        return geometry
+
+    def set(
+            self, address: str, map_bounds: Optional[List[float]],
+            geometry: AssetGeometry):
+        """Store geometry for address"""
+        key = self._key(address, map_bounds)
+        self._insert(key, geometry)
+        if self.path:
+            self._store(key, geometry)
+
+    def get_or_compute(
+            self, src_dst, address: str,
+            map_bounds: List[float] = None) -> AssetGeometry:
+        """Look up geometry for address, computing it from src_dst if missing
+        """
+        geometry = self.get(address, map_bounds)
+        if geometry is None:
+            geometry = get_asset_geometry(src_dst, address, map_bounds)
+            self.set(address, map_bounds, geometry)
+
+        return geometry
+
+    def clear(self):
+        """Remove all entries from memory. Persistent entries are kept."""
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _key(address: str, map_bounds: Optional[List[float]]) -> str:
+        map_bounds = list(map_bounds) if map_bounds else None
+        return json.dumps([address, map_bounds], separators=(',', ':'))
+
+    def _insert(self, key: str, geometry: AssetGeometry):
+        with self._lock:
+            self._cache[key] = geometry
+            self._cache.move_to_end(key)
+            n_evicted = max(len(self._cache) - self.maxsize, 0)
+            for _ in range(n_evicted):
+                self._cache.popitem(last=False)
+
+        if n_evicted:
+            self.stats.incr('evictions', n_evicted)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection to persistent store. Must be called with lock held."""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS asset_geometry '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self._pid = os.getpid()
+
+        return self._conn
+
+    def _load(self, key: str) -> Optional[AssetGeometry]:
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT value FROM asset_geometry WHERE key = ?',
+                (key, )).fetchone()
+
+        if row is None:
+            return None
+
+        return AssetGeometry(**json.loads(row[0]))
+
+    def _store(self, key: str, geometry: AssetGeometry):
+        value = json.dumps(geometry._asdict(), separators=(',', ':'))
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO asset_geometry VALUES (?, ?)',
+                    (key, value))
+
+
+# Default cache used by `usgs_topo.tile`
+asset_geometry_cache = AssetGeometryCache()
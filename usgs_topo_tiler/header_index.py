@@ -0,0 +1,218 @@
+"""usgs_topo_tiler.header_index: Index of asset headers stored on disk."""
+import json
+import os
+from typing import Iterable, List, NamedTuple, Optional
+from urllib.parse import unquote, urlparse
+
+import numpy as np
+from affine import Affine
+from rasterio.coords import BoundingBox
+from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+
+from usgs_topo_tiler.cutline import get_cutline
+from usgs_topo_tiler.extent import estimate_extent
+from usgs_topo_tiler.geometry import AssetGeometry
+
+# Maximum number of overview levels stored per asset
+MAX_OVERVIEWS = 8
+
+HEADERS_FILENAME = 'headers.npy'
+META_FILENAME = 'meta.json'
+
+
+class AssetHeader(NamedTuple):
+    """Header information of an asset
+
+    Has the `crs`, `transform`, `width`, `height` and `bounds` attributes of a
+    rasterio dataset, so that it can be used in place of an opened dataset to
+    compute the cutline.
+
+    Attributes:
+        - key: S3 key or path of the asset
+        - crs: CRS of the image
+        - transform: affine transform of the image
+        - width: width of the image in pixels
+        - height: height of the image in pixels
+        - overviews: decimation factors of the overviews of the first band
+        - image_wgs_bounds: bounds of the full image, including collar, in
+          WGS84
+        - map_bounds: estimated bounds of the map, excluding collar, in WGS84.
+          NaN if they can't be estimated from the key.
+    """
+    key: str
+    crs: CRS
+    transform: Affine
+    width: int
+    height: int
+    overviews: List[int]
+    image_wgs_bounds: List[float]
+    map_bounds: List[float]
+
+    @property
+    def bounds(self) -> BoundingBox:
+        left, top = self.transform * (0, 0)
+        right, bottom = self.transform * (self.width, self.height)
+        return BoundingBox(left, bottom, right, top)
+
+    def geometry(self, map_bounds: List[float] = None) -> AssetGeometry:
+        """Collar geometry of asset, without opening it
+
+        Args:
+            - map_bounds: known bounds of map excluding collar in WGS84. If not
+              provided, bounds stored in the index are used.
+        """
+        if not map_bounds:
+            map_bounds = self.map_bounds
+            if np.isnan(map_bounds).any():
+                map_bounds = estimate_extent(self.image_wgs_bounds, self.key)
+
+        cutline = get_cutline(self, map_bounds)
+        return AssetGeometry(
+            list(self.image_wgs_bounds), list(map_bounds), cutline)
+
+
+def address_to_key(address: str) -> str:
+    """Key of an asset in the index
+
+    For S3 and HTTP urls, this is the unquoted path without bucket or host, as
+    listed by `usgs-topo-tiler list-s3`. Other addresses are used as is.
+    """
+    parsed = urlparse(address)
+    if parsed.scheme in ['s3', 'http', 'https']:
+        return unquote(parsed.path).lstrip('/')
+
+    return address
+
+
+def read_header(src_dst, key: str) -> AssetHeader:
+    """Read header of an opened dataset
+
+    Args:
+        - src_dst: opened rasterio dataset
+        - key: key of the asset in the index, used to estimate map bounds
+    """
+    image_wgs_bounds = transform_bounds(
+        src_dst.crs, CRS.from_epsg(4326), *src_dst.bounds)
+
+    try:
+        map_bounds = estimate_extent(image_wgs_bounds, key)
+    except (AttributeError, TypeError):
+        # Key doesn't follow the USGS naming scheme or scale is unknown
+        map_bounds = [np.nan] * 4
+
+    return AssetHeader(
+        key=key,
+        crs=src_dst.crs,
+        transform=src_dst.transform,
+        width=src_dst.width,
+        height=src_dst.height,
+        overviews=src_dst.overviews(1)[:MAX_OVERVIEWS],
+        image_wgs_bounds=list(image_wgs_bounds),
+        map_bounds=list(map_bounds))
+
+
+def write_header_index(path: str, headers: Iterable[AssetHeader]):
+    """Write headers to an index directory
+
+    Headers are stored sorted by key in a structured numpy array, so that the
+    index can be memory-mapped and searched without loading it into memory.
+    CRSs are stored once in a separate JSON file.
+
+    Args:
+        - path: directory to write index to. Created if it doesn't exist.
+        - headers: asset headers
+    """
+    headers = sorted(headers, key=lambda h: h.key.encode('utf-8'))
+
+    crs_list = []
+    crs_ids = {}
+    for header in headers:
+        wkt = header.crs.to_wkt()
+        if wkt not in crs_ids:
+            crs_ids[wkt] = len(crs_list)
+            crs_list.append(wkt)
+
+    keys = [h.key.encode('utf-8') for h in headers]
+    arr = np.zeros(len(headers), dtype=_dtype(max(map(len, keys), default=1)))
+    arr['key'] = keys
+    arr['crs'] = [crs_ids[h.crs.to_wkt()] for h in headers]
+    arr['transform'] = [tuple(h.transform)[:6] for h in headers]
+    arr['width'] = [h.width for h in headers]
+    arr['height'] = [h.height for h in headers]
+    for i, header in enumerate(headers):
+        arr['overviews'][i, :len(header.overviews)] = header.overviews
+    arr['image_wgs_bounds'] = [h.image_wgs_bounds for h in headers]
+    arr['map_bounds'] = [h.map_bounds for h in headers]
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, HEADERS_FILENAME), arr)
+    with open(os.path.join(path, META_FILENAME), 'w') as f:
+        json.dump({'crs': crs_list}, f)
+
+
+class HeaderIndex:
+    """Memory-mapped index of asset headers
+
+    Gives the information `tile` needs about an asset, like its bounds and map
+    extent, without opening the remote file.
+
+    Args:
+        - path: directory written by `write_header_index` or
+          `usgs-topo-tiler index`
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._arr = np.load(
+            os.path.join(path, HEADERS_FILENAME), mmap_mode='r')
+        with open(os.path.join(path, META_FILENAME)) as f:
+            self._crs = [CRS.from_wkt(wkt) for wkt in json.load(f)['crs']]
+
+    def __len__(self):
+        return len(self._arr)
+
+    def __contains__(self, address: str):
+        return self._find(address) is not None
+
+    def keys(self) -> np.ndarray:
+        """Sorted keys of the index, as a numpy array of strings"""
+        return np.char.decode(self._arr['key'], 'utf-8')
+
+    def get(self, address: str) -> Optional[AssetHeader]:
+        """Look up header by S3 key or asset address"""
+        idx = self._find(address)
+        if idx is None:
+            return None
+
+        row = self._arr[idx]
+        n_overviews = int(np.count_nonzero(row['overviews']))
+        return AssetHeader(
+            key=row['key'].decode('utf-8'),
+            crs=self._crs[row['crs']],
+            transform=Affine(*row['transform'].tolist()),
+            width=int(row['width']),
+            height=int(row['height']),
+            overviews=row['overviews'][:n_overviews].tolist(),
+            image_wgs_bounds=row['image_wgs_bounds'].tolist(),
+            map_bounds=row['map_bounds'].tolist())
+
+    def _find(self, address: str) -> Optional[int]:
+        key = address_to_key(address).encode('utf-8')
+        keys = self._arr['key']
+        idx = int(np.searchsorted(keys, key))
+        if idx < len(keys) and keys[idx] == key:
+            return idx
+
+        return None
+
+
+def _dtype(key_length: int) -> np.dtype:
+    return np.dtype([
+        ('key', f'S{key_length}'),
+        ('crs', 'u2'),
+        ('transform', 'f8', (6, )),
+        ('width', 'i4'),
+        ('height', 'i4'),
+        ('overviews', 'i4', (MAX_OVERVIEWS, )),
+        ('image_wgs_bounds', 'f8', (4, )),
+        ('map_bounds', 'f8', (4, ))])
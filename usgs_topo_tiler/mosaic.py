@@ -0,0 +1,228 @@
+"""usgs_topo_tiler.mosaic: Create mercator tile from a MosaicJSON of assets."""
+from concurrent import futures
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import mercantile
+import numpy as np
+from rio_tiler.constants import MAX_THREADS
+from rio_tiler.errors import TileOutsideBounds
+
+from usgs_topo_tiler.stats import Stats
+from usgs_topo_tiler.usgs_topo import tile
+
+# Counters of mosaic_tile calls, asset reads, and reads skipped because the
+# tile was already filled by higher-priority assets
+mosaic_stats = Stats('tiles', 'reads', 'skipped')
+
+
+def find_quadkeys(mercator_tile: mercantile.Tile,
+                  quadkey_zoom: int) -> List[str]:
+    """Quadkeys at quadkey_zoom that intersect mercator_tile, sorted"""
+    if mercator_tile.z == quadkey_zoom:
+        return [mercantile.quadkey(mercator_tile)]
+
+    if mercator_tile.z > quadkey_zoom:
+        return [mercantile.quadkey(mercator_tile)[:quadkey_zoom]]
+
+    return sorted(
+        mercantile.quadkey(t)
+        for t in mercantile.children(mercator_tile, zoom=quadkey_zoom))
+
+
+def get_assets(mosaic: Dict, tile_x: int, tile_y: int,
+               tile_z: int) -> List[str]:
+    """Assets for mercator tile in order of priority
+
+    Args:
+        - mosaic: MosaicJSON as dict, or object with an
+          `assets_for_tile(z, x, y)` method like
+          `usgs_topo_tiler.mosaic_index.MosaicIndex`
+        - tile_x: Mercator tile X index
+        - tile_y: Mercator tile Y index
+        - tile_z: Mercator tile ZOOM level
+    """
+    if hasattr(mosaic, 'assets_for_tile'):
+        return mosaic.assets_for_tile(tile_z, tile_x, tile_y)
+
+    quadkey_zoom = mosaic.get('quadkey_zoom') or mosaic['minzoom']
+    mercator_tile = mercantile.Tile(tile_x, tile_y, tile_z)
+
+    n_children = 4 ** max(quadkey_zoom - tile_z, 0)
+    if n_children > len(mosaic['tiles']):
+        # Cheaper to scan the mosaic than to enumerate all children
+        prefix = mercantile.quadkey(mercator_tile)
+        quadkeys = sorted(k for k in mosaic['tiles'] if k.startswith(prefix))
+    else:
+        quadkeys = find_quadkeys(mercator_tile, quadkey_zoom)
+
+    # Remove duplicates while keeping order
+    assets = {}
+    for quadkey in quadkeys:
+        assets.update(dict.fromkeys(mosaic['tiles'].get(quadkey, [])))
+
+    return list(assets)
+
+
+class Compositor:
+    """Fill tile with pixels of assets fed in order of priority
+
+    Pixels already filled by an earlier asset are never overwritten.
+    """
+    def __init__(self):
+        self.data = None
+        self.mask = None
+
+    @property
+    def is_done(self) -> bool:
+        """Whether every pixel of the tile has been filled"""
+        return self.mask is not None and bool(self.mask.all())
+
+    def feed(self, data: np.ndarray, mask: np.ndarray):
+        if self.data is None:
+            self.data = data.copy()
+            self.mask = mask.copy()
+            return
+
+        fill = (self.mask == 0) & (mask != 0)
+        self.data[:, fill] = data[:, fill]
+        self.mask[fill] = mask[fill]
+
+
+def mosaic_tile(
+        mosaic: Dict,
+        tile_x: int,
+        tile_y: int,
+        tile_z: int,
+        tilesize: int = 256,
+        threads: int = MAX_THREADS,
+        tiler: Callable[..., Tuple[np.ndarray, np.ndarray]] = tile,
+        executor: Optional[futures.Executor] = None,
+        **kwargs: Any,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Create mercator tile from the assets of a MosaicJSON.
+
+    Assets are read concurrently and composited in the order they're listed in
+    the mosaic. As soon as every pixel of the tile is filled, reads of the
+    remaining, lower-priority assets are cancelled.
+
+    Attributes
+    ----------
+        mosaic : dict or MosaicIndex
+            MosaicJSON, with assets encoded by `usgs-topo-tiler mosaic-bulk`
+            or plain urls, or object with an `assets_for_tile(z, x, y)`
+            method like `usgs_topo_tiler.mosaic_index.MosaicIndex`.
+        tile_x : int
+            Mercator tile X index.
+        tile_y : int
+            Mercator tile Y index.
+        tile_z : int
+            Mercator tile ZOOM level.
+        tilesize : int, optional (default: 256)
+            Output image size.
+        threads : int, optional (default: rio_tiler.constants.MAX_THREADS)
+            Maximum number of concurrent asset reads. If <= 1, assets are read
+            one after another in the calling thread.
+        tiler : callable, optional (default: usgs_topo_tiler.usgs_topo.tile)
+            Function to read one asset, with the signature of `tile`.
+        executor : concurrent.futures.Executor, optional
+            Executor to submit reads to. By default a new thread pool with
+            `threads` workers is used for each call.
+        kwargs: dict, optional
+            These will be passed to the tiler function.
+    Returns
+    -------
+        data : np ndarray
+        mask : np array
+    """
+    assets = get_assets(mosaic, tile_x, tile_y, tile_z)
+    if not assets:
+        raise TileOutsideBounds(
+            f'No assets found for tile {tile_z}/{tile_x}/{tile_y}')
+
+    mosaic_stats.incr('tiles')
+
+    def _read(asset):
+        mosaic_stats.incr('reads')
+        return tiler(
+            asset, tile_x, tile_y, tile_z, tilesize=tilesize, **kwargs)
+
+    if threads is not None and threads <= 1 and executor is None:
+        tasks = (_DeferredRead(_read, asset) for asset in assets)
+        return _composite(tasks, len(assets), tile_x, tile_y, tile_z)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = futures.ThreadPoolExecutor(max_workers=threads)
+
+    tasks = [executor.submit(_read, asset) for asset in assets]
+    try:
+        return _composite(tasks, len(assets), tile_x, tile_y, tile_z)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        if own_executor:
+            # Don't wait for reads that have already started
+            executor.shutdown(wait=False)
+
+
+class _DeferredRead:
+    """Serial stand-in for a future"""
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def result(self):
+        return self.func(*self.args)
+
+
+class _TileComposite:
+    """Composite of a mosaic tile, fed reads of its assets in order of priority
+
+    Shared by `mosaic_tile` and `aio.AsyncTiler.mosaic_tile`, which differ only
+    in how they wait for reads.
+    """
+    def __init__(self, n_assets: int, tile_x: int, tile_y: int, tile_z: int):
+        self.compositor = Compositor()
+        self.n_assets = n_assets
+        self.n_done = 0
+        self.tile = (tile_x, tile_y, tile_z)
+
+    def add(self, result: Callable[[], Tuple[np.ndarray, np.ndarray]]) -> bool:
+        """Feed result of a finished read, unless it's outside bounds
+
+        Returns whether the tile is filled, so that the remaining reads can be
+        cancelled.
+        """
+        self.n_done += 1
+        try:
+            data, mask = result()
+        except TileOutsideBounds:
+            return False
+
+        self.compositor.feed(data, mask)
+        return self.compositor.is_done
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Data and mask of tile"""
+        mosaic_stats.incr('skipped', self.n_assets - self.n_done)
+
+        if self.compositor.data is None:
+            tile_x, tile_y, tile_z = self.tile
+            raise TileOutsideBounds(
+                f'Tile {tile_z}/{tile_x}/{tile_y} is outside bounds of all '
+                'assets')
+
+        return self.compositor.data, self.compositor.mask
+
+
+def _composite(tasks: Iterable, n_tasks: int, tile_x: int, tile_y: int,
+               tile_z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Feed results of tasks in order until tile is filled"""
+    composite = _TileComposite(n_tasks, tile_x, tile_y, tile_z)
+    for task in tasks:
+        if composite.add(task.result):
+            break
+
+    return composite.result()
@@ -0,0 +1,391 @@
+"""usgs_topo_tiler.mosaic_index: Binary MosaicJSON with an asset table."""
+import gzip
+import itertools
+import json
+import math
+import os
+import time
+from array import array
+from json.encoder import encode_basestring_ascii
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+META_FILENAME = 'meta.json'
+QUADKEYS_FILENAME = 'quadkeys.npy'
+OFFSETS_FILENAME = 'offsets.npy'
+ASSET_IDS_FILENAME = 'asset_ids.npy'
+ASSETS_FILENAME = 'assets.npy'
+ORDER_FILENAME = 'order.npy'
+
+
+def quadkey_to_int(quadkey: str) -> int:
+    """Integer with the digits of quadkey in base 4
+
+    Quadkeys of the same zoom sort the same way as strings and as integers,
+    and the children of a tile at a higher zoom are a contiguous range.
+    """
+    return int(quadkey or '0', 4)
+
+
+def tile_to_int(tile_x: int, tile_y: int) -> int:
+    """Same as `quadkey_to_int(mercantile.quadkey(tile))`, without strings
+
+    Each quadkey digit is a bit of y and a bit of x, so the integer is the bits
+    of x and y interleaved. Tiles up to zoom 32 are supported.
+    """
+    return (_spread_bits(tile_y) << 1) | _spread_bits(tile_x)
+
+
+def _spread_bits(n: int) -> int:
+    """Insert a zero bit before each of the lower 32 bits of n"""
+    n &= 0xFFFFFFFF
+    n = (n | (n << 16)) & 0x0000FFFF0000FFFF
+    n = (n | (n << 8)) & 0x00FF00FF00FF00FF
+    n = (n | (n << 4)) & 0x0F0F0F0F0F0F0F0F
+    n = (n | (n << 2)) & 0x3333333333333333
+    return (n | (n << 1)) & 0x5555555555555555
+
+
+def int_to_quadkey(key: int, zoom: int) -> str:
+    """Inverse of quadkey_to_int for a quadkey of zoom"""
+    return np.base_repr(key, 4).zfill(zoom) if zoom else ''
+
+
+def encode_asset(asset: str):
+    """Split asset string into url and map bounds
+
+    Assets encoded by `usgs-topo-tiler mosaic-bulk` as JSON with `url` and
+    `map_bounds` keys are split. Other assets, like plain urls, are kept as is
+    with NaN map bounds.
+
+    Returns:
+        (url, map_bounds)
+    """
+    try:
+        data = json.loads(asset)
+        url = data['url']
+        map_bounds = [float(x) for x in data['map_bounds']]
+    except (ValueError, TypeError, KeyError):
+        return asset, [np.nan] * 4
+
+    if len(map_bounds) != 4 or decode_asset(url, map_bounds) != asset:
+        return asset, [np.nan] * 4
+
+    return url, map_bounds
+
+
+def decode_asset(url: str, map_bounds) -> str:
+    """Asset string from url and map bounds, inverse of encode_asset"""
+    west, south, east, north = map(float, map_bounds)
+    if not math.isfinite(west + south + east + north):
+        if math.isnan(west) or math.isnan(south) or math.isnan(
+                east) or math.isnan(north):
+            return url
+
+        data = {'url': url, 'map_bounds': [west, south, east, north]}
+        return json.dumps(data, separators=(',', ':'))
+
+    # Same as json.dumps with compact separators, which is slow for one asset
+    return '{"url":%s,"map_bounds":[%r,%r,%r,%r]}' % (
+        encode_basestring_ascii(url), west, south, east, north)
+
+
+def write_mosaic_index(path: str, mosaic: Dict):
+    """Write MosaicJSON to a binary mosaic directory
+
+    Each distinct asset is stored once in a table of url and map bounds, and
+    each quadkey points to a range of asset ids. The prefix shared by all urls
+    is stored once. Quadkeys are stored sorted as integers, see
+    `quadkey_to_int`. Map bounds are stored as float32 when that is lossless,
+    otherwise as float64, so that `MosaicIndex.to_mosaicjson` gives back the
+    same MosaicJSON.
+
+    Args:
+        - path: directory to write mosaic to. Created if it doesn't exist.
+        - mosaic: MosaicJSON as dict
+    """
+    arrays, unique_assets = _index_tiles(mosaic)
+
+    encoded = [encode_asset(asset) for asset in unique_assets]
+    # Urls mostly share the S3 path of the GeoTIFFs, which is stored once
+    url_prefix = os.path.commonprefix([url for url, _ in encoded])
+    urls = [url[len(url_prefix):].encode('utf-8') for url, _ in encoded]
+    map_bounds = np.array([bounds for _, bounds in encoded],
+                          dtype=np.float64).reshape(-1, 4)
+    bounds_dtype = 'f4'
+    if not np.array_equal(
+            map_bounds.astype(np.float32), map_bounds, equal_nan=True):
+        bounds_dtype = 'f8'
+
+    assets = np.zeros(
+        len(urls), dtype=_asset_dtype(max(map(len, urls), default=1),
+                                      bounds_dtype))
+    assets['url'] = urls
+    assets['map_bounds'] = map_bounds
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, QUADKEYS_FILENAME), arrays['quadkeys'])
+    np.save(os.path.join(path, OFFSETS_FILENAME), arrays['offsets'])
+    np.save(os.path.join(path, ASSET_IDS_FILENAME), arrays['asset_ids'])
+    np.save(os.path.join(path, ASSETS_FILENAME), assets)
+    np.save(os.path.join(path, ORDER_FILENAME), arrays['order'])
+
+    meta = _metadata(mosaic)
+    meta['url_prefix'] = url_prefix
+    with open(os.path.join(path, META_FILENAME), 'w') as f:
+        json.dump(meta, f)
+
+
+def load_mosaic_index(path: str) -> 'MosaicIndex':
+    """Load MosaicJSON or binary mosaic as a MosaicIndex
+
+    Directories written by `write_mosaic_index` are memory-mapped, which is
+    the fastest way to start serving a mosaic. MosaicJSON files, optionally
+    gzipped, are parsed and loaded into memory with
+    `MosaicIndex.from_mosaicjson`, so they take at least as long as
+    `json.load`.
+
+    The time taken is stored in the `load_time` attribute of the index, and
+    the resident memory that loading added to the process, in bytes, in
+    `load_rss`, or None where it can't be measured, see `resident_memory`.
+    Pages of a memory-mapped index only become resident as lookups read them.
+
+    Args:
+        - path: .json or .json.gz MosaicJSON, or binary mosaic directory
+    """
+    rss_before = resident_memory()
+    start = time.perf_counter()
+    if os.path.isdir(path):
+        index = MosaicIndex(path)
+    else:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            index = MosaicIndex.from_mosaicjson(json.loads(f.read()))
+
+    index.load_time = time.perf_counter() - start
+    rss_after = resident_memory()
+    if rss_before is not None and rss_after is not None:
+        index.load_rss = rss_after - rss_before
+    return index
+
+
+def resident_memory() -> Optional[int]:
+    """Resident memory of this process in bytes
+
+    Read from /proc/self/statm where available. Elsewhere this is the peak
+    resident memory, from getrusage, or None where that isn't available
+    either, like on Windows.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 2**10
+
+
+class MosaicIndex:
+    """Index of the assets of each quadkey of a mosaic
+
+    Finds the assets of a mercator tile with binary search on the sorted
+    quadkeys. Can be used in place of a MosaicJSON dict in
+    `usgs_topo_tiler.mosaic.mosaic_tile`.
+
+    Args:
+        - path: directory written by `write_mosaic_index`, which is
+          memory-mapped. Use `from_mosaicjson` to create an index in memory.
+    """
+    load_time = None
+    load_rss = None
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILENAME)) as f:
+            meta = json.load(f)
+
+        def _load(filename):
+            # Plain array view of the memory map, which is faster to index
+            return np.asarray(
+                np.load(os.path.join(path, filename), mmap_mode='r'))
+
+        self._set_metadata(meta)
+        self._url_prefix = meta['url_prefix']
+        self._quadkeys = _load(QUADKEYS_FILENAME)
+        self._offsets = _load(OFFSETS_FILENAME)
+        self._asset_ids = _load(ASSET_IDS_FILENAME)
+        self._order = _load(ORDER_FILENAME)
+        self._assets = _load(ASSETS_FILENAME)
+        # Field views, faster to index one asset at a time than the table
+        self._urls = self._assets['url']
+        self._map_bounds = self._assets['map_bounds']
+        self._pool = None
+        self._pool_offsets = None
+        self._decoded = {}
+
+    @classmethod
+    def from_mosaicjson(cls, mosaic: Dict) -> 'MosaicIndex':
+        """Create index in memory from MosaicJSON dict
+
+        Assets are kept as encoded in the MosaicJSON, in one pool of bytes
+        with the offset of each distinct asset.
+        """
+        arrays, unique_assets = _index_tiles(mosaic)
+        encoded = [asset.encode('utf-8') for asset in unique_assets]
+
+        index = cls.__new__(cls)
+        index.path = None
+        index._set_metadata(_metadata(mosaic))
+        index._quadkeys = arrays['quadkeys']
+        index._offsets = arrays['offsets']
+        index._asset_ids = arrays['asset_ids']
+        index._order = arrays['order']
+        index._assets = None
+        index._pool = b''.join(encoded)
+        # Indexed one asset at a time, which is faster than with numpy
+        index._pool_offsets = array(
+            'q', itertools.accumulate(map(len, encoded), initial=0))
+        return index
+
+    def _set_metadata(self, meta):
+        self.metadata = meta['mosaic']
+        self.quadkey_zoom = meta['quadkey_zoom']
+        self._keys = meta['keys']
+
+    def __len__(self):
+        return len(self._quadkeys)
+
+    def assets_for_tile(self, tile_z: int, tile_x: int,
+                        tile_y: int) -> List[str]:
+        """Assets for mercator tile in order of priority
+
+        Same as `usgs_topo_tiler.mosaic.get_assets` with the MosaicJSON.
+        """
+        if tile_z > self.quadkey_zoom:
+            # Parent at quadkey_zoom
+            tile_x >>= tile_z - self.quadkey_zoom
+            tile_y >>= tile_z - self.quadkey_zoom
+            tile_z = self.quadkey_zoom
+
+        shift = 2 * (self.quadkey_zoom - tile_z)
+        key = tile_to_int(tile_x, tile_y)
+        start = key << shift
+        stop = (key + 1) << shift
+
+        # Quadkeys at quadkey_zoom within tile are a contiguous range
+        lo = self._quadkeys.searchsorted(np.uint64(start))
+        hi = self._quadkeys.searchsorted(np.uint64(stop))
+        ids = self._asset_ids[self._offsets[lo]:self._offsets[hi]].tolist()
+
+        # Remove duplicates while keeping order
+        return self._decode(list(dict.fromkeys(ids)))
+
+    def to_mosaicjson(self) -> Dict:
+        """MosaicJSON as dict, the same as the one the index was written from
+        """
+        assets = self._decode(range(self._n_assets))
+        offsets = self._offsets.tolist()
+        asset_ids = self._asset_ids.tolist()
+        quadkeys = self._quadkeys.tolist()
+
+        tiles = {}
+        for idx in self._order.tolist():
+            quadkey = int_to_quadkey(quadkeys[idx], self.quadkey_zoom)
+            tiles[quadkey] = [
+                assets[i] for i in asset_ids[offsets[idx]:offsets[idx + 1]]]
+
+        return {
+            key: tiles if key == 'tiles' else self.metadata[key]
+            for key in self._keys}
+
+    @property
+    def _n_assets(self) -> int:
+        if self._pool is not None:
+            return len(self._pool_offsets) - 1
+
+        return len(self._assets)
+
+    def _decode(self, asset_ids: Iterable[int]) -> List[str]:
+        """Asset strings of asset ids"""
+        if self._pool is not None:
+            pool = self._pool
+            offsets = self._pool_offsets
+            return [
+                pool[offsets[i]:offsets[i + 1]].decode('utf-8')
+                for i in asset_ids]
+
+        # Assets are decoded the first time they are looked up, and kept, up
+        # to one string per asset of the table
+        decoded = self._decoded
+        assets = []
+        for i in asset_ids:
+            asset = decoded.get(i)
+            if asset is None:
+                url = self._url_prefix + self._urls[i].decode('utf-8')
+                asset = decoded[i] = decode_asset(
+                    url, self._map_bounds[i].tolist())
+
+            assets.append(asset)
+
+        return assets
+
+
+def _index_tiles(mosaic: Dict):
+    """Sorted quadkeys and asset ids of the tiles of a MosaicJSON
+
+    Tiles are read once, in the order of the MosaicJSON, and the arrays are
+    then sorted by quadkey with numpy.
+
+    Returns:
+        (arrays, unique_assets): dict of `quadkeys`, `offsets`, `asset_ids` and
+        `order` arrays, and list of distinct assets in order of asset id.
+        `order` is the sorted position of each quadkey, in the order of the
+        MosaicJSON.
+    """
+    asset_ids = {}
+    keys = []
+    counts = []
+    ids = []
+    for quadkey, assets in mosaic['tiles'].items():
+        keys.append(quadkey_to_int(quadkey))
+        counts.append(len(assets))
+        ids += [
+            asset_ids.setdefault(asset, len(asset_ids)) for asset in assets]
+
+    keys = np.array(keys, dtype=np.uint64)
+    counts = np.array(counts, dtype=np.int64)
+    ids = np.array(ids, dtype=np.uint32)
+    order = np.argsort(keys, kind='stable')
+
+    # Asset ids of each tile, in sorted order of tiles
+    starts = np.cumsum(counts) - counts
+    sorted_counts = counts[order]
+    offsets = np.zeros(len(keys) + 1, dtype=np.uint32)
+    np.cumsum(sorted_counts, out=offsets[1:])
+    positions = np.repeat(starts[order] - offsets[:-1], sorted_counts)
+    positions += np.arange(len(ids))
+
+    arrays = {
+        'quadkeys': keys[order],
+        'offsets': offsets,
+        'asset_ids': ids[positions],
+        'order': np.argsort(order).astype(np.uint32)}
+    return arrays, list(asset_ids)
+
+
+def _metadata(mosaic: Dict) -> Dict:
+    return {
+        'mosaic': {k: v for k, v in mosaic.items() if k != 'tiles'},
+        'keys': list(mosaic),
+        'quadkey_zoom': mosaic.get('quadkey_zoom') or mosaic['minzoom']}
+
+
+def _asset_dtype(url_length: int, bounds_dtype: str) -> np.dtype:
+    return np.dtype([('url', f'S{url_length}'),
+                     ('map_bounds', bounds_dtype, (4, ))])
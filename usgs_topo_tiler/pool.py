@@ -0,0 +1,149 @@
+"""usgs_topo_tiler.pool: Reusable pool of open rasterio datasets."""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+import rasterio
+from rasterio.errors import RasterioError
+from rasterio.io import DatasetReader
+
+from usgs_topo_tiler.stats import Stats
+
+
+class DatasetPool:
+    """Bounded LRU pool of open dataset handles
+
+    Opening a remote COG requires fetching its header with several ranged
+    requests. Neighboring tiles are usually requested from the same asset in a
+    burst, so idle handles are kept open and handed out again instead of
+    reopening the file for every tile.
+
+    A handle is only ever used by one caller at a time: `open` checks a handle
+    out of the pool and returns it when the block exits. Up to `maxsize` idle
+    handles are kept; the least recently used handle is closed when the pool is
+    full, and handles idle for longer than `ttl` seconds are closed on the next
+    pool access.
+
+    The pool is per-process. If it is used after a fork, handles inherited from
+    the parent process are discarded.
+
+    Args:
+        - maxsize: maximum number of idle handles to keep open
+        - ttl: seconds an idle handle may be kept before it is closed. None
+          keeps handles until they're evicted by size.
+        - opener: function to open a dataset from an address
+    """
+    def __init__(
+            self,
+            maxsize: int = 32,
+            ttl: float = 300,
+            opener: Callable[[str], DatasetReader] = rasterio.open):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.opener = opener
+        self.stats = Stats('hits', 'misses', 'evictions')
+
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counter = itertools.count()
+        # (address, sequence number) -> (dataset, time released to pool)
+        self._idle = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._idle)
+
+    @contextmanager
+    def open(self, address: str) -> Iterator[DatasetReader]:
+        """Check out an open dataset for address
+
+        The handle is returned to the pool when the block exits, also if it
+        raises an expected error like `TileOutsideBounds`. If the block raises
+        an I/O or rasterio error, the handle is closed instead, since it might
+        be in a bad state.
+        """
+        src_dst = self._acquire(address)
+        try:
+            yield src_dst
+        except (OSError, RasterioError):
+            src_dst.close()
+            raise
+        except BaseException:
+            self._release(address, src_dst)
+            raise
+
+        self._release(address, src_dst)
+
+    def clear(self):
+        """Close all idle handles"""
+        with self._lock:
+            idle = list(self._idle.values())
+            self._idle.clear()
+
+        for src_dst, _ in idle:
+            src_dst.close()
+
+    def _acquire(self, address: str) -> DatasetReader:
+        with self._lock:
+            self._check_pid()
+            expired = self._pop_expired()
+
+            # Most recently released handle for this address
+            key = next(
+                (k for k in reversed(self._idle) if k[0] == address), None)
+            src_dst = self._idle.pop(key)[0] if key else None
+
+        self._close_evicted(expired)
+
+        if src_dst is not None:
+            self.stats.incr('hits')
+            return src_dst
+
+        self.stats.incr('misses')
+        return self.opener(address)
+
+    def _release(self, address: str, src_dst: DatasetReader):
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Handle was opened in a parent process; don't keep it
+                evicted = [src_dst]
+            else:
+                key = (address, next(self._counter))
+                self._idle[key] = (src_dst, time.monotonic())
+                evicted = self._pop_expired()
+                while len(self._idle) > self.maxsize:
+                    evicted.append(self._idle.popitem(last=False)[1][0])
+
+        self._close_evicted(evicted)
+
+    def _pop_expired(self):
+        """Remove handles past their ttl. Must be called with lock held."""
+        if self.ttl is None:
+            return []
+
+        deadline = time.monotonic() - self.ttl
+        expired = [
+            key for key, (_, released) in self._idle.items()
+            if released < deadline]
+        return [self._idle.pop(key)[0] for key in expired]
+
+    def _check_pid(self):
+        """Reset pool after fork. Must be called with lock held."""
+        pid = os.getpid()
+        if pid != self._pid:
+            # Don't close handles owned by the parent process
+            self._idle.clear()
+            self._pid = pid
+
+    def _close_evicted(self, evicted):
+        for src_dst in evicted:
+            self.stats.incr('evictions')
+            src_dst.close()
+
+
+# Default pool used by `usgs_topo.tile`
+dataset_pool = DatasetPool()
@@ -1,4 +1,7 @@
+from .index import index
+from .ingest import ingest
 from .list_s3 import list_s3
 from .metadata import metadata
 from .mosaic import mosaic
 from .mosaic_bulk import mosaic_bulk
+from .mosaic_merge import mosaic_merge
@@ -0,0 +1,65 @@
+import sys
+from concurrent import futures
+
+import click
+import rasterio
+
+from usgs_topo_tiler.header_index import read_header, write_header_index
+from usgs_topo_tiler.scripts.list_s3 import read_s3_list
+
+
+@click.command()
+@click.option(
+    '--s3-list-path',
+    type=click.Path(exists=True, readable=True),
+    required=True,
+    help='Path to txt file of list of s3 GeoTIFF files, from list-s3')
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(file_okay=False, writable=True),
+    required=True,
+    help='Directory to write index to')
+@click.option(
+    '--url-prefix',
+    type=str,
+    default='s3://prd-tnm/',
+    show_default=True,
+    help='Prefix to prepend to each key to get the url of the file')
+@click.option(
+    '--threads',
+    type=int,
+    default=32,
+    show_default=True,
+    help='Number of files to read headers from concurrently')
+def index(s3_list_path, output, url_prefix, threads):
+    """Create index of GeoTIFF headers from S3 listing
+
+    The index stores the CRS, transform, size, overviews, WGS84 bounds and
+    estimated map bounds of each file, so that tiles can be created without
+    opening files to find their geometry.
+    """
+    keys = [key for key in read_s3_list(s3_list_path) if key.endswith('.tif')]
+
+    def _read(key):
+        with rasterio.open(f'{url_prefix}{key}') as src_dst:
+            return read_header(src_dst, key)
+
+    headers = []
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        tasks = {executor.submit(_read, key): key for key in keys}
+        for i, task in enumerate(futures.as_completed(tasks)):
+            if (i + 1) % 1000 == 0:
+                print(f'Read {i + 1}/{len(keys)} headers', file=sys.stderr)
+
+            try:
+                headers.append(task.result())
+            except rasterio.RasterioIOError as e:
+                print(f'Skipping {tasks[task]}: {e}', file=sys.stderr)
+
+    write_header_index(output, headers)
+    print(f'Wrote {len(headers)} headers to {output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    index()
@@ -0,0 +1,71 @@
+import sys
+
+import click
+
+from usgs_topo_tiler.scripts.mosaic_bulk import (
+    construct_s3_tif_url, filter_cog_exists, load_metadata, load_s3_list)
+
+# Columns of the bulk metadata kept in the cache
+COLUMNS = [
+    'cell_id', 'scale', 'year', 'woodland_tint', 'orthophoto',
+    'scanner_resolution', 'w_long', 's_lat', 'e_long', 'n_lat']
+
+
+@click.command()
+@click.option(
+    '--meta-path',
+    type=click.Path(exists=True, readable=True),
+    required=True,
+    help='Path to csv file of USGS bulk metadata dump from S3')
+@click.option(
+    '--s3-list-path',
+    type=click.Path(exists=True, readable=True),
+    required=False,
+    default=None,
+    show_default=True,
+    help=
+    'Path to txt file of list of s3 GeoTIFF files. If provided, only files in the list are kept.'
+)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+    help='Path to write Parquet cache to')
+@click.option(
+    '--row-group-size',
+    type=int,
+    default=16384,
+    show_default=True,
+    help='Number of rows per Parquet row group')
+def ingest(meta_path, s3_list_path, output, row_group_size):
+    """Convert bulk metadata to a Parquet cache for mosaic-bulk
+
+    Parses the CSV once, computes S3 GeoTIFF keys, and optionally keeps only
+    files that exist on S3, so that mosaic-bulk --cache-path can start
+    filtering right away.
+    """
+    df = load_metadata(meta_path)
+    df['s3_tif'] = construct_s3_tif_url(df['download_product_s3'])
+
+    if s3_list_path:
+        s3_files_df = load_s3_list(s3_list_path)
+        df = filter_cog_exists(df, s3_files_df)
+
+    df = to_cache_frame(df)
+    df.to_parquet(output, index=False, row_group_size=row_group_size)
+    print(f'Wrote {len(df)} rows to {output}', file=sys.stderr)
+
+
+def to_cache_frame(df):
+    """Typed DataFrame of the columns stored in the cache"""
+    out = df[['s3_tif', *COLUMNS]].reset_index(drop=True)
+    out['woodland_tint'] = out['woodland_tint'].astype('category')
+    out['orthophoto'] = out['orthophoto'].astype('string')
+    out['scale'] = out['scale'].astype('int32')
+    out['year'] = out['year'].astype('float64')
+    return out
+
+
+if __name__ == '__main__':
+    ingest()
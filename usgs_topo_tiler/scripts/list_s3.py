@@ -1,9 +1,29 @@
+import contextlib
+import gzip
+import os
 import sys
+from concurrent import futures
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
 
 import boto3
 import click
 
 
+class S3Object(NamedTuple):
+    """Snapshot record of a file on S3
+
+    Attributes:
+        - key: object key
+        - size: size in bytes
+        - etag: ETag, without quotes
+        - last_modified: time of last modification in ISO 8601 format
+    """
+    key: str
+    size: int
+    etag: str
+    last_modified: str
+
+
 @click.command()
 @click.option(
     '-b',
@@ -27,29 +47,279 @@ import click
     help=
     'Suffix/file extension to filter for. To turn off filtering, pass None or an empty string'
 )
-def list_s3(bucket, prefix, ext):
+@click.option(
+    '--workers',
+    type=int,
+    default=1,
+    show_default=True,
+    help=
+    'Number of subdirectories of the prefix to list concurrently. With 1, the prefix is listed in a single sequence of requests.'
+)
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    default='-',
+    show_default=True,
+    help='Path to write listing to. Compressed with gzip if it ends in .gz')
+@click.option(
+    '--details/--no-details',
+    default=False,
+    show_default=True,
+    help=
+    'Write size and ETag of each file as tab-separated columns after key, also with --previous'
+)
+@click.option(
+    '--snapshot',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=
+    'Path to write snapshot of key, size, ETag and last modified time of each file to. Compressed with gzip if it ends in .gz'
+)
+@click.option(
+    '--previous',
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    default=None,
+    help=
+    'Path to snapshot of an earlier listing, written with --snapshot. If provided, only files that were added, removed or modified since then are written, as tab-separated status and key.'
+)
+def list_s3(bucket, prefix, ext, workers, output, details, snapshot, previous):
     """Get listing of files on S3 with prefix and extension
+
+    Files are listed in key order, with or without --workers.
     """
-    s3 = boto3.resource('s3')
-    s3_bucket = s3.Bucket(bucket)
+    client = boto3.client('s3')
 
     if ext:
         ext = '.' + ext.lstrip('.')
     else:
         ext = ''
 
+    def format_record(record):
+        if details:
+            return f'{record.key}\t{record.size}\t{record.etag}\n'
+
+        return f'{record.key}\n'
+
+    # Snapshot is written to a temporary file, so that --previous can be the
+    # same path
+    tmp_path = f'{snapshot}.tmp' if snapshot else None
+    records = iter_records(client, bucket, prefix, ext, workers=workers)
+    try:
+        with contextlib.ExitStack() as stack:
+            f = stack.enter_context(open_output(output))
+
+            if snapshot:
+                snapshot_file = stack.enter_context(
+                    open_output(tmp_path, compress=snapshot.endswith('.gz')))
+                records = write_snapshot(records, snapshot_file)
+
+            if previous:
+                counts = {'added': 0, 'removed': 0, 'modified': 0}
+                changes = diff_snapshots(read_snapshot(previous), records)
+                for status, record in changes:
+                    counts[status] += 1
+                    f.write(f'{status}\t{format_record(record)}')
+
+                print(
+                    ', '.join(
+                        f'{n} {status}' for status, n in counts.items()),
+                    file=sys.stderr)
+
+            else:
+                for record in records:
+                    f.write(format_record(record))
+
+    except BaseException:
+        # Don't leave an incomplete snapshot behind
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if snapshot:
+        os.replace(tmp_path, snapshot)
+
+
+def iter_records(client, bucket: str, prefix: str, ext: str,
+                 workers: int = 1) -> Iterator[S3Object]:
+    """Iterate over records of files with prefix and extension, in key order
+
+    Args:
+        - client: boto3 S3 client
+        - bucket: bucket name
+        - prefix: prefix to list within
+        - ext: suffix of keys to keep
+        - workers: number of prefixes to list concurrently
+    """
     counter = 0
-    for item in s3_bucket.objects.filter(Prefix=prefix):
+    for item in iter_objects(client, bucket, prefix, workers=workers):
         counter += 1
         if counter % 5000 == 0:
             print(f'Found {counter} items so far', file=sys.stderr)
 
-        key = item.key
+        key = item['Key']
         if not key.endswith(ext):
             continue
 
-        # Write to stdout
-        print(key)
+        yield S3Object(
+            key=key,
+            size=item['Size'],
+            etag=item['ETag'].strip('"'),
+            last_modified=item['LastModified'].isoformat())
+
+
+def iter_objects(client, bucket: str, prefix: str,
+                 workers: int = 1) -> Iterator[Dict]:
+    """Iterate over objects with prefix, in key order
+
+    With more than one worker, common prefixes one level below `prefix` are
+    found first with a delimiter, and then listed concurrently.
+
+    Args:
+        - client: boto3 S3 client
+        - bucket: bucket name
+        - prefix: prefix to list within
+        - workers: number of prefixes to list concurrently
+
+    Yields:
+        Objects as returned by ListObjectsV2, with keys Key, Size, ETag and
+        LastModified
+    """
+    paginator = client.get_paginator('list_objects_v2')
+    if workers <= 1:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            yield from page.get('Contents', [])
+        return
+
+    top_objects = {}
+    common_prefixes = []
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/')
+    for page in pages:
+        for obj in page.get('Contents', []):
+            top_objects[obj['Key']] = obj
+        for common_prefix in page.get('CommonPrefixes', []):
+            common_prefixes.append(common_prefix['Prefix'])
+
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        tasks = {
+            p: executor.submit(list_objects, client, bucket, p)
+            for p in common_prefixes}
+
+        # Every key within a common prefix sorts in the same place relative to
+        # other keys as the prefix itself, so this is the order of a single
+        # listing
+        for name in sorted([*top_objects, *tasks]):
+            if name in tasks:
+                yield from tasks.pop(name).result()
+            else:
+                yield top_objects[name]
+
+
+def list_objects(client, bucket: str, prefix: str) -> List[Dict]:
+    """List all objects with prefix"""
+    paginator = client.get_paginator('list_objects_v2')
+    return [
+        obj for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+        for obj in page.get('Contents', [])]
+
+
+def write_snapshot(records: Iterable[S3Object], f) -> Iterator[S3Object]:
+    """Write records to snapshot file as they are iterated over"""
+    for record in records:
+        f.write('\t'.join(map(str, record)) + '\n')
+        yield record
+
+
+def read_snapshot(path) -> Iterator[S3Object]:
+    """Read records from snapshot written by list-s3 --snapshot"""
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        last_key = None
+        for line in f:
+            if not line.strip():
+                continue
+
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != len(S3Object._fields):
+                raise ValueError(
+                    f'{path} has {len(fields)} columns instead of '
+                    f'{len(S3Object._fields)}. Only snapshots written with '
+                    '--snapshot can be compared, not listings of keys, with '
+                    'or without --details')
+
+            key, size, etag, last_modified = fields
+            if last_key is not None and key <= last_key:
+                raise ValueError(f'Snapshot {path} is not sorted by key')
+
+            last_key = key
+            yield S3Object(key, int(size), etag, last_modified)
+
+
+def diff_snapshots(
+        previous: Iterable[S3Object],
+        current: Iterable[S3Object]) -> Iterator[Tuple[str, S3Object]]:
+    """Compare two snapshots sorted by key
+
+    Both snapshots are read once, in step, so neither is held in memory. A
+    file is modified if its size or ETag changed.
+
+    Args:
+        - previous: records of earlier snapshot, sorted by key
+        - current: records of later snapshot, sorted by key
+
+    Yields:
+        Tuples of status, one of `added`, `removed` or `modified`, and the
+        record, from the current snapshot unless removed, in key order
+    """
+    previous = iter(previous)
+    current = iter(current)
+    prev = next(previous, None)
+    cur = next(current, None)
+    while prev is not None or cur is not None:
+        if cur is None or (prev is not None and prev.key < cur.key):
+            yield 'removed', prev
+            prev = next(previous, None)
+        elif prev is None or cur.key < prev.key:
+            yield 'added', cur
+            cur = next(current, None)
+        else:
+            if (prev.size, prev.etag) != (cur.size, cur.etag):
+                yield 'modified', cur
+            prev = next(previous, None)
+            cur = next(current, None)
+
+
+def open_output(path, compress=None):
+    """Open path for writing text
+
+    Args:
+        - path: path, or - for stdout
+        - compress: whether to compress with gzip. By default, if path ends in
+          .gz
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+
+    if compress:
+        return gzip.open(path, 'wt')
+
+    return click.open_file(path, 'w')
+
+
+def read_s3_list(path) -> List[str]:
+    """Read keys from listing or snapshot written by list-s3
+
+    Args:
+        - path: path to listing, optionally compressed with gzip and with
+          tab-separated columns after the key
+
+    Returns:
+        keys
+    """
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        return [
+            line.split('\t', 1)[0].strip() for line in f if line.strip()]
 
 
 if __name__ == '__main__':
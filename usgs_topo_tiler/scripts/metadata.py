@@ -1,9 +1,19 @@
+import contextlib
+import itertools
 import json
 import math
+import os
 import sys
+from collections import deque
+from concurrent import futures
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TNM_URL = 'http://viewer.nationalmap.gov/tnmaccess/api/products'
+PAGE_SIZE = 1000
 
 
 @click.command()
@@ -14,35 +24,201 @@ import requests
     show_default=True,
     type=str,
     help='Bounding box. Must be provided in a string as "minx,miny,maxx,maxy"')
-def metadata(bbox):
+@click.option(
+    '--url',
+    type=str,
+    default=TNM_URL,
+    show_default=True,
+    help='URL of the TNM Access API products endpoint')
+@click.option(
+    '--threads',
+    type=int,
+    default=8,
+    show_default=True,
+    help='Number of pages to download concurrently')
+@click.option(
+    '--retries',
+    type=int,
+    default=5,
+    show_default=True,
+    help='Number of times to retry a failed request')
+@click.option(
+    '--backoff',
+    type=float,
+    default=1,
+    show_default=True,
+    help='Backoff factor in seconds between retries')
+@click.option(
+    '-o',
+    '--output',
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    default='-',
+    show_default=True,
+    help='Path to write newline-delimited JSON of metadata to')
+@click.option(
+    '--checkpoint',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=
+    'Path to file recording the pages written to --output so far. If it exists, the download resumes after those pages, dropping anything written to --output after them.'
+)
+def metadata(bbox, url, threads, retries, backoff, output, checkpoint):
     """Download Topo metadata
     """
-    url = 'http://viewer.nationalmap.gov/tnmaccess/api/products'
+    if checkpoint and output == '-':
+        raise ValueError('--checkpoint requires --output')
+
     params = {
         'datasets': 'Historical Topographic Maps',
         'prodFormats': 'GeoTIFF',
-        'prodExtents': '7.5 x 7.5 minute',
-        'max': 1}
+        'prodExtents': '7.5 x 7.5 minute'}
 
     if bbox:
         params['bbox'] = bbox
 
-    # Initial request to get total number of results
-    r = requests.get(url, params=params)
-    total = r.json()['total']
+    session = make_session(threads, retries=retries, backoff_factor=backoff)
+
+    state = None
+    offset = None
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            state = json.load(f)
+
+        if state['url'] != url or state['params'] != params:
+            raise ValueError(
+                f'Checkpoint {checkpoint} is of a different download')
+
+        print(f'Resuming after page {state["pages"]}', file=sys.stderr)
+        offset = state['offset']
+
+    if state is None:
+        # Initial request to get total number of results
+        r = session.get(url, params={**params, 'max': 1}, timeout=60)
+        r.raise_for_status()
+        state = {
+            'url': url,
+            'params': params,
+            'total': r.json()['total'],
+            'pages': 0,
+            'offset': 0}
+
+    n_pages = math.ceil(state['total'] / PAGE_SIZE)
+    pages = fetch_pages(
+        session, url, params, range(state['pages'], n_pages), threads=threads)
+    with open_output(output, offset) as f:
+        for i, items in pages:
+            print(f'{i + 1}/{n_pages}', file=sys.stderr)
+
+            f.write(''.join(
+                json.dumps(item, separators=(',', ':')) + '\n'
+                for item in items).encode('utf-8'))
+
+            if checkpoint:
+                # Page is on disk before the checkpoint refers to it
+                f.flush()
+                os.fsync(f.fileno())
+                state['pages'] = i + 1
+                state['offset'] = f.tell()
+                write_checkpoint(checkpoint, state)
+
+
+def make_session(
+        threads: int = 8,
+        retries: int = 5,
+        backoff_factor: float = 1) -> requests.Session:
+    """Session with a connection pool, retrying failed requests with backoff
+
+    Args:
+        - threads: number of connections in the pool
+        - retries: number of times to retry a failed request
+        - backoff_factor: backoff factor in seconds between retries
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(
+        pool_connections=threads, pool_maxsize=threads, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_pages(session, url, params, pages, threads=8):
+    """Download pages of results concurrently
+
+    At most `2 * threads` pages are requested ahead of the page being
+    yielded, so that pages completing out of order are buffered in bounded
+    memory.
+
+    Args:
+        - session: session to make requests with
+        - url: API endpoint
+        - params: query parameters, without offset and max
+        - pages: iterable of page numbers
+        - threads: number of concurrent requests
+
+    Yields:
+        Tuples of page number and list of items, in order of `pages`
+    """
+    def _fetch(page):
+        page_params = {**params, 'offset': page * PAGE_SIZE, 'max': PAGE_SIZE}
+        r = session.get(url, params=page_params, timeout=60)
+        r.raise_for_status()
+        return r.json()['items']
+
+    pages = iter(pages)
+    with futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque(
+            (page, executor.submit(_fetch, page))
+            for page in itertools.islice(pages, 2 * threads))
+        try:
+            while pending:
+                page, task = pending.popleft()
+                items = task.result()
+                for page_ in itertools.islice(pages, 1):
+                    pending.append((page_, executor.submit(_fetch, page_)))
+
+                yield page, items
+        finally:
+            # Don't download the rest of the pages after an error
+            for _, task in pending:
+                task.cancel()
+
+
+def open_output(path, offset=None):
+    """Open path for writing bytes
+
+    Args:
+        - path: path, or - for stdout
+        - offset: if given, keep the first `offset` bytes of the file, and
+          write after them. Anything after them is from a page that wasn't
+          recorded in the checkpoint.
+    """
+    if path == '-':
+        return contextlib.nullcontext(click.get_binary_stream('stdout'))
+
+    if offset is None:
+        return open(path, 'wb')
+
+    if not os.path.exists(path) or os.path.getsize(path) < offset:
+        raise ValueError(f'{path} is shorter than recorded in checkpoint')
 
-    params['max'] = 1000
-    n_requests = math.ceil(total / 1000)
-    for i in range(n_requests):
-        print(f'{i + 1}/{n_requests}', file=sys.stderr)
+    f = open(path, 'r+b')
+    f.truncate(offset)
+    f.seek(offset)
+    return f
 
-        params['offset'] = i * 1000
 
-        r = requests.get(url, params=params)
+def write_checkpoint(path, state):
+    """Atomically replace checkpoint file"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
 
-        # Print to stdout
-        for item in r.json()['items']:
-            print(json.dumps(item, separators=(',', ':')))
+    os.replace(tmp_path, path)
 
 
 if __name__ == '__main__':
@@ -2,13 +2,18 @@
 Create mosaic from metadata
 """
 import json
+import threading
+from concurrent import futures
+from datetime import datetime
+from typing import Dict, List
 from urllib.parse import unquote, urlparse
 
 import click
+import numpy as np
 import requests
 from cogeo_mosaic.mosaic import MosaicJSON
 from dateutil.parser import parse as date_parse
-from shapely.geometry import box, mapping
+from requests.adapters import HTTPAdapter
 
 
 def path_accessor(feature):
@@ -19,41 +24,125 @@ def path_accessor(feature):
     return f's3://{bucket}{key}'
 
 
+class ExistsChecker:
+    """Check whether urls exist with concurrent HEAD requests
+
+    Requests share one HTTP session and one pool of `threads` threads, and
+    the result for each url is cached, so that assets shared by several tiles
+    are only checked once. Use as a context manager, or call `close`, to shut
+    down the threads.
+
+    Args:
+        - threads: maximum number of concurrent requests
+        - session: session to make requests with. By default a new session
+          with a connection pool of `threads` connections is used.
+    """
+    def __init__(self, threads: int = 16, session: requests.Session = None):
+        self.threads = threads
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=threads, pool_maxsize=threads)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        self.session = session
+        self._executor = futures.ThreadPoolExecutor(max_workers=threads)
+        self._cache: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Shut down the threads of the checker"""
+        self._executor.shutdown()
+
+    def exists(self, urls: List[str]) -> List[bool]:
+        """Whether each url exists, i.e. a HEAD request returns 200"""
+        with self._lock:
+            todo = [
+                url for url in dict.fromkeys(urls)
+                if url not in self._cache]
+
+        if todo:
+            results = list(self._executor.map(self._head, todo))
+            with self._lock:
+                self._cache.update(zip(todo, results))
+
+        with self._lock:
+            return [self._cache[url] for url in urls]
+
+    def _head(self, url: str) -> bool:
+        return self.session.head(url).status_code == 200
+
+
 def asset_filter(tile, intersect_dataset, intersect_geoms, **kwargs):
     """Custom filter
+
+    Keeps one feature per quad, the latest or earliest by publication date.
+    With `check_exists`, a feature is only kept if its file exists, and the
+    next one by date is tried otherwise. Pass an `ExistsChecker` as
+    `exists_checker` to control concurrency of the checks and share their
+    results across tiles. Otherwise a new checker is used for each call.
     """
     preference = kwargs.get('preference', 'latest')
     check_exists = kwargs.get('check_exists', False)
 
-    quad_coords_set = {f['geometry']['coordinates'] for f in intersect_dataset}
-    result_dataset = []
-    for quad_coords in quad_coords_set:
-        quad_features = [
-            f for f in intersect_dataset
-            if f['geometry']['coordinates'] == quad_coords]
-
-        if preference == 'latest':
-            quad_features = sorted(
-                quad_features,
-                key=lambda x: x['properties']['publicationDate'],
-                reverse=True)
-        elif preference == 'earliest':
-            quad_features = sorted(
-                quad_features, key=lambda x: x['properties']['publicationDate'])
-        else:
-            raise ValueError(f'Invalid preference: {preference}')
-
-        # Check that file actually exists
-        if check_exists:
-            for item in quad_features:
-                url = item['properties']['downloadURL']
-                r = requests.head(url)
-                if r.status_code == 200:
-                    break
-        else:
-            item = quad_features[0]
-
-        result_dataset.append(item)
+    if preference not in ['latest', 'earliest']:
+        raise ValueError(f'Invalid preference: {preference}')
+
+    # Group features by quad, in order of first appearance
+    quads = {}
+    for f in intersect_dataset:
+        quads.setdefault(f['geometry']['coordinates'], []).append(f)
+
+    quad_features = [
+        sorted(
+            features,
+            key=lambda x: x['properties']['publicationDate'],
+            reverse=preference == 'latest') for features in quads.values()]
+
+    if not check_exists:
+        return [features[0] for features in quad_features]
+
+    checker = kwargs.get('exists_checker')
+    if checker is None:
+        with ExistsChecker() as checker:
+            return _filter_existing(quad_features, checker)
+
+    return _filter_existing(quad_features, checker)
+
+
+def _filter_existing(quad_features, checker):
+    """First feature of each quad whose file exists
+
+    Args:
+        - quad_features: features of each quad, in order of preference
+        - checker: `ExistsChecker` to check files with
+    """
+    # Check the first choice of every quad at once, then the next choice of
+    # quads whose file doesn't exist, and so on
+    result_dataset = [None] * len(quad_features)
+    pending = list(range(len(quad_features)))
+    depth = 0
+    while pending:
+        urls = [
+            quad_features[i][depth]['properties']['downloadURL']
+            for i in pending]
+        next_pending = []
+        for i, exists in zip(pending, checker.exists(urls)):
+            # If no file of the quad exists, the last one is kept
+            if exists or depth == len(quad_features[i]) - 1:
+                result_dataset[i] = quad_features[i][depth]
+            else:
+                next_pending.append(i)
+
+        pending = next_pending
+        depth += 1
 
     return result_dataset
 
@@ -70,33 +159,105 @@ def asset_filter(tile, intersect_dataset, intersect_geoms, **kwargs):
     default=False,
     show_default=True,
     help='Perform HEAD request on every selected image to ensure it exists')
+@click.option(
+    '--threads',
+    type=int,
+    default=16,
+    show_default=True,
+    help='Number of concurrent HEAD requests with --check-exists')
 @click.argument('file', type=click.File())
-def mosaic(preference, check_exists, file):
-    features = load_features(file)
-    mosaic = MosaicJSON.from_features(
-        features,
-        minzoom=11,
-        maxzoom=16,
-        asset_filter=asset_filter,
-        accessor=path_accessor,
-        check_exists=check_exists,
-        preference=preference)
+def mosaic(preference, check_exists, threads, file):
+    # Unless files are checked, only the preferred map of each quad can be used
+    features = load_features(
+        file, preference=None if check_exists else preference)
+    with ExistsChecker(threads=threads) as checker:
+        mosaic = MosaicJSON.from_features(
+            features,
+            minzoom=11,
+            maxzoom=16,
+            asset_filter=asset_filter,
+            accessor=path_accessor,
+            check_exists=check_exists,
+            exists_checker=checker,
+            preference=preference)
 
     print(json.dumps(mosaic.dict(), separators=(',', ':')))
 
 
-def load_features(file):
-    features = []
+def load_features(file, preference=None):
+    """Load features from newline-delimited JSON of metadata
+
+    Records are read one line at a time, and only the fields used to create
+    the mosaic are kept.
+
+    Args:
+        - file: file object of metadata from the metadata command
+        - preference: if `latest` or `earliest`, only keep the feature of each
+          quad that `asset_filter` would choose without `check_exists`. By
+          default all features are kept.
+    """
+    if preference not in [None, 'latest', 'earliest']:
+        raise ValueError(f'Invalid preference: {preference}')
+
+    properties = []
+    bounds = []
+    quads = {}
     for line in file:
-        record = json.loads(line)
-        # Coerce publicationDate to datetime
-        record['publicationDate'] = date_parse(record['publicationDate'])
+        if not line.strip():
+            continue
 
+        record = json.loads(line)
         bbox = record['boundingBox']
-        geom = box(bbox['minX'], bbox['minY'], bbox['maxX'], bbox['maxY'])
-        features.append({'properties': record, 'geometry': mapping(geom)})
+        bbox = (bbox['minX'], bbox['minY'], bbox['maxX'], bbox['maxY'])
+        props = {
+            'publicationDate': parse_date(record['publicationDate']),
+            'downloadURL': record['downloadURL']}
+
+        if preference:
+            idx = quads.setdefault(bbox, len(properties))
+            if idx < len(properties):
+                # Like the stable sort in asset_filter, ties keep the first
+                date = properties[idx]['publicationDate']
+                new_date = props['publicationDate']
+                if (preference == 'latest' and new_date > date) or (
+                        preference == 'earliest' and new_date < date):
+                    properties[idx] = props
+                continue
+
+        properties.append(props)
+        bounds.append(bbox)
+
+    # Rings of all footprints at once, in the same order as shapely's box
+    minx, miny, maxx, maxy = np.array(bounds, dtype=float).reshape(-1, 4).T
+    rings = np.stack([
+        np.stack([maxx, miny], axis=-1),
+        np.stack([maxx, maxy], axis=-1),
+        np.stack([minx, maxy], axis=-1),
+        np.stack([minx, miny], axis=-1),
+        np.stack([maxx, miny], axis=-1)],
+                     axis=1).tolist()
+
+    return [{
+        'properties': props,
+        'geometry': {
+            'type': 'Polygon',
+            'coordinates': (tuple(map(tuple, ring)), )}}
+            for props, ring in zip(properties, rings)]
+
+
+def parse_date(value: str) -> datetime:
+    """Parse publication date
+
+    Dates formatted as YYYY-MM-DD, like those from the metadata command, are
+    parsed directly. Other formats fall back to dateutil.
+    """
+    if len(value) == 10 and value[4] == '-' and value[7] == '-':
+        try:
+            return datetime(int(value[:4]), int(value[5:7]), int(value[8:]))
+        except ValueError:
+            pass
 
-    return features
+    return date_parse(value)
 
 
 if __name__ == '__main__':
@@ -1,21 +1,52 @@
+import contextlib
+import heapq
+import itertools
 import json
+import math
+import os
+import sys
+import tempfile
+from concurrent import futures
 from urllib.parse import unquote
 
 import click
 import geopandas as gpd
 import mercantile
+import numpy as np
 import pandas as pd
 from cogeo_mosaic.mosaic import MosaicJSON
-from rio_tiler.mercator import zoom_for_pixelsize
+from pygeos import polygons
 from shapely.geometry import asShape, box
 
+from usgs_topo_tiler.header_index import HeaderIndex
+from usgs_topo_tiler.scripts.list_s3 import read_s3_list
+
+# Approximate memory used per feature while building a partition, including
+# the GeoJSON feature and its share of selected assets
+FEATURE_MEMORY_BYTES = 4096
+
+# Number of rows of the metadata cache read at a time with --memory-budget
+CACHE_BATCH_SIZE = 65536
+
+# Columns of map footprint bounds in the metadata
+BOUNDS_COLUMNS = ['w_long', 's_lat', 'e_long', 'n_lat']
+
 
 @click.command()
 @click.option(
     '--meta-path',
     type=click.Path(exists=True, readable=True),
-    required=True,
+    required=False,
+    default=None,
     help='Path to csv file of USGS bulk metadata dump from S3')
+@click.option(
+    '--cache-path',
+    type=click.Path(exists=True, readable=True),
+    required=False,
+    default=None,
+    help=
+    'Path to Parquet cache of bulk metadata from the ingest command. Alternative to --meta-path.'
+)
 @click.option(
     '--s3-list-path',
     type=click.Path(exists=True, readable=True),
@@ -23,6 +54,16 @@ from shapely.geometry import asShape, box
     default=None,
     show_default=True,
     help='Path to txt file of list of s3 GeoTIFF files')
+@click.option(
+    '--header-index',
+    'header_index_path',
+    type=click.Path(exists=True, file_okay=False, readable=True),
+    required=False,
+    default=None,
+    show_default=True,
+    help=
+    'Path to header index from the index command. Only files in the index are kept.'
+)
 @click.option(
     '--min-scale',
     type=float,
@@ -113,70 +154,122 @@ from shapely.geometry import asShape, box
     'Output filtered GeoJSON features, without creating the MosaicJSON. Useful for inspecting the footprints ',
     default=False,
     show_default=True)
+@click.option(
+    '--workers',
+    type=int,
+    default=1,
+    show_default=True,
+    help=
+    'Number of processes to select assets for quadkeys with. Output is the same for any number of workers.'
+)
+@click.option(
+    '--inputs-out',
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=
+    'Write the assets considered for the mosaic to this file, to be used with --previous-inputs in a later update.'
+)
+@click.option(
+    '--update-from',
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    default=None,
+    help=
+    'Previous MosaicJSON to update. Only quadkeys whose assets changed since the previous build are recomputed. Requires --previous-inputs.'
+)
+@click.option(
+    '--previous-inputs',
+    type=click.Path(exists=True, dir_okay=False, readable=True),
+    default=None,
+    help='File written with --inputs-out when building --update-from')
+@click.option(
+    '--memory-budget',
+    type=float,
+    default=None,
+    help=
+    'Build the mosaic in partitions of quadkeys that each fit in about this many MB, and write it incrementally. Output is the same as without partitions.'
+)
+@click.option(
+    '--spill-dir',
+    type=click.Path(file_okay=False, writable=True),
+    default=None,
+    help=
+    'Directory for intermediate files with --memory-budget. Defaults to a temporary directory.'
+)
+@click.option(
+    '--shard',
+    type=str,
+    default=None,
+    help=
+    'Only create quadkeys of shard i of n, given as "i/n" with 0 <= i < n. Shards are combined with mosaic-merge.'
+)
 def mosaic_bulk(
-        meta_path, s3_list_path, min_scale, max_scale, min_year, max_year,
-        woodland_tint, allow_orthophoto, bounds, minzoom, maxzoom, quadkey_zoom,
-        sort_preference, closest_to_year, filter_only):
+        meta_path, cache_path, s3_list_path, header_index_path, min_scale,
+        max_scale, min_year, max_year, woodland_tint, allow_orthophoto, bounds,
+        minzoom, maxzoom, quadkey_zoom, sort_preference, closest_to_year,
+        filter_only, workers, inputs_out, update_from, previous_inputs,
+        memory_budget, spill_dir, shard):
     """Create MosaicJSON from CSV of bulk metadata
     """
     if (sort_preference == 'closest-to-year') and (not closest_to_year):
         msg = 'closest-to-year parameter required when sort-preference is closest-to-year'
         raise ValueError(msg)
 
-    df = pd.read_csv(meta_path, low_memory=False)
-    # Rename column names to lower case and snake case
-    df = df.rename(columns=lambda col: col.lower().replace(' ', '_'))
-
-    # Keep only historical maps
-    # Newer maps are only in GeoPDF, and not in GeoTIFF, let alone COG
-    df = df[df['series'] == 'HTMC']
-
-    # Create year column as Imprint Year if it exists, otherwise Date On Map
-    df['year'] = df['imprint_year'].fillna(df['date_on_map'])
-
-    # Apply filters
-    if min_scale:
-        df = df[df['scale'] >= min_scale]
-    if max_scale:
-        df = df[df['scale'] <= max_scale]
-    if min_year:
-        df = df[df['year'] >= min_year]
-    if max_year:
-        df = df[df['year'] <= max_year]
-    if woodland_tint is not None:
-        if woodland_tint:
-            df = df[df['woodland_tint'] == 'Y']
-        else:
-            df = df[df['woodland_tint'] == 'N']
-    if not allow_orthophoto:
-        df = df[df['orthophoto'].isna()]
+    if bool(meta_path) == bool(cache_path):
+        raise ValueError('Exactly one of meta-path and cache-path is required')
 
-    # Create s3 GeoTIFF paths from metadata
-    df['s3_tif'] = construct_s3_tif_url(df['download_product_s3'])
+    if update_from and not previous_inputs:
+        raise ValueError('previous-inputs parameter required with update-from')
 
-    if s3_list_path:
-        # Load list of GeoTIFF files
-        s3_files_df = load_s3_list(s3_list_path)
+    if update_from and memory_budget:
+        raise ValueError('memory-budget can\'t be used with update-from')
 
-        # Keep only files that exist as GeoTIFF
-        df = filter_cog_exists(df, s3_files_df)
+    if update_from and shard:
+        raise ValueError('shard can\'t be used with update-from')
 
-    df['geometry'] = df.apply(construct_geometry, axis=1)
-    gdf = gpd.GeoDataFrame(df)
+    if shard:
+        shard = parse_shard(shard)
 
-    # Filter within provided bounding box
     if bounds:
-        bounds = box(*map(float, bounds.split(',')))
-        gdf = gdf[gdf.geometry.intersects(bounds)]
-
-    if not maxzoom:
-        maxzoom = gdf.apply(
-            lambda row: get_maxzoom(row['scale'], row['scanner_resolution']),
-            axis=1)
-        # Take 75th percentile of maxzoom series
-        maxzoom = int(round(maxzoom.describe()['75%']))
-    if not minzoom:
-        minzoom = maxzoom - 5
+        bounds = list(map(float, bounds.split(',')))
+
+    # With a memory budget, the cache is read in batches that are spilled to
+    # disk, so that all metadata is never in memory at once
+    streaming = memory_budget and not filter_only
+    frames = iter_metadata(
+        meta_path=meta_path,
+        cache_path=cache_path,
+        batch_size=CACHE_BATCH_SIZE if streaming else None,
+        min_scale=min_scale,
+        max_scale=max_scale,
+        min_year=min_year,
+        max_year=max_year,
+        woodland_tint=woodland_tint,
+        allow_orthophoto=allow_orthophoto,
+        bounds=bounds)
+
+    # Load list of GeoTIFF files
+    s3_files_df = load_s3_list(s3_list_path) if s3_list_path else None
+    header_keys = None
+    if header_index_path:
+        header_keys = HeaderIndex(header_index_path).keys()
+
+    if sort_preference != 'closest-to-year':
+        closest_to_year = None
+    frames = (
+        prepare_frame(
+            df,
+            s3_files_df=s3_files_df,
+            header_keys=header_keys,
+            bounds=bounds,
+            closest_to_year=closest_to_year) for df in frames)
+
+    previous = None
+    if update_from:
+        with open(update_from) as f:
+            previous = json.load(f)
+        minzoom = previous['minzoom']
+        maxzoom = previous['maxzoom']
+        quadkey_zoom = previous.get('quadkey_zoom') or minzoom
 
     # Columns to keep for creating MosaicJSON
     cols = ['scale', 'year', 's3_tif', 'geometry', 'cell_id']
@@ -188,32 +281,122 @@ def mosaic_bulk(
         sort_by = ['year', 'scale']
         sort_ascending = [True, True]
     elif sort_preference == 'closest-to-year':
-        gdf['reference_year'] = (closest_to_year - gdf['year']).abs()
         sort_by = ['reference_year', 'scale']
         sort_ascending = [True, True]
         cols.remove('year')
         cols.append('reference_year')
 
+    if streaming:
+        with tempfile.TemporaryDirectory(dir=spill_dir) as tmpdir:
+            columns = [col for col in cols if col != 'geometry']
+            columns += ['scanner_resolution', *BOUNDS_COLUMNS]
+            table = spill_frames(
+                frames, columns, os.path.join(tmpdir, 'features.arrow'))
+
+            minzoom, maxzoom, quadkey_zoom = get_zooms(
+                table.column('scale').to_pandas().to_numpy(),
+                table.column('scanner_resolution').to_pandas().to_numpy(),
+                minzoom=minzoom,
+                maxzoom=maxzoom,
+                quadkey_zoom=quadkey_zoom)
+            params = {
+                'minzoom': minzoom,
+                'maxzoom': maxzoom,
+                'quadkey_zoom': quadkey_zoom,
+                'sort_by': sort_by,
+                'sort_ascending': sort_ascending}
+
+            write_mosaic_streaming(
+                table,
+                cols,
+                sys.stdout,
+                minzoom=minzoom,
+                maxzoom=maxzoom,
+                quadkey_zoom=quadkey_zoom,
+                memory_budget=memory_budget,
+                spill_dir=tmpdir,
+                asset_filter=asset_filter,
+                accessor=path_accessor,
+                workers=workers,
+                shard=shard,
+                sort_by=sort_by,
+                sort_ascending=sort_ascending)
+
+            if inputs_out:
+                write_inputs(inputs_out, get_table_inputs(table, cols), params)
+
+        return
+
+    # Without a batch size, metadata is loaded as one DataFrame
+    df = next(frames)
+    df['geometry'] = construct_geometries(df)
+    gdf = gpd.GeoDataFrame(df)
+
+    minzoom, maxzoom, quadkey_zoom = get_zooms(
+        gdf['scale'].to_numpy(),
+        gdf['scanner_resolution'].to_numpy(),
+        minzoom=minzoom,
+        maxzoom=maxzoom,
+        quadkey_zoom=quadkey_zoom)
+
     if filter_only:
         for row in gdf[cols].iterfeatures():
             print(json.dumps(row, separators=(',', ':')))
 
         return
 
+    params = {
+        'minzoom': minzoom,
+        'maxzoom': maxzoom,
+        'quadkey_zoom': quadkey_zoom,
+        'sort_by': sort_by,
+        'sort_ascending': sort_ascending}
+
+    # Only needed to write or to compare with the previous inputs
+    inputs = None
+    if inputs_out or previous:
+        inputs = get_inputs(gdf, cols)
+
     # Convert to features
     features = gdf[cols].__geo_interface__['features']
 
-    mosaic = MosaicJSON.from_features(
-        features,
-        minzoom=minzoom,
-        maxzoom=maxzoom,
-        quadkey_zoom=quadkey_zoom,
-        asset_filter=asset_filter,
-        accessor=path_accessor,
-        sort_by=sort_by,
-        sort_ascending=sort_ascending)
-
-    print(json.dumps(mosaic.dict(), separators=(',', ':')))
+    if previous:
+        prev_inputs, prev_params = load_inputs(previous_inputs)
+        if prev_params != params:
+            msg = f'Parameters differ from previous build: {prev_params}'
+            raise ValueError(msg)
+
+        changed_bounds = diff_inputs(prev_inputs, inputs)
+        mosaic = update_mosaic(
+            previous,
+            features,
+            changed_bounds,
+            asset_filter=asset_filter,
+            accessor=path_accessor,
+            workers=workers,
+            sort_by=sort_by,
+            sort_ascending=sort_ascending)
+    else:
+        mosaic = create_mosaic(
+            features,
+            minzoom=minzoom,
+            maxzoom=maxzoom,
+            quadkey_zoom=quadkey_zoom,
+            asset_filter=asset_filter,
+            accessor=path_accessor,
+            workers=workers,
+            shard=shard,
+            sort_by=sort_by,
+            sort_ascending=sort_ascending)
+
+    if inputs_out:
+        write_inputs(inputs_out, inputs, params)
+
+    mosaic = mosaic.dict()
+    if shard:
+        mosaic['shard'] = {'index': shard[0], 'count': shard[1]}
+
+    print(json.dumps(mosaic, separators=(',', ':')))
 
 
 def path_accessor(feature):
@@ -256,8 +439,13 @@ def optimize_assets(tile, gdf, sort_by, sort_ascending):
     Computing the absolute minimum of assets to cover the tile may not in
     general be possible in finite time, so this is a naive method that should
     work relatively well for this use case.
+
+    Each step picks the asset that sorts first by `sort_by`, then by the
+    percent of the remaining region of the tile it covers. Sort keys are
+    converted to integer codes once, and the area of overlap of each asset with
+    the remaining region is only recomputed for assets that touch the asset
+    that was just picked.
     """
-    final_assets = []
     tile_geom = asShape(mercantile.feature(tile)['geometry'])
 
     sort_by = sort_by.copy()
@@ -270,52 +458,965 @@ def optimize_assets(tile, gdf, sort_by, sort_ascending):
         sort_by.append('int_pct')
         sort_ascending.append(False)
 
+    # Sort keys in order of priority, None for int_pct
+    sort_codes = [
+        None if col == 'int_pct' else _sort_codes(gdf[col], ascending)
+        for col, ascending in zip(sort_by, sort_ascending)]
+    int_pct_ascending = sort_ascending[sort_by.index('int_pct')]
+
+    geoms = gdf.geometry.values
+    int_area = geoms.intersection(tile_geom).area
+
+    # Positions of remaining assets, in order of the last sort
+    order = np.arange(len(gdf))
+    final_positions = []
     while True:
         # Find intersection percent
-        gdf['int_pct'] = gdf.geometry.intersection(
-            tile_geom).area / tile_geom.area
+        int_pct = int_area[order] / tile_geom.area
 
         # Remove features with no tile overlap
-        gdf = gdf[gdf['int_pct'] > 0]
+        has_overlap = int_pct > 0
+        order = order[has_overlap]
+        int_pct = int_pct[has_overlap]
 
-        if len(gdf) == 0:
+        if len(order) == 0:
             # There are many ocean/border tiles on the edges of available maps
             # that by definition don't have full coverage
-            # print(f'Not enough assets to cover {tile}', file=sys.stderr)
             break
 
-        # Sort by cover of region of tile that is left
-        # Sort first on scale, then on intersection percent
-        gdf = gdf.sort_values(sort_by, ascending=sort_ascending)
+        # Sort by cover of region of tile that is left. The sort is stable, so
+        # ties keep their order from the previous step
+        int_pct_key = int_pct if int_pct_ascending else -int_pct
+        keys = [
+            int_pct_key if codes is None else codes[order]
+            for codes in sort_codes]
+        sorter = np.lexsort(keys[::-1])
+        order = order[sorter]
 
-        # Remove top asset and add to final_assets
-        top_asset = gdf.iloc[0]
-        gdf = gdf.iloc[1:]
-        final_assets.append(top_asset)
+        # Remove top asset and add to final assets
+        top = order[0]
+        order = order[1:]
+        final_positions.append(top)
 
-        # Recompute tile_geom, removing overlap with top_asset
-        tile_geom = tile_geom.difference(top_asset.geometry)
+        # Recompute tile_geom, removing overlap with top asset
+        tile_geom = tile_geom.difference(geoms[top])
 
         # When total area is covered, stop
         if tile_geom.area - 1e-4 < 0:
             break
 
-        if len(gdf) == 0:
-            # There are many ocean/border tiles on the edges of available maps
-            # that by definition don't have full coverage
-            # print(f'Not enough assets to cover {tile}', file=sys.stderr)
+        if len(order) == 0:
             break
 
-    return gpd.GeoDataFrame(final_assets)
+        # Overlap only changes for assets that touch the top asset
+        changed = order[geoms[order].intersects(geoms[top])]
+        int_area[changed] = geoms[changed].intersection(tile_geom).area
+
+    return gdf.iloc[final_positions]
+
+
+def _sort_codes(series, ascending):
+    """Integer codes that sort like pd.Series.sort_values, with NaN last"""
+    codes, uniques = pd.factorize(series, sort=True)
+    n = len(uniques)
+    if not ascending:
+        codes = np.where(codes == -1, -1, n - codes - 1)
+
+    return np.where(codes == -1, n, codes)
+
+
+def create_mosaic(
+        features,
+        minzoom,
+        maxzoom,
+        quadkey_zoom=None,
+        accessor=path_accessor,
+        asset_filter=asset_filter,
+        workers=1,
+        shard=None,
+        **kwargs):
+    """Create MosaicJSON from features, optionally in parallel
+
+    Same as `MosaicJSON.from_features` for features that are axis-aligned
+    boxes, like the footprints in the bulk metadata. Features are assigned to
+    quadkeys with `assign_quadkeys` instead of rasterizing and querying each
+    quadkey.
+
+    With `workers > 1` quadkeys are split into contiguous chunks and
+    `asset_filter` is run on each chunk in a separate process. Each process
+    only receives the features that intersect its chunk, and results are
+    merged in the original quadkey order, so the mosaic is identical to the
+    serial one.
+
+    With `shard=(i, n)` only the quadkeys of shard i of n are created, see
+    `in_shard`, and the bounds are those of the features they intersect.
+    Shards are combined with `merge_mosaics`.
+
+    accessor, asset_filter and kwargs must be picklable when workers > 1.
+    """
+    quadkey_zoom = quadkey_zoom or minzoom
+
+    feature_bounds = get_feature_bounds(features)
+    tiles, candidates = assign_quadkeys(feature_bounds, quadkey_zoom)
+    if shard:
+        selected = [i for i, tile in enumerate(tiles) if in_shard(tile, shard)]
+        tiles = [tiles[i] for i in selected]
+        candidates = [candidates[i] for i in selected]
+        if tiles:
+            feature_bounds = _candidate_bounds(feature_bounds, candidates)
+
+    mosaic_tiles = _run_asset_filter(
+        tiles, candidates, features, accessor, asset_filter, workers, kwargs)
+
+    return _make_mosaic(
+        mosaic_tiles, feature_bounds, minzoom, maxzoom, quadkey_zoom)
+
+
+def update_mosaic(
+        previous,
+        features,
+        changed_bounds,
+        accessor=path_accessor,
+        asset_filter=asset_filter,
+        workers=1,
+        **kwargs):
+    """Update MosaicJSON after some of its input features changed
+
+    Only quadkeys that intersect a changed feature are recomputed, and the
+    assets of all other quadkeys are kept from `previous`. The result is the
+    same as `create_mosaic` with the new features and the zoom levels of
+    `previous`.
+
+    Args:
+        - previous: MosaicJSON as dict, created with `create_mosaic`
+        - features: all features of the new build
+        - changed_bounds: array of shape (n, 4) of bounds of features that
+          were added, removed or modified since the previous build
+        - accessor, asset_filter, workers, kwargs: see `create_mosaic`
+    """
+    minzoom = previous['minzoom']
+    maxzoom = previous['maxzoom']
+    quadkey_zoom = previous.get('quadkey_zoom') or minzoom
+
+    changed_tiles, _ = assign_quadkeys(changed_bounds, quadkey_zoom)
+    changed_tiles = set(changed_tiles)
+
+    feature_bounds = get_feature_bounds(features)
+    tiles, candidates = assign_quadkeys(feature_bounds, quadkey_zoom)
+    selected = [i for i, tile in enumerate(tiles) if tile in changed_tiles]
+    print(
+        f'Recomputing {len(selected)} of {len(tiles)} quadkeys',
+        file=sys.stderr)
+    updated = {}
+    if selected:
+        updated = _run_asset_filter([tiles[i] for i in selected],
+                                    [candidates[i] for i in selected],
+                                    features, accessor, asset_filter, workers,
+                                    kwargs)
+
+    mosaic_tiles = {
+        quadkey: assets
+        for quadkey, assets in previous['tiles'].items()
+        if mercantile.quadkey_to_tile(quadkey) not in changed_tiles}
+    mosaic_tiles.update(updated)
+
+    mosaic_tiles = {
+        quadkey: mosaic_tiles[quadkey]
+        for quadkey in sorted(mosaic_tiles, key=_quadkey_sort_key)}
+
+    return _make_mosaic(
+        mosaic_tiles, feature_bounds, minzoom, maxzoom, quadkey_zoom)
+
+
+def spill_frames(frames, columns, path):
+    """Write columns of DataFrames to an Arrow file and memory-map it
+
+    Frames are written one at a time, so only one of them is in memory.
+
+    Args:
+        - frames: iterable of DataFrames with the same columns
+        - columns: columns to write
+        - path: path of Arrow IPC file to write
+
+    Returns:
+        pyarrow Table backed by the file, whose rows are only read into memory
+        when they are used
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('pyarrow is required with a memory budget')
+
+    schema = None
+    writer = None
+    try:
+        for df in frames:
+            # Types of the first frame are kept, e.g. if a later frame has
+            # missing values in an integer column
+            table = pa.Table.from_pandas(
+                df[columns], schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = pa.ipc.new_file(path, schema)
+
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        raise ValueError('No metadata to create mosaic from')
+
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def _table_bounds(table):
+    """Array of shape (n, 4) of the bounds of footprints of a pyarrow Table
+
+    Same as the bounds of the boxes of `construct_geometries`.
+    """
+    w, s, e, n = [
+        table.column(col).to_pandas().to_numpy(dtype=np.float64)
+        for col in BOUNDS_COLUMNS]
+    return np.stack([
+        np.minimum(w, e),
+        np.minimum(s, n),
+        np.maximum(w, e),
+        np.maximum(s, n)],
+                    axis=1)
+
+
+def write_mosaic_streaming(
+        table,
+        cols,
+        out,
+        minzoom,
+        maxzoom,
+        quadkey_zoom=None,
+        memory_budget=1024,
+        spill_dir=None,
+        accessor=path_accessor,
+        asset_filter=asset_filter,
+        workers=1,
+        shard=None,
+        **kwargs):
+    """Create MosaicJSON in partitions of quadkeys and write it to out
+
+    Quadkeys are grouped into partitions by their parent tile at a partition
+    zoom, chosen so that the features and results of one partition fit in
+    `memory_budget`. Each partition's rows are taken from `table` and
+    converted to features, assets are selected as in `create_mosaic`, and the
+    results are spilled to a file in `spill_dir`. The spilled results are then
+    merged in quadkey order and written to `out`, so the output is the same as
+    serializing the result of `create_mosaic` with
+    `json.dumps(mosaic.dict(), separators=(',', ':'))`.
+
+    Only the footprint bounds and one partition are kept in memory. `table`
+    should be memory-mapped, like the one returned by `spill_frames`.
+
+    Args:
+        - table: pyarrow Table with the columns in `cols` and `BOUNDS_COLUMNS`
+        - cols: columns to include in features, where `geometry` is the
+          footprint constructed from `BOUNDS_COLUMNS`
+        - out: text file object to write MosaicJSON to
+        - minzoom, maxzoom, quadkey_zoom: zoom levels of the mosaic
+        - memory_budget: approximate memory in MB to use for one partition
+        - spill_dir: directory for intermediate files. A temporary directory
+          is used by default.
+        - accessor, asset_filter, workers, shard, kwargs: see `create_mosaic`.
+          With a shard, its index and count are written in a `shard` key.
+    """
+    quadkey_zoom = quadkey_zoom or minzoom
+    feature_bounds = _table_bounds(table)
+
+    partition_zoom = get_partition_zoom(
+        feature_bounds, quadkey_zoom, memory_budget)
+    partitions, partition_candidates = assign_quadkeys(
+        feature_bounds, partition_zoom)
+    print(
+        f'Building {len(partitions)} partitions at zoom {partition_zoom}',
+        file=sys.stderr)
+
+    with contextlib.ExitStack() as stack:
+        tmpdir = stack.enter_context(
+            tempfile.TemporaryDirectory(dir=spill_dir))
+
+        # One pool of processes for all partitions
+        executor = None
+        if workers > 1:
+            executor = stack.enter_context(
+                futures.ProcessPoolExecutor(max_workers=workers))
+
+        paths = []
+        used_bounds = []
+        for partition, candidates in zip(partitions, partition_candidates):
+            path = os.path.join(
+                tmpdir, f'{partition.z}-{partition.x}-{partition.y}.txt')
+            bounds = _build_partition(
+                path, table, cols, candidates, feature_bounds[candidates],
+                partition, quadkey_zoom, accessor, asset_filter, workers,
+                shard, kwargs, executor)
+            paths.append(path)
+            used_bounds.append(bounds)
+
+        if shard and any(len(bounds) for bounds in used_bounds):
+            feature_bounds = np.concatenate(used_bounds)
+
+        # Metadata is computed the same way as create_mosaic
+        mosaic = _make_mosaic({}, feature_bounds, minzoom, maxzoom,
+                              quadkey_zoom).dict()
+        if shard:
+            mosaic['shard'] = {'index': shard[0], 'count': shard[1]}
+
+        out.write('{')
+        for i, (key, value) in enumerate(mosaic.items()):
+            if i > 0:
+                out.write(',')
+
+            out.write(json.dumps(key) + ':')
+            if key != 'tiles':
+                out.write(json.dumps(value, separators=(',', ':')))
+                continue
+
+            out.write('{')
+            for j, line in enumerate(_merge_partitions(partitions, paths)):
+                if j > 0:
+                    out.write(',')
+                out.write(line)
+            out.write('}')
+
+        out.write('}\n')
+
+
+def get_partition_zoom(bounds, quadkey_zoom, memory_budget):
+    """Lowest zoom whose tiles each intersect few enough features for budget
+
+    The range of tiles each feature intersects is found once at the quadkey
+    zoom. Ranges at lower zooms are those of the parent tiles, so the number
+    of features of each tile is counted from them without searching the
+    bounds again or building lists of candidates.
+
+    Args:
+        - bounds: array of shape (n, 4) of bounds of features
+        - quadkey_zoom: zoom of quadkeys, the highest partition zoom
+        - memory_budget: approximate memory in MB to use for one partition
+    """
+    max_features = max(int(memory_budget * 2**20 / FEATURE_MEMORY_BYTES), 1)
+    tile_ranges = _tile_ranges(bounds, quadkey_zoom)
+    for zoom in range(quadkey_zoom + 1):
+        shift = quadkey_zoom - zoom
+        _, xs, ys = _expand_tile_ranges(*(r >> shift for r in tile_ranges))
+        if not len(xs):
+            return zoom
+
+        _, counts = np.unique(
+            ys.astype(np.int64) * 2**zoom + xs, return_counts=True)
+        if counts.max() <= max_features:
+            return zoom
+
+    print(
+        'Warning: partitions exceed memory budget at quadkey zoom '
+        f'{quadkey_zoom}',
+        file=sys.stderr)
+    return quadkey_zoom
+
+
+def _build_partition(
+        path, table, cols, rows, feature_bounds, partition, quadkey_zoom,
+        accessor, asset_filter, workers, shard, kwargs, executor):
+    """Select assets for the quadkeys of one partition and write to path
+
+    Only the rows of `table` in `rows` are read into memory. Each line of the
+    file has the y and x of a quadkey tile and the quadkey and assets
+    serialized as a member of the `tiles` object, in y, x order.
+
+    Returns bounds of the features that intersect the partition's quadkeys.
+    """
+    tiles, candidates = assign_quadkeys(feature_bounds, quadkey_zoom)
+
+    # Keep only quadkeys within partition. Features in the partition include
+    # all features that intersect these quadkeys.
+    shift = quadkey_zoom - partition.z
+    selected = [
+        i for i, tile in enumerate(tiles)
+        if (tile.x >> shift, tile.y >> shift) == (partition.x, partition.y) and
+        (not shard or in_shard(tile, shard))]
+    if not selected:
+        # E.g. none of the partition's quadkeys are in the shard
+        open(path, 'w').close()
+        return np.empty((0, 4))
+
+    df = table.take(rows).to_pandas()
+    df['geometry'] = construct_geometries(df)
+    features = gpd.GeoDataFrame(df)[cols].__geo_interface__['features']
+    mosaic_tiles = _run_asset_filter([tiles[i] for i in selected],
+                                     [candidates[i] for i in selected],
+                                     features,
+                                     accessor,
+                                     asset_filter,
+                                     workers,
+                                     kwargs,
+                                     executor=executor)
+
+    with open(path, 'w') as f:
+        for quadkey, assets in mosaic_tiles.items():
+            tile = mercantile.quadkey_to_tile(quadkey)
+            member = json.dumps({quadkey: assets}, separators=(',', ':'))[1:-1]
+            f.write(f'{tile.y} {tile.x} {member}\n')
+
+    return _candidate_bounds(
+        feature_bounds, [candidates[i] for i in selected])
+
+
+def _merge_partitions(partitions, paths):
+    """Yield spilled tiles of all partitions, ordered by y then x
+
+    Partitions in different rows don't share any quadkey rows, so only the
+    files of one row of partitions are open at a time.
+    """
+    def _read(path):
+        with open(path) as f:
+            for line in f:
+                y, x, member = line.rstrip('\n').split(' ', 2)
+                yield (int(y), int(x)), member
+
+    for _, row in itertools.groupby(zip(partitions, paths),
+                                    key=lambda p: p[0].y):
+        readers = [_read(path) for _, path in row]
+        for _, member in heapq.merge(*readers, key=lambda item: item[0]):
+            yield member
+
+
+def parse_shard(shard):
+    """Parse shard string of format "i/n" to (i, n), with 0 <= i < n"""
+    try:
+        index, count = map(int, shard.split('/'))
+    except ValueError:
+        raise ValueError(f'Shard must be of format "i/n", got: {shard}')
+
+    if not 0 <= index < count:
+        raise ValueError(f'Shard index must be between 0 and {count - 1}')
+
+    return index, count
+
+
+def in_shard(tile, shard):
+    """Whether a quadkey tile belongs to shard (i, n)
+
+    Tiles are numbered row by row over the whole zoom level, and every n-th
+    tile belongs to the same shard. This only depends on the tile, so shards
+    are deterministic and of about the same size wherever the features are.
+    """
+    index, count = shard
+    return (tile.y * 2**tile.z + tile.x) % count == index
+
+
+def merge_mosaics(mosaics):
+    """Combine shards of a mosaic created with `shard=(i, n)`
+
+    Args:
+        - mosaics: MosaicJSON dicts with a `shard` key, one for each shard
+
+    Returns:
+        MosaicJSON with the quadkeys of all shards, ordered by y then x, and
+        bounds, center, minzoom and maxzoom computed from all shards. It is the
+        same as the mosaic created without shards.
+    """
+    if not mosaics:
+        raise ValueError('No mosaics to merge')
+
+    shards = [mosaic.get('shard') for mosaic in mosaics]
+    if None in shards:
+        raise ValueError('Mosaics must be created with a shard')
+
+    counts = {shard['count'] for shard in shards}
+    if len(counts) > 1:
+        raise ValueError(f'Mosaics have different shard counts: {counts}')
+
+    indexes = [shard['index'] for shard in shards]
+    duplicates = sorted({i for i in indexes if indexes.count(i) > 1})
+    if duplicates:
+        raise ValueError(f'Shards given more than once: {duplicates}')
+
+    missing = sorted(set(range(counts.pop())) - set(indexes))
+    if missing:
+        raise ValueError(f'Missing shards: {missing}')
+
+    quadkey_zooms = {mosaic['quadkey_zoom'] for mosaic in mosaics}
+    if len(quadkey_zooms) > 1:
+        raise ValueError(
+            f'Mosaics have different quadkey zooms: {quadkey_zooms}')
+
+    tiles = {}
+    for mosaic in mosaics:
+        overlap = tiles.keys() & mosaic['tiles'].keys()
+        if overlap:
+            raise ValueError(
+                f'Quadkeys in more than one shard: {sorted(overlap)[:10]}')
+
+        tiles.update(mosaic['tiles'])
+
+    tiles = {
+        quadkey: tiles[quadkey]
+        for quadkey in sorted(tiles, key=_quadkey_sort_key)}
+
+    bounds = np.array([mosaic['bounds'] for mosaic in mosaics])
+    return _make_mosaic(
+        tiles, bounds, min(mosaic['minzoom'] for mosaic in mosaics),
+        max(mosaic['maxzoom'] for mosaic in mosaics), quadkey_zooms.pop())
+
+
+def _quadkey_sort_key(quadkey):
+    """Sort key of quadkeys in the order of create_mosaic, by y then x"""
+    tile = mercantile.quadkey_to_tile(quadkey)
+    return tile.y, tile.x
+
+
+def _candidate_bounds(feature_bounds, candidates):
+    """Bounds of features that are a candidate of any tile
+
+    Returns array of shape (1, 4), or of shape (0, 4) without candidates.
+    """
+    idx = np.unique(np.fromiter(itertools.chain(*candidates), dtype=np.int64))
+    if not len(idx):
+        return np.empty((0, 4))
+
+    bounds = feature_bounds[idx]
+    return np.concatenate([bounds[:, :2].min(axis=0),
+                           bounds[:, 2:].max(axis=0)]).reshape(1, 4)
+
+
+def _run_asset_filter(
+        tiles, candidates, features, accessor, asset_filter, workers, kwargs,
+        executor=None):
+    """Run asset_filter on tiles, in a process pool if workers > 1
+
+    A pool of `workers` processes is created unless one is passed as
+    `executor`.
+
+    Returns dict of quadkey to assets, in order of tiles.
+    """
+    if not tiles:
+        return {}
+
+    filter_args = (accessor, asset_filter, kwargs)
+    if workers <= 1:
+        return _filter_tiles(tiles, candidates, features, *filter_args)
+
+    n_chunks = min(workers * 4, len(tiles)) or 1
+    chunk_size = -(-len(tiles) // n_chunks)
+    chunks = [
+        _make_chunk(
+            tiles[i:i + chunk_size], candidates[i:i + chunk_size], features)
+        for i in range(0, len(tiles), chunk_size)]
+    with contextlib.ExitStack() as stack:
+        if executor is None:
+            executor = stack.enter_context(
+                futures.ProcessPoolExecutor(max_workers=workers))
+
+        results = executor.map(
+            _filter_tiles_star, [(*c, *filter_args) for c in chunks])
+
+        mosaic_tiles = {}
+        for result in results:
+            mosaic_tiles.update(result)
+
+    return mosaic_tiles
+
+
+def _make_mosaic(mosaic_tiles, feature_bounds, minzoom, maxzoom, quadkey_zoom):
+    bounds = [
+        feature_bounds[:, 0].min(), feature_bounds[:, 1].min(),
+        feature_bounds[:, 2].max(), feature_bounds[:, 3].max()]
+
+    mosaic_definition = dict(
+        mosaicjson='0.0.2',
+        minzoom=minzoom,
+        maxzoom=maxzoom,
+        quadkey_zoom=quadkey_zoom,
+        bounds=bounds,
+        center=((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2,
+                minzoom),
+        tiles=mosaic_tiles,
+        version='1.0.0',
+    )
+    return MosaicJSON(**mosaic_definition)
+
+
+def get_feature_bounds(features):
+    """Array of shape (n, 4) of the bounds of each feature's exterior ring"""
+    rings = [feat['geometry']['coordinates'][0] for feat in features]
+    try:
+        # All rings have the same number of points, e.g. boxes
+        coords = np.asarray(rings, dtype=np.float64).reshape(len(rings), -1, 2)
+        return np.concatenate([coords.min(axis=1), coords.max(axis=1)], axis=1)
+    except ValueError:
+        bounds = np.empty((len(rings), 4))
+        for i, ring in enumerate(rings):
+            coords = np.asarray(ring, dtype=np.float64)
+            bounds[i, :2] = coords.min(axis=0)
+            bounds[i, 2:] = coords.max(axis=0)
+
+        return bounds
+
+
+def assign_quadkeys(bounds, zoom):
+    """Find which boxes intersect each mercator tile of a zoom level
+
+    Boxes and tiles are both axis-aligned in WGS84, so a box intersects the
+    range of tiles between the tile edges it touches. Tile edges are computed
+    the same way as `mercantile.bounds`, and boxes that only touch a tile are
+    included, like with a geometric intersects test.
+
+    Args:
+        - bounds: array of shape (n, 4) of [minx, miny, maxx, maxy] in WGS84
+        - zoom: zoom level of tiles
+
+    Returns:
+        (tiles, candidates): tiles intersecting any box, ordered by y then x,
+        and for each tile the ascending indexes of boxes that intersect it.
+    """
+    n_tiles = 2 ** zoom
+    feature_idx, xs, ys = _expand_tile_ranges(*_tile_ranges(bounds, zoom))
+
+    # Group by tile, ordered by y then x, then by feature
+    tile_key = ys.astype(np.int64) * n_tiles + xs
+    order = np.lexsort((feature_idx, tile_key))
+    tile_key = tile_key[order]
+    feature_idx = feature_idx[order]
+    keys, starts = np.unique(tile_key, return_index=True)
+
+    tiles = [
+        mercantile.Tile(int(key % n_tiles), int(key // n_tiles), zoom)
+        for key in keys]
+    candidates = np.split(feature_idx, starts[1:]) if len(keys) else []
+    return tiles, [c.tolist() for c in candidates]
+
+
+def _tile_ranges(bounds, zoom):
+    """Range of tiles of a zoom level that each box intersects
+
+    Returns:
+        (x_min, x_max, y_min, y_max): arrays of the first and last tile x and
+        y of each box, inclusive. The range is empty if a maximum is less than
+        its minimum.
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+    n_tiles = 2 ** zoom
+
+    # Edges of tiles. Longitude is increasing in x, latitude decreasing in y
+    z2 = math.pow(2, zoom)
+    lon_edges = np.arange(n_tiles + 1) / z2 * 360.0 - 180.0
+    lat_edges = np.array([
+        math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / z2))))
+        for y in range(n_tiles + 1)])
+
+    # Tile x intersects [minx, maxx] if lon_edges[x + 1] >= minx and
+    # lon_edges[x] <= maxx
+    x_min = np.searchsorted(lon_edges, bounds[:, 0], side='left') - 1
+    x_max = np.searchsorted(lon_edges, bounds[:, 2], side='right') - 1
+    # Tile y intersects [miny, maxy] if lat_edges[y + 1] <= maxy and
+    # lat_edges[y] >= miny
+    y_min = np.searchsorted(-lat_edges, -bounds[:, 3], side='left') - 1
+    y_max = np.searchsorted(-lat_edges, -bounds[:, 1], side='right') - 1
+
+    x_min = np.clip(x_min, 0, n_tiles - 1)
+    x_max = np.clip(x_max, -1, n_tiles - 1)
+    y_min = np.clip(y_min, 0, n_tiles - 1)
+    y_max = np.clip(y_max, -1, n_tiles - 1)
+    return x_min, x_max, y_min, y_max
+
+
+def _expand_tile_ranges(x_min, x_max, y_min, y_max):
+    """Expand each box to all tiles in its range
+
+    Returns:
+        (feature_idx, xs, ys): index of the box and x and y of each tile it
+        intersects
+    """
+    n_x = np.maximum(x_max - x_min + 1, 0)
+    n_y = np.maximum(y_max - y_min + 1, 0)
+    counts = n_x * n_y
+    feature_idx = np.repeat(np.arange(len(x_min)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    xs = x_min[feature_idx] + offsets % n_x[feature_idx]
+    ys = y_min[feature_idx] + offsets // n_x[feature_idx]
+    return feature_idx, xs, ys
+
+
+def _make_chunk(tiles, candidates, features):
+    """Tiles with only the features they intersect, reindexed"""
+    feature_idx = sorted(set().union(*candidates))
+    local_idx = {idx: i for i, idx in enumerate(feature_idx)}
+    candidates = [[local_idx[idx] for idx in c] for c in candidates]
+    return tiles, candidates, [features[idx] for idx in feature_idx]
+
+
+def _filter_tiles(tiles, candidates, features, accessor, asset_filter, kwargs):
+    """Run asset_filter on each tile. Returns dict of quadkey to assets"""
+    dataset_geoms = polygons(
+        [feat['geometry']['coordinates'][0] for feat in features])
+
+    result = {}
+    for tile, intersections_idx in zip(tiles, candidates):
+        if len(intersections_idx) == 0:
+            continue
+
+        intersect_dataset, intersect_geoms = zip(
+            *[(features[idx], dataset_geoms[idx])
+              for idx in intersections_idx])
+
+        dataset = asset_filter(
+            tile, intersect_dataset, intersect_geoms, **kwargs)
+        if dataset:
+            quadkey = mercantile.quadkey(tile)
+            result[quadkey] = [accessor(f) for f in dataset]
+
+    return result
+
+
+def _filter_tiles_star(args):
+    return _filter_tiles(*args)
+
+
+def get_inputs(gdf, cols):
+    """Table of assets considered for a mosaic, with bounds of each asset
+    """
+    inputs = pd.DataFrame(gdf[[col for col in cols if col != 'geometry']])
+    inputs[['minx', 'miny', 'maxx', 'maxy']] = gdf.geometry.bounds.values
+    return inputs.reset_index(drop=True)
+
+
+def get_table_inputs(table, cols):
+    """Same as `get_inputs`, from the pyarrow Table of `spill_frames`
+    """
+    inputs = table.select([col for col in cols if col != 'geometry'
+                           ]).to_pandas()
+    inputs[['minx', 'miny', 'maxx', 'maxy']] = _table_bounds(table)
+    return inputs
+
+
+def write_inputs(path, inputs, params):
+    """Write inputs table and build parameters to JSON"""
+    data = {'params': params, 'inputs': inputs.to_dict(orient='list')}
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def load_inputs(path):
+    """Load inputs table and build parameters written by write_inputs"""
+    with open(path) as f:
+        data = json.load(f)
+
+    return pd.DataFrame(data['inputs']), data['params']
+
+
+def diff_inputs(previous, current):
+    """Bounds of assets that were added, removed or modified
+
+    Returns:
+        array of shape (n, 4) of bounds of rows that are only in one of the
+        tables, either the old or the new version of a modified asset.
+    """
+    merged = current.merge(previous, how='outer', indicator=True)
+    changed = merged[merged['_merge'] != 'both']
+    return changed[['minx', 'miny', 'maxx', 'maxy']].to_numpy(dtype=np.float64)
+
+
+def load_metadata(meta_path):
+    """Load USGS bulk metadata CSV
+
+    Columns are renamed to lower snake case, only historical maps are kept and
+    a year column is added.
+    """
+    df = pd.read_csv(meta_path, low_memory=False)
+    # Rename column names to lower case and snake case
+    df = df.rename(columns=lambda col: col.lower().replace(' ', '_'))
+
+    # Keep only historical maps
+    # Newer maps are only in GeoPDF, and not in GeoTIFF, let alone COG
+    df = df[df['series'] == 'HTMC']
+
+    # Create year column as Imprint Year if it exists, otherwise Date On Map
+    df['year'] = df['imprint_year'].fillna(df['date_on_map'])
+    return df
+
+
+def filter_metadata(
+        df, min_scale=None, max_scale=None, min_year=None, max_year=None,
+        woodland_tint=None, allow_orthophoto=False):
+    """Apply mosaic-bulk filters to metadata"""
+    if min_scale:
+        df = df[df['scale'] >= min_scale]
+    if max_scale:
+        df = df[df['scale'] <= max_scale]
+    if min_year:
+        df = df[df['year'] >= min_year]
+    if max_year:
+        df = df[df['year'] <= max_year]
+    if woodland_tint is not None:
+        if woodland_tint:
+            df = df[df['woodland_tint'] == 'Y']
+        else:
+            df = df[df['woodland_tint'] == 'N']
+    if not allow_orthophoto:
+        df = df[df['orthophoto'].isna()]
+
+    return df
+
+
+def iter_metadata(
+        meta_path=None, cache_path=None, batch_size=None, bounds=None,
+        **kwargs):
+    """Load and filter metadata from the bulk CSV or the cache
+
+    Args:
+        - meta_path: path to CSV of bulk metadata
+        - cache_path: path to metadata cache, used instead of meta_path
+        - batch_size: if given, the cache is read in DataFrames of at most
+          this many rows. The CSV is always read at once.
+        - bounds: [minx, miny, maxx, maxy] to filter the cache with. Use
+          `prepare_frame` to filter by bounds exactly.
+        - kwargs: filters of `filter_metadata`
+
+    Yields:
+        DataFrames of metadata with an `s3_tif` column
+    """
+    if cache_path:
+        if batch_size:
+            yield from iter_cache(
+                cache_path, batch_size=batch_size, bounds=bounds, **kwargs)
+        else:
+            yield read_cache(cache_path, bounds=bounds, **kwargs)
+
+        return
+
+    df = load_metadata(meta_path)
+    df = filter_metadata(df, **kwargs)
+
+    # Create s3 GeoTIFF paths from metadata
+    df['s3_tif'] = construct_s3_tif_url(df['download_product_s3'])
+    yield df
+
+
+def prepare_frame(
+        df, s3_files_df=None, header_keys=None, bounds=None,
+        closest_to_year=None):
+    """Apply the filters of mosaic-bulk that need more than one column
+
+    Args:
+        - df: DataFrame of metadata with an `s3_tif` column
+        - s3_files_df: DataFrame of GeoTIFF files from `load_s3_list`. If
+          given, only files in it are kept.
+        - header_keys: keys of a header index. If given, only files in it are
+          kept.
+        - bounds: [minx, miny, maxx, maxy] that kept maps must intersect
+        - closest_to_year: if given, a `reference_year` column is added with
+          the number of years from this year
+    """
+    if s3_files_df is not None:
+        # Keep only files that exist as GeoTIFF
+        df = filter_cog_exists(df, s3_files_df)
+
+    if header_keys is not None:
+        df = df[df['s3_tif'].isin(header_keys)]
+
+    # Filter within provided bounding box
+    if bounds:
+        df = df[construct_geometries(df).intersects(box(*bounds))]
+
+    if closest_to_year:
+        df = df.assign(reference_year=(closest_to_year - df['year']).abs())
+
+    return df
+
+
+# Columns of the metadata cache used by mosaic-bulk
+CACHE_COLUMNS = [
+    'scale', 'year', 's3_tif', 'cell_id', 'scanner_resolution', 'w_long',
+    's_lat', 'e_long', 'n_lat']
+
+
+def read_cache(
+        cache_path, min_scale=None, max_scale=None, min_year=None,
+        max_year=None, woodland_tint=None, allow_orthophoto=False,
+        bounds=None):
+    """Read metadata cache written by the ingest command
+
+    Only the columns needed for the mosaic are read, and filters are applied
+    by pyarrow while reading, so that row groups that don't match are skipped.
+    Same filters as `filter_metadata`, plus bounds: a list of
+    [minx, miny, maxx, maxy] that kept maps must intersect.
+    """
+    dataset, expression = _open_cache(
+        cache_path,
+        min_scale=min_scale,
+        max_scale=max_scale,
+        min_year=min_year,
+        max_year=max_year,
+        woodland_tint=woodland_tint,
+        allow_orthophoto=allow_orthophoto,
+        bounds=bounds)
+    table = dataset.to_table(columns=CACHE_COLUMNS, filter=expression)
+    return table.to_pandas()
+
+
+def iter_cache(cache_path, batch_size=CACHE_BATCH_SIZE, **kwargs):
+    """Read metadata cache in DataFrames of at most batch_size rows
+
+    Rows are in the same order and have the same filters as `read_cache`.
+    """
+    dataset, expression = _open_cache(cache_path, **kwargs)
+    batches = dataset.to_batches(
+        columns=CACHE_COLUMNS, filter=expression, batch_size=batch_size)
+    for batch in batches:
+        yield batch.to_pandas()
+
+
+def _open_cache(
+        cache_path, min_scale=None, max_scale=None, min_year=None,
+        max_year=None, woodland_tint=None, allow_orthophoto=False,
+        bounds=None):
+    """pyarrow Dataset of the cache and expression of filters to read it with
+    """
+    try:
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ImportError('pyarrow is required to read the metadata cache')
+
+    filters = []
+    if min_scale:
+        filters.append(ds.field('scale') >= min_scale)
+    if max_scale:
+        filters.append(ds.field('scale') <= max_scale)
+    if min_year:
+        filters.append(ds.field('year') >= min_year)
+    if max_year:
+        filters.append(ds.field('year') <= max_year)
+    if woodland_tint is not None:
+        tint = 'Y' if woodland_tint else 'N'
+        filters.append(ds.field('woodland_tint') == tint)
+    if not allow_orthophoto:
+        filters.append(ds.field('orthophoto').is_null())
+    if bounds:
+        minx, miny, maxx, maxy = bounds
+        filters.extend([
+            ds.field('w_long') <= maxx, ds.field('e_long') >= minx,
+            ds.field('s_lat') <= maxy, ds.field('n_lat') >= miny])
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    return ds.dataset(cache_path, format='parquet'), expression
 
 
 def load_s3_list(s3_list_path):
     """Filter df using list of COG files
     """
     # Load list of files into DataFrame
-    with open(s3_list_path) as f:
-        lines = [l.strip() for l in f.readlines()]
-
+    lines = read_s3_list(s3_list_path)
     s3_files_df = pd.DataFrame(lines, columns=['path'])
 
     # Double check that all paths end in .tif
@@ -325,6 +1426,10 @@ def load_s3_list(s3_list_path):
 
 
 def construct_geometry(row):
+    """Construct map footprint of a single row
+
+    Use `construct_geometries` to construct footprints of a whole DataFrame.
+    """
     return box(
         row['w_long'],
         row['s_lat'],
@@ -333,6 +1438,33 @@ def construct_geometry(row):
     )
 
 
+def construct_geometries(df: pd.DataFrame) -> gpd.GeoSeries:
+    """Construct map footprints from bounds columns
+
+    Boxes have the same ring order as `shapely.geometry.box`.
+
+    Args:
+        - df: DataFrame with `w_long`, `s_lat`, `e_long` and `n_lat` columns
+
+    Returns:
+        GeoSeries of footprints with the index of df
+    """
+    minx = df['w_long'].to_numpy(dtype=float)
+    miny = df['s_lat'].to_numpy(dtype=float)
+    maxx = df['e_long'].to_numpy(dtype=float)
+    maxy = df['n_lat'].to_numpy(dtype=float)
+
+    coords = np.stack([
+        np.stack([maxx, miny], axis=-1),
+        np.stack([maxx, maxy], axis=-1),
+        np.stack([minx, maxy], axis=-1),
+        np.stack([minx, miny], axis=-1),
+        np.stack([maxx, miny], axis=-1),
+    ],
+                      axis=1)
+    return gpd.GeoSeries(polygons(coords.reshape(-1, 5, 2)), index=df.index)
+
+
 def construct_s3_tif_url(series: pd.Series) -> pd.Series:
     """Construct S3 GeoTIFF path from HTTP GeoPDF path
 
@@ -344,21 +1476,20 @@ def construct_s3_tif_url(series: pd.Series) -> pd.Series:
     Returns:
         pd.Series of S3 keys to GeoTIFFs
     """
-    parts = series.apply(unquote).str.split('/')
-
-    # Remove bucket
-    paths = parts.apply(lambda x: '/'.join(x[3:6]))
-
-    # Add GeoTIFF
-    paths += '/GeoTIFF/'
+    # Spaces are the only escapes in nearly all paths, so only the few paths
+    # with other escapes are unquoted one at a time
+    unquoted = series.astype(object).str.replace('%20', ' ', regex=False)
+    escaped = unquoted.str.contains('%', regex=False)
+    if escaped.any():
+        unquoted[escaped] = [unquote(x) for x in unquoted[escaped]]
 
-    # Add state
-    paths += parts.apply(lambda x: x[7]) + '/'
+    parts = unquoted.str.split('/', expand=True)
 
-    # Skip over scale, add filename
-    paths += parts.apply(lambda x: x[9].replace('.pdf', '.tif'))
-
-    return paths
+    # Remove bucket, add GeoTIFF and state, skip over scale, add filename
+    paths = (
+        parts[3] + '/' + parts[4] + '/' + parts[5] + '/GeoTIFF/' + parts[7] +
+        '/' + parts[9].str.replace('.pdf', '.tif', regex=False))
+    return paths.rename(series.name)
 
 
 def filter_cog_exists(df, s3_files_df):
@@ -369,13 +1500,78 @@ def filter_cog_exists(df, s3_files_df):
             'path', axis=1)
 
 
+def get_zooms(scale, dpi, minzoom=None, maxzoom=None, quadkey_zoom=None):
+    """Zoom levels of mosaic, with defaults for those not given
+
+    maxzoom defaults to the 75th percentile of the maxzoom of each map,
+    minzoom to 5 less than maxzoom and quadkey_zoom to minzoom.
+
+    Args:
+        - scale: array of scale of each map
+        - dpi: array of scanner resolution of each map
+        - minzoom, maxzoom, quadkey_zoom: zoom levels to use
+
+    Returns:
+        (minzoom, maxzoom, quadkey_zoom)
+    """
+    if not maxzoom:
+        maxzoom = pd.Series(get_maxzoom(scale, dpi))
+        # Take 75th percentile of maxzoom series
+        maxzoom = int(round(maxzoom.describe()['75%']))
+    if not minzoom:
+        minzoom = maxzoom - 5
+    quadkey_zoom = quadkey_zoom or minzoom
+    return minzoom, maxzoom, quadkey_zoom
+
+
 def get_maxzoom(scale, dpi, tilesize=512):
     """Get maxzoom for map from scale and dpi
 
     Ref: https://gis.stackexchange.com/a/85322
+
+    Args:
+        - scale: scale of the map, or array of scales
+        - dpi: scanner resolution of the map, or array of resolutions
+        - tilesize: size of output tiles in pixels
+
+    Returns:
+        maxzoom, or array of maxzooms if scale and dpi are arrays
+    """
+    m_per_pixel = 0.0254 / np.asarray(dpi, dtype=float) * scale
+    zooms = zoom_for_pixelsize(m_per_pixel, tilesize=tilesize)
+    if np.ndim(m_per_pixel) == 0:
+        return int(zooms[0])
+
+    return zooms
+
+
+def zoom_for_pixelsize(pixel_size, max_z=24, tilesize=256):
+    """Get zoom level whose resolution is finer than pixel_size
+
+    Array version of `rio_tiler.mercator.zoom_for_pixelsize`, with the same
+    result for each element.
+
+    Args:
+        - pixel_size: pixel size in meters, or array of pixel sizes
+        - max_z: number of zoom levels to consider
+        - tilesize: size of tiles in pixels
+
+    Returns:
+        array of zoom levels
     """
-    m_per_pixel = 0.0254 / dpi * scale
-    return zoom_for_pixelsize(m_per_pixel, tilesize=tilesize)
+    pixel_size = np.atleast_1d(np.asarray(pixel_size, dtype=float))
+
+    # Meters per pixel at the equator of each zoom level, in decreasing order
+    resolutions = np.array([(2 * math.pi * 6378137) / (tilesize * 2**z)
+                            for z in range(max_z)])
+
+    # First zoom whose resolution is strictly finer than pixel_size
+    z = max_z - np.searchsorted(resolutions[::-1], pixel_size, side='left')
+    zooms = np.maximum(0, z - 1)
+
+    # No zoom level is fine enough, or pixel size is NaN
+    zooms[(z == max_z) | np.isnan(pixel_size)] = max_z - 1
+    return zooms
 
 
 if __name__ == '__main__':
@@ -0,0 +1,30 @@
+import json
+
+import click
+
+from usgs_topo_tiler.scripts.mosaic_bulk import merge_mosaics
+
+
+@click.command()
+@click.argument(
+    'paths',
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False))
+def mosaic_merge(paths):
+    """Merge MosaicJSON shards created with mosaic-bulk --shard
+
+    Checks that every shard is given once and that no quadkey is in more than
+    one shard, and recomputes bounds, center, minzoom and maxzoom.
+    """
+    mosaics = []
+    for path in paths:
+        with open(path) as f:
+            mosaics.append(json.load(f))
+
+    mosaic = merge_mosaics(mosaics)
+    print(json.dumps(mosaic.dict(), separators=(',', ':')))
+
+
+if __name__ == '__main__':
+    mosaic_merge()
@@ -0,0 +1,37 @@
+"""usgs_topo_tiler.stats: Thread-safe counters for runtime statistics."""
+import threading
+from typing import Dict
+
+
+class Stats:
+    """Named counters that can be shared between threads
+
+    Args:
+        - names: counter names to initialize to zero
+    """
+    def __init__(self, *names: str):
+        self._lock = threading.Lock()
+        self._names = names
+        self._counts = dict.fromkeys(names, 0)
+
+    def incr(self, name: str, n: int = 1):
+        """Increment counter by n"""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of current counter values"""
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        """Set all counters back to zero"""
+        with self._lock:
+            self._counts = dict.fromkeys(self._names, 0)
+
+    def __getitem__(self, name: str) -> int:
+        with self._lock:
+            return self._counts.get(name, 0)
+
+    def __repr__(self):
+        return f'Stats({self.snapshot()})'
@@ -1,16 +1,42 @@
 """usgs_topo_tiler.usgs_topo: USGS Historical topo processing."""
 
 import json
-from typing import Any, List, Tuple
+from contextlib import ExitStack
+from typing import (
+    Any, Dict, Generator, Iterable, List, Optional, Sequence, Tuple, Union)
 
+import mercantile
 import numpy as np
 import rasterio
-from rasterio.crs import CRS
-from rasterio.warp import transform_bounds
-from rio_tiler import reader
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from rio_tiler import constants, reader
+from rio_tiler.errors import TileOutsideBounds
+from rio_tiler.utils import (
+    get_vrt_transform, has_alpha_band, non_alpha_indexes, tile_exists)
 
-from usgs_topo_tiler.cutline import get_cutline
-from usgs_topo_tiler.extent import estimate_extent
+from usgs_topo_tiler.cutline import get_collar_mask
+from usgs_topo_tiler.geometry import (
+    AssetGeometryCache, asset_geometry_cache, get_asset_geometry)
+from usgs_topo_tiler.header_index import HeaderIndex
+from usgs_topo_tiler.pool import DatasetPool, dataset_pool
+from usgs_topo_tiler.stats import Stats
+
+# USGS historical topo GeoTIFFs are 8-bit RGB
+DEFAULT_BAND_COUNT = 3
+DEFAULT_DTYPE = 'uint8'
+
+# Methods to remove the collar from tiles that straddle the edge of the map
+COLLAR_METHODS = ['cutline', 'mask']
+
+# Counters of how tiles were read. collar_skips: tile only covers the map
+# collar and was returned empty without reads. interior: tile is fully inside
+# the map and was read without a cutline. cutline: tile straddles the edge of
+# the map and was read with a cutline. collar_mask: tile straddles the edge of
+# the map and the collar was masked with `cutline.get_collar_mask`.
+tile_stats = Stats('collar_skips', 'interior', 'cutline', 'collar_mask')
 
 
 def tile(
@@ -21,10 +47,22 @@ def tile(
         tilesize: int = 256,
         map_bounds: List[float] = None,
         parse_asset_as_json: bool = True,
+        pool: Optional[DatasetPool] = dataset_pool,
+        geometry_cache: Optional[AssetGeometryCache] = asset_geometry_cache,
+        collar_method: str = 'cutline',
+        header_index: Optional[HeaderIndex] = None,
         **kwargs: Any,
 ) -> Tuple[np.ndarray, np.array]:
     """
     Create mercator tile from any images.
+
+    Tiles outside the image raise TileOutsideBounds, and tiles that only cover
+    the map collar return an empty mask without reading any pixels. If the
+    image and map bounds are known before opening the dataset, from the
+    geometry cache or from the header index, the dataset isn't opened for
+    either. Tiles fully inside the map are read without a cutline, since
+    there's no collar to remove.
+
     Attributes
     ----------
         address : str
@@ -43,14 +81,367 @@ def tile(
         parse_asset_as_json : bool, optional (default: True)
             Whether to attempt to parse address as a JSON object with "url" and
             "map_bounds keys"
+        pool : DatasetPool, optional
+            Pool of open dataset handles to reuse between calls. Pass None to
+            open and close the dataset on every call. Default:
+            usgs_topo_tiler.pool.dataset_pool
+        geometry_cache : AssetGeometryCache, optional
+            Cache of image bounds, map bounds and cutline per asset. Pass None
+            to recompute them on every call. Default:
+            usgs_topo_tiler.geometry.asset_geometry_cache
+        collar_method : str, optional (default: "cutline")
+            How to remove the collar from tiles on the edge of the map. One of
+            "cutline": let GDAL apply a cutline while warping, or "mask": warp
+            without a cutline and mask pixels outside the map bounds with
+            numpy. The cutline is the bounding box of the map bounds in the
+            image CRS, so it can keep a sliver of collar that "mask" removes.
+        header_index : HeaderIndex, optional
+            Index of asset headers created with `usgs-topo-tiler index`. Assets
+            in the index don't need to be opened to find their geometry, so
+            tiles outside the map are skipped without any network requests.
         kwargs: dict, optional
-            These will be passed to the 'rio_tiler.reader.tile' function.
+            These will be passed to the 'rio_tiler.reader.part' function.
     Returns
     -------
         data : np ndarray
         mask : np array
     """
-    # Custom hack that encodes url and map_bounds into address string
+    if collar_method not in COLLAR_METHODS:
+        raise ValueError(f'Invalid collar method: {collar_method}')
+
+    address, map_bounds = parse_address(
+        address, map_bounds, parse_asset_as_json)
+
+    geometry = None
+    if geometry_cache is not None:
+        geometry = geometry_cache.get(address, map_bounds)
+
+    if geometry is None and header_index is not None:
+        header = header_index.get(address)
+        if header is not None:
+            geometry = header.geometry(map_bounds)
+            if geometry_cache is not None:
+                geometry_cache.set(address, map_bounds, geometry)
+
+    # Map bounds alone aren't enough to skip the tile, since the image bounds
+    # are needed to tell tiles in the collar from tiles outside the image
+    if geometry is not None:
+        if not tile_exists(geometry.image_wgs_bounds, tile_z, tile_x, tile_y):
+            raise TileOutsideBounds(
+                f'Tile {tile_z}/{tile_x}/{tile_y} is outside image bounds')
+
+        if not tile_exists(geometry.map_bounds, tile_z, tile_x, tile_y):
+            tile_stats.incr('collar_skips')
+            return _empty_tile(tilesize, kwargs.get('indexes'))
+
+    opener = pool.open if pool is not None else rasterio.open
+    with opener(address) as src_dst:
+        if geometry is None:
+            geometry = get_asset_geometry(src_dst, address, map_bounds)
+            if geometry_cache is not None:
+                geometry_cache.set(address, map_bounds, geometry)
+
+        if not tile_exists(geometry.image_wgs_bounds, tile_z, tile_x, tile_y):
+            raise TileOutsideBounds(
+                f'Tile {tile_z}/{tile_x}/{tile_y} is outside image bounds')
+
+        if not tile_exists(geometry.map_bounds, tile_z, tile_x, tile_y):
+            tile_stats.incr('collar_skips')
+            return _empty_tile(tilesize, kwargs.get('indexes'), src_dst)
+
+        interior = tile_within(geometry.map_bounds, tile_z, tile_x, tile_y)
+        if interior:
+            tile_stats.incr('interior')
+            warp_vrt_option = {}
+        elif collar_method == 'cutline':
+            tile_stats.incr('cutline')
+            warp_vrt_option = {'cutline': geometry.cutline}
+        else:
+            tile_stats.incr('collar_mask')
+            warp_vrt_option = {}
+
+        tile_bounds = mercantile.xy_bounds(tile_x, tile_y, tile_z)
+        data, mask = reader.part(
+            src_dst,
+            tile_bounds,
+            tilesize,
+            tilesize,
+            dst_crs=constants.WEB_MERCATOR_CRS,
+            warp_vrt_option=warp_vrt_option,
+            **kwargs)
+
+    if not interior and collar_method == 'mask':
+        _apply_collar_mask(
+            data, mask, geometry.map_bounds, tile_x, tile_y, tile_z)
+
+    return data, mask
+
+
+def tile_many(
+        address: str,
+        tiles: Iterable[Union[mercantile.Tile, Tuple[int, int, int]]],
+        tilesize: int = 256,
+        map_bounds: List[float] = None,
+        parse_asset_as_json: bool = True,
+        pool: Optional[DatasetPool] = dataset_pool,
+        geometry_cache: Optional[AssetGeometryCache] = asset_geometry_cache,
+        indexes: Optional[Union[Sequence[int], int]] = None,
+        nodata: Optional[Union[float, int]] = None,
+        resampling_method: str = 'nearest',
+        collar_method: str = 'cutline',
+) -> Generator[Tuple[mercantile.Tile, np.ndarray, np.ndarray], None, None]:
+    """
+    Create many mercator tiles from one image.
+
+    The dataset is opened and its collar geometry computed once, and a single
+    WarpedVRT is shared by all requested tiles of a zoom level. Tiles are
+    yielded one at a time, so memory use doesn't grow with the number of
+    tiles. Tiles outside the image bounds are skipped, and tiles that only
+    cover the map collar are yielded with an empty mask without any reads.
+    Tiles fully inside the map share a second VRT without a cutline.
+
+    Attributes
+    ----------
+        address : str
+            file url.
+        tiles : Iterable of mercantile.Tile or (x, y, z) tuples
+            Mercator tiles to create.
+        tilesize : int, optional (default: 256)
+            Output image size.
+        map_bounds : List[float], optional (default: inferred)
+            Bounds of map excluding border in WGS84
+            Normal order: (minx, miny, maxx, maxy)
+        parse_asset_as_json : bool, optional (default: True)
+            Whether to attempt to parse address as a JSON object with "url" and
+            "map_bounds keys"
+        pool : DatasetPool, optional
+            Pool of open dataset handles. Pass None to open a new handle.
+            Default: usgs_topo_tiler.pool.dataset_pool
+        geometry_cache : AssetGeometryCache, optional
+            Cache of image bounds, map bounds and cutline per asset. Default:
+            usgs_topo_tiler.geometry.asset_geometry_cache
+        indexes : list of ints or a single int, optional
+            Band indexes.
+        nodata : int or float, optional
+            Overwrite nodata value of the image.
+        resampling_method : str, optional (default: "nearest")
+            Resampling algorithm.
+        collar_method : str, optional (default: "cutline")
+            How to remove the collar from tiles on the edge of the map. See
+            `tile`.
+    Yields
+    ------
+        tile : mercantile.Tile
+        data : np ndarray
+        mask : np array
+    """
+    if collar_method not in COLLAR_METHODS:
+        raise ValueError(f'Invalid collar method: {collar_method}')
+
+    address, map_bounds = parse_address(
+        address, map_bounds, parse_asset_as_json)
+    tiles = [mercantile.Tile(*t) for t in tiles]
+
+    geometry = None
+    if geometry_cache is not None:
+        geometry = geometry_cache.get(address, map_bounds)
+
+    opener = pool.open if pool is not None else rasterio.open
+    with opener(address) as src_dst, ExitStack() as stack:
+        if geometry is None:
+            geometry = get_asset_geometry(src_dst, address, map_bounds)
+            if geometry_cache is not None:
+                geometry_cache.set(address, map_bounds, geometry)
+
+        tiles = [
+            t for t in tiles
+            if tile_exists(geometry.image_wgs_bounds, t.z, t.x, t.y)]
+
+        if isinstance(indexes, int):
+            indexes = (indexes, )
+        if indexes is None:
+            indexes = non_alpha_indexes(src_dst)
+
+        # Whether each tile is on the edge of the map, for tiles that
+        # intersect the map
+        on_edge = {
+            t: not tile_within(geometry.map_bounds, t.z, t.x, t.y)
+            for t in tiles if tile_exists(geometry.map_bounds, t.z, t.x, t.y)}
+        use_cutline = collar_method == 'cutline'
+
+        resampling = Resampling[resampling_method]
+        vrt_params = dict(
+            add_alpha=True,
+            resampling=resampling,
+            crs=constants.WEB_MERCATOR_CRS)
+        nodata = nodata if nodata is not None else src_dst.nodata
+        if nodata is not None:
+            vrt_params.update(
+                dict(nodata=nodata, add_alpha=False, src_nodata=nodata))
+        if has_alpha_band(src_dst):
+            vrt_params.update(dict(add_alpha=False))
+
+        # One VRT per zoom level and cutline usage, aligned to the mercator
+        # grid
+        grids = {}
+        vrt_keys = {t: (t.z, e and use_cutline) for t, e in on_edge.items()}
+        for key in sorted(set(vrt_keys.values())):
+            key_tiles = [t for t, k in vrt_keys.items() if k == key]
+            grid = _zoom_grid(src_dst, key_tiles, tilesize)
+            cutline = {'cutline': geometry.cutline} if key[1] else {}
+            vrt = stack.enter_context(
+                WarpedVRT(
+                    src_dst,
+                    transform=grid['transform'],
+                    width=grid['width'],
+                    height=grid['height'],
+                    **vrt_params,
+                    **cutline))
+            grids[key] = dict(grid, vrt=vrt)
+
+        for t in tiles:
+            if t not in on_edge:
+                tile_stats.incr('collar_skips')
+                yield (t, *_empty_tile(tilesize, indexes, src_dst))
+                continue
+
+            if not on_edge[t]:
+                tile_stats.incr('interior')
+            else:
+                tile_stats.incr('cutline' if use_cutline else 'collar_mask')
+
+            grid = grids[vrt_keys[t]]
+            vrt = grid['vrt']
+            window = Window(
+                col_off=(t.x - grid['x']) * grid['tile_width'],
+                row_off=(t.y - grid['y']) * grid['tile_height'],
+                width=grid['tile_width'],
+                height=grid['tile_height'])
+
+            data = vrt.read(
+                indexes=indexes,
+                window=window,
+                out_shape=(len(indexes), tilesize, tilesize),
+                resampling=resampling)
+            if ColorInterp.alpha in vrt.colorinterp:
+                idx = vrt.colorinterp.index(ColorInterp.alpha) + 1
+                mask = vrt.read(
+                    indexes=idx,
+                    window=window,
+                    out_shape=(tilesize, tilesize),
+                    resampling=resampling,
+                    out_dtype='uint8')
+            else:
+                mask = vrt.dataset_mask(
+                    window=window,
+                    out_shape=(tilesize, tilesize),
+                    resampling=resampling)
+
+            mask = np.where(mask != 0, np.uint8(255), np.uint8(0))
+            if on_edge[t] and not use_cutline:
+                _apply_collar_mask(
+                    data, mask, geometry.map_bounds, t.x, t.y, t.z)
+
+            yield t, data, mask
+
+
+def _zoom_grid(src_dst, tiles: List[mercantile.Tile],
+               tilesize: int) -> Dict[str, Any]:
+    """Grid covering tiles of a single zoom level
+
+    Each tile spans the same number of VRT pixels as the VRT that
+    `rio_tiler.reader.part` would create for that tile by itself.
+    """
+    zoom = tiles[0].z
+    min_x = min(t.x for t in tiles)
+    min_y = min(t.y for t in tiles)
+    max_x = max(t.x for t in tiles)
+    max_y = max(t.y for t in tiles)
+
+    _, tile_width, tile_height = get_vrt_transform(
+        src_dst,
+        mercantile.xy_bounds(tiles[0]),
+        tilesize,
+        tilesize,
+        dst_crs=constants.WEB_MERCATOR_CRS)
+
+    west, _, _, north = mercantile.xy_bounds(min_x, min_y, zoom)
+    _, south, east, _ = mercantile.xy_bounds(max_x, max_y, zoom)
+    width = (max_x - min_x + 1) * tile_width
+    height = (max_y - min_y + 1) * tile_height
+    return {
+        'transform': from_bounds(west, south, east, north, width, height),
+        'width': width,
+        'height': height,
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'x': min_x,
+        'y': min_y}
+
+
+def tile_within(bounds: List[float], tile_z: int, tile_x: int,
+                tile_y: int) -> bool:
+    """Check if a mercator tile is fully inside bounds
+
+    Args:
+        - bounds: WGS84 bounds (left, bottom, right, top)
+        - tile_z: Mercator tile ZOOM level
+        - tile_x: Mercator tile X index
+        - tile_y: Mercator tile Y index
+    """
+    tile_bounds = mercantile.bounds(tile_x, tile_y, tile_z)
+    return (
+        tile_bounds[0] >= bounds[0] and tile_bounds[1] >= bounds[1]
+        and tile_bounds[2] <= bounds[2] and tile_bounds[3] <= bounds[3])
+
+
+def _apply_collar_mask(
+        data: np.ndarray, mask: np.ndarray, map_bounds: List[float],
+        tile_x: int, tile_y: int, tile_z: int):
+    """Mask pixels outside map bounds in place"""
+    collar = ~get_collar_mask(
+        map_bounds, tile_x, tile_y, tile_z, tilesize=mask.shape[-1])
+    mask[collar] = 0
+    data[:, collar] = 0
+
+
+def _empty_tile(
+        tilesize: int,
+        indexes: Optional[Union[Sequence[int], int]] = None,
+        src_dst=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Fully masked tile
+
+    Has the bands and dtype that reading the tile would return. If the dataset
+    isn't open, it's assumed to have the bands and dtype of a USGS topo.
+
+    Args:
+        - tilesize: output image size
+        - indexes: band indexes
+        - src_dst: opened rasterio dataset
+    """
+    if isinstance(indexes, int):
+        count = 1
+    elif indexes is not None:
+        count = len(indexes)
+    elif src_dst is not None:
+        count = len(non_alpha_indexes(src_dst))
+    else:
+        count = DEFAULT_BAND_COUNT
+
+    dtype = src_dst.dtypes[0] if src_dst is not None else DEFAULT_DTYPE
+    data = np.zeros((count, tilesize, tilesize), dtype=dtype)
+    mask = np.zeros((tilesize, tilesize), dtype=np.uint8)
+    return data, mask
+
+
+def parse_address(
+        address: str,
+        map_bounds: List[float] = None,
+        parse_asset_as_json: bool = True) -> Tuple[str, List[float]]:
+    """Get url and map bounds from address
+
+    Custom hack that encodes url and map_bounds into address string
+    """
     if parse_asset_as_json:
         try:
             asset_dict = json.loads(address)
@@ -59,21 +450,4 @@ def tile(
         except json.JSONDecodeError:
             pass
 
-    with rasterio.open(address) as src_dst:
-        # Convert image bounds to wgs84
-        image_wgs_bounds = transform_bounds(
-            src_dst.crs, CRS.from_epsg(4326), *src_dst.bounds)
-
-        # Get extent and cutline
-        if not map_bounds:
-            map_bounds = estimate_extent(image_wgs_bounds, address)
-        cutline = get_cutline(src_dst, map_bounds)
-
-        return reader.tile(
-            src_dst,
-            tile_x,
-            tile_y,
-            tile_z,
-            tilesize,
-            warp_vrt_option={'cutline': cutline},
-            **kwargs)
+    return address, map_bounds